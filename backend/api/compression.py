@@ -0,0 +1,108 @@
+# backend/api/compression.py
+"""
+响应压缩中间件
+
+只压缩指定路径上超过大小阈值的完整响应体（/api/chat、/api/execute-sql、/api/db-info 这类
+结果集较大的 JSON）。客户端支持 br 且安装了 brotli 时用 brotli，否则用 gzip。
+流式响应（SSE）和已经编码过的响应原样透传，避免缓冲破坏逐条推送。
+"""
+import gzip
+from typing import Iterable, Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.monitoring.metrics import HTTP_COMPRESSION_BYTES
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖
+    brotli = None
+
+# 超过该大小的响应体放到线程池里压缩，不占用事件循环
+_THREAD_THRESHOLD = 256 * 1024
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """解析 Accept-Encoding，忽略 q=0 的编码"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, *params = [p.strip() for p in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, paths: Iterable[str], minimum_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.paths = set(paths)
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, scope: Scope) -> Optional[str]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted or "*" in accepted:
+            return "gzip"
+        return None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers):
+                # 流式、过小或已编码的响应不压缩
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) > _THREAD_THRESHOLD:
+                compressed = await anyio.to_thread.run_sync(self.compress, body, encoding)
+            else:
+                compressed = self.compress(body, encoding)
+            HTTP_COMPRESSION_BYTES.inc(len(body), encoding=encoding, stage="raw")
+            HTTP_COMPRESSION_BYTES.inc(len(compressed), encoding=encoding, stage="compressed")
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
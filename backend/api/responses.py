@@ -0,0 +1,74 @@
+# backend/api/responses.py
+"""
+高性能 JSON 响应
+
+FastJSONResponse 用 orjson 直接序列化，原生支持 datetime、NumPy 数组和标量、元组，
+不需要先经过 jsonable_encoder 逐个转换。路由直接返回 FastJSONResponse(result) 即可跳过
+FastAPI 的默认编码流程。未安装 orjson 时退回标准库 json。
+
+cached_json() 用于返回带 ETag / Cache-Control 的预序列化内容，匹配 If-None-Match 时返回 304
+（按弱比较，W/"x" 和 "x" 视为同一个标签）。
+"""
+import datetime
+import json
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+def _default(value: Any):
+    """orjson / json 都不认识的类型"""
+    if hasattr(value, "tolist"):  # NumPy 数组、pandas 类型
+        return value.tolist()
+    if hasattr(value, "item"):  # NumPy 标量
+        return value.item()
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """orjson 序列化的 JSON 响应"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _opaque_tag(tag: str) -> str:
+    """去掉弱 ETag 的 W/ 前缀"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def cached_json(request: Request, body: bytes, etag: str, max_age: int = 0) -> Response:
+    """
+    返回预先序列化好的 JSON，带 ETag 和 Cache-Control
+    max_age <= 0 时为 no-store（用于实时检查）
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"max-age={max_age}" if max_age > 0 else "no-store",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if (_opaque_tag(etag) in (_opaque_tag(tag) for tag in if_none_match.split(","))
+            or if_none_match.strip() == "*"):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
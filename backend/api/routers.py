@@ -1,61 +1,141 @@
 # backend/api/routers.py
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-import datetime
+import asyncio
+import uuid
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import os,sys
-import pandas as pd
+from typing import Optional, Tuple
 
+from .responses import FastJSONResponse, cached_json, dumps
+from .stream_broker import stream_broker, StreamGone
 from .schemas import (
     ChatRequest, ClearHistoryRequest, TestAPIRequest, 
     SQLExecuteRequest, HealthResponse, SystemInfoResponse, ChatResponse
 )
-from backend.database import (
-    execute_safe_sql, get_table_info, check_db_connection
-)
+from backend.database import execute_safe_sql, first_record, schema_catalog
 
 from backend.llm import (
     clear_chat_history, get_chat_history_length, analyze_data_for_chart,
     get_nahida_response, get_chat_response, get_db_response,stream_nahida_response
 )
+from backend.llm.admission import admission, Overloaded, Ticket
+from backend.llm.resilience import breaker_snapshot
+
+from backend.config import DEEPSEEK_API_KEY, HEALTH_CACHE_MAX_AGE
+from backend.monitoring import registry as metrics_registry
+from backend.monitoring.metrics import REQUESTS_CANCELLED
+from backend.monitoring.health import health_monitor, etag_of, Snapshot
+from backend.warmup import readiness
+from backend.monitoring.tracing import span, set_attributes, current_trace_id
+from backend.utils.cancellation import Cancelled, CancelToken, cancellations, cancel_scope, raise_if_cancelled
+from backend.monitoring.log import get_logger
 
-from backend.config import DEEPSEEK_API_KEY
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+async def _load_snapshots(deep: bool) -> Tuple[Snapshot, Snapshot]:
+    """
+    deep=True 时实时检查一次，否则使用后台快照（没有快照或已过期时先刷新）
+    返回 (健康状态, 数据库信息)；刷新失败时沿用上一次的快照，一次都没有成功过时返回 503
+    """
+    try:
+        if deep:
+            await run_in_threadpool(health_monitor.refresh)
+        elif health_monitor.needs_refresh:
+            await run_in_threadpool(health_monitor.ensure_fresh)
+    except Exception:
+        logger.exception("健康检查刷新失败")
+    health, info = health_monitor.health, health_monitor.db_info
+    if health is None or info is None:
+        raise HTTPException(status_code=503, detail="健康检查快照尚未就绪", headers={"Retry-After": "1"})
+    return health, info
+
+async def _admit(mode: str) -> Ticket:
+    """获取 mode 的并发名额；繁忙时返回 429/503 并带上 Retry-After"""
+    try:
+        return await admission.acquire(mode if mode in admission.gates else "chat")
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def _watch_disconnect(request: Request, token: CancelToken):
+    """
+    等待 ASGI 的 http.disconnect 消息，收到时取消请求
+    请求体已经读完，之后只会收到这个消息；不用 request.is_disconnected() 轮询：
+    它在已取消的 CancelScope 里读取，经过 BaseHTTPMiddleware 包装后永远读不到消息
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            token.cancel("disconnect")
+            return
+
+def _cache_max_age(deep: bool) -> int:
+    return 0 if deep else HEALTH_CACHE_MAX_AGE
+
 @router.get("/health", response_model=HealthResponse)
-async def health_check():
-    """健康检查端点"""
-    return {
-        "status": "healthy",
+async def health_check(request: Request, deep: bool = False):
+    """
+    健康检查端点
+    默认返回后台健康检查的快照（带 ETag，可返回 304），deep=true 时实时检查
+    """
+    snapshot, _ = await _load_snapshots(deep)
+    history_length = get_chat_history_length()
+    body = dumps({
+        "status": "healthy" if snapshot.data["database"] == "connected" else "degraded",
         "service": "ai-student-management",
         "version": "2.0.0",
-        "timestamp": datetime.datetime.now().isoformat(),
-        "chat_history_length": get_chat_history_length(),
-        "database": "connected" if check_db_connection()[0] else "disconnected"
-    }
+        "timestamp": snapshot.checked_at,
+        "chat_history_length": history_length,
+        **snapshot.data
+    })
+    # ETag 不包含检查时间，内容没变时探活请求得到 304
+    etag = etag_of(f"{snapshot.etag}:{history_length}".encode())
+    return cached_json(request, body, etag, _cache_max_age(deep))
+
+@router.get("/ready")
+async def ready_check():
+    """就绪检查：启动预热完成前返回 503"""
+    return FastJSONResponse(readiness.to_dict(), status_code=200 if readiness.ready else 503)
 
 @router.get("/system-info", response_model=SystemInfoResponse)
-async def system_info():
+async def system_info(request: Request):
     """系统信息端点"""
-    return {
+    body = dumps({
         "deepseek_api_configured": bool(DEEPSEEK_API_KEY),
         "chat_history_messages": get_chat_history_length(),
         "environment": "development",
         "database": "sqlite3",
-        "features": ["chat", "text2sql", "charts", "crud_operations"]
-    }
+        "features": ["chat", "text2sql", "charts", "crud_operations"],
+        "admission": admission.snapshot(),
+        "circuits": breaker_snapshot()
+    })
+    return cached_json(request, body, etag_of(body), HEALTH_CACHE_MAX_AGE)
 
 @router.get("/db-info")
-async def db_info():
-    """获取数据库信息"""
-    return get_table_info()
+async def db_info(request: Request, deep: bool = False):
+    """获取数据库信息（表结构和统计来自健康检查快照，deep=true 时实时查询）"""
+    _, snapshot = await _load_snapshots(deep)
+    return cached_json(request, snapshot.body, snapshot.etag, _cache_max_age(deep))
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 指标端点"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 @router.post("/test-api")
 async def test_api_endpoint(request: TestAPIRequest):
     """测试DeepSeek API端点"""
+    ticket = await _admit("chat")
     try:
         test_message = request.test_message
-        response = get_chat_response(test_message)
+        response = await run_in_threadpool(get_chat_response, test_message)
         
         return {
             "success": True,
@@ -66,6 +146,8 @@ async def test_api_endpoint(request: TestAPIRequest):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"测试失败: {str(e)}")
+    finally:
+        ticket.release()
 
 @router.post("/execute-sql")
 async def execute_sql_endpoint(request: SQLExecuteRequest):
@@ -79,8 +161,10 @@ async def execute_sql_endpoint(request: SQLExecuteRequest):
         }
     
     try:
-        result = execute_safe_sql(sql)
-        return result
+        # 增删改要在写线程里排队等提交，放到线程池里等，不阻塞事件循环（并发的写入才能进同一批）
+        result = await run_in_threadpool(execute_safe_sql, sql, rows_format=request.rows_format)
+        _after_write(result)
+        return FastJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"执行SQL失败: {str(e)}")
 
@@ -117,24 +201,100 @@ async def chat_stream_endpoint(request: ChatRequest):
             "X-Accel-Buffering": "no" # 防止 Nginx 等代理服务器缓冲
         }
         
-        return StreamingResponse(
-            stream_nahida_response(request.message),
-            media_type="text/event-stream",
-            headers=headers 
+        ticket = await _admit("focus")
+        # 上游生成由 broker 驱动，连接断开后可以用 GET /api/chat/stream/{stream_id} 续传；生成结束时释放名额
+        stream = stream_broker.start(
+            stream_nahida_response(request.message, content_format=request.format),
+            on_finish=ticket.release
         )
+        headers["X-Stream-Id"] = stream.id
+        return StreamingResponse(stream.subscribe(), media_type="text/event-stream", headers=headers)
     else:
         return StreamingResponse(
             _simple_error_stream("当前模式不支持流式输出，请使用 /api/chat 接口"),
             media_type="text/event-stream"
         )
 
+@router.get("/chat/stream/{stream_id}")
+async def resume_stream_endpoint(stream_id: str, request: Request, last_event_id: Optional[str] = None):
+    """
+    断线重连：从 Last-Event-ID 请求头（或 last_event_id 参数）之后继续输出，不重新调用上游
+    """
+    try:
+        events = stream_broker.resume(stream_id, last_event_id or request.headers.get("last-event-id"))
+    except StreamGone as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Stream-Id": stream_id}
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
+
+@router.post("/chat/cancel/{request_id}")
+async def cancel_chat_endpoint(request_id: str):
+    """
+    取消进行中的请求：request_id 为 /api/chat 响应头 X-Request-Id（请求体中的 request_id）
+    或流式接口的 X-Stream-Id
+    """
+    token = cancellations.get(request_id)
+    if token is not None:
+        cancelled = token.cancel("explicit")
+    elif stream_broker.cancel(request_id, "explicit"):
+        cancelled = True
+    else:
+        raise HTTPException(status_code=404, detail="请求不存在或已经结束")
+    return {"success": True, "request_id": request_id, "cancelled": cancelled}
+
 async def _simple_error_stream(msg: str):
     """辅助函数"""
     import json
     yield f"data: {json.dumps({'type': 'error', 'content': msg}, ensure_ascii=False)}\n\n"
 
+def _after_write(sql_result: dict):
+    """增删改成功后让健康检查提前刷新表统计，并让模式目录检查取值字典是否需要更新"""
+    if sql_result["success"] and sql_result["sql_type"] in ("INSERT", "UPDATE", "DELETE"):
+        health_monitor.request_refresh()
+        schema_catalog.note_write(first_record(sql_result).get("affected_rows") or 0)
+
+def _negotiate(result: dict, content_format: str, rows_format: str) -> dict:
+    """按客户端请求的格式裁剪响应（省略的字段不会出现在 JSON 中）"""
+    if content_format == "raw":
+        result.pop("html", None)
+    elif content_format == "html":
+        result.pop("text", None)
+    if rows_format == "columns":
+        result.pop("data", None)
+        result.setdefault("columns", [])
+        result.setdefault("rows", [])
+    return result
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    # 直接返回 FastJSONResponse，跳过 jsonable_encoder 的逐值转换（response_model 仅用于文档）
+    # 按模式限流后放到线程池里执行，LLM 调用不再阻塞事件循环
+    ticket = await _admit(request.mode)
+    # 客户端断开或调用取消接口时，线程池里的处理在下一个检查点停下（见 backend/utils/cancellation.py）
+    request_id = request.request_id or current_trace_id() or uuid.uuid4().hex
+    headers = {"X-Request-Id": request_id}
+    token = cancellations.create(request_id)
+    watcher = asyncio.create_task(_watch_disconnect(http_request, token))
+    try:
+        with cancel_scope(token):
+            result = await run_in_threadpool(_handle_chat, request)
+    except Cancelled as e:
+        REQUESTS_CANCELLED.inc(mode=ticket.gate.mode, reason=e.reason)
+        logger.info("请求已取消", extra={"mode": request.mode, "request_id": request_id, "reason": e.reason})
+        # 499：客户端关闭了请求（客户端已经断开时这个响应不会被读到）
+        return FastJSONResponse({
+            "success": False,
+            "cancelled": True,
+            "text": "请求已取消",
+            "mode": request.mode,
+        }, status_code=499, headers=headers)
+    finally:
+        watcher.cancel()
+        cancellations.remove(token)
+        ticket.release()
+    return FastJSONResponse(_negotiate(result, request.format, request.rows_format), headers=headers)
+
+def _handle_chat(request: ChatRequest) -> dict:
     user_input = request.message.strip()
     mode = request.mode
     
@@ -163,25 +323,39 @@ async def chat_endpoint(request: ChatRequest):
         "mode": mode
     }
     
+    set_attributes(**{"chat.mode": mode, "chat.input_chars": len(user_input)})
+    
     try:
         if mode == "chat":
             # 使用DeepSeek API进行聊天
-            response = get_chat_response(user_input)
+            with span("chat.get_chat_response"):
+                response = get_chat_response(user_input)
             result["text"] = response["raw"]
             result["html"] = response["html"]
         elif mode == "focus":
             # 2. 新增的纳西妲模式 (无记忆，深度思考)
-            response = get_nahida_response(user_input)
+            with span("chat.get_nahida_response"):
+                response = get_nahida_response(user_input)
             result["text"] = response["raw"]
             result["html"] = response["html"]
             # 纳西妲模式不涉及 SQL 操作，所以不需要后续逻辑
         elif mode == "text2sql":
             # 使用AI生成SQL
-            response = get_db_response(user_input)
-            sql_query = response["raw"]
+            with span("chat.generate_sql") as stage:
+                raise_if_cancelled()
+                response = get_db_response(user_input)
+                sql_query = response["raw"]
+                stage.set_attribute("sql.chars", len(sql_query))
             
-            # 执行SQL查询获取数据
-            sql_result = execute_safe_sql(sql_query)
+            # 执行SQL查询获取数据（请求已取消时不再执行生成的语句）
+            with span("chat.execute_sql") as stage:
+                raise_if_cancelled()
+                sql_result = execute_safe_sql(sql_query, rows_format=request.rows_format)
+                stage.set_attributes(**{
+                    "sql.type": sql_result.get("sql_type", "UNKNOWN"),
+                    "sql.success": sql_result["success"],
+                    "db.rows": sql_result.get("record_count", 0)
+                })
             
             if not sql_result["success"]:
                 result["success"] = False
@@ -190,22 +364,35 @@ async def chat_endpoint(request: ChatRequest):
                 result["html"] += response["html"]  # 仍然显示生成的SQL
             else:
                 result["sql"] = sql_query
-                result["data"] = sql_result["data"]
+                if request.rows_format == "columns":
+                    result["columns"] = sql_result["columns"]
+                    result["rows"] = sql_result["rows"]
+                else:
+                    result["data"] = sql_result["data"]
                 result["html"] = response["html"]  # 显示SQL查询
                 
                 # 根据SQL类型处理
                 if sql_result["sql_type"] == "SELECT":
                     # 对于查询，进行图表分析
-                    df = pd.DataFrame(sql_result["data"]) if sql_result["data"] else pd.DataFrame()
+                    with span("chat.build_dataframe") as stage:
+                        import pandas as pd  # 延迟导入，加快启动
+                        if request.rows_format == "columns":
+                            df = pd.DataFrame(sql_result["rows"], columns=sql_result["columns"]) if sql_result["rows"] else pd.DataFrame()
+                        else:
+                            df = pd.DataFrame(sql_result["data"]) if sql_result["data"] else pd.DataFrame()
+                        stage.set_attributes(**{"df.rows": len(df), "df.columns": len(df.columns)})
                     
                     # 传递用户输入给图表分析函数
-                    chart_info = analyze_data_for_chart(df, sql_query, user_input)
+                    with span("chat.analyze_chart") as stage:
+                        raise_if_cancelled()
+                        chart_info = analyze_data_for_chart(df, sql_query, user_input)
+                        stage.set_attribute("chart.type", chart_info["chart_type"])
                     
                     result["chart_type"] = chart_info["chart_type"]
                     result["chart_config"] = chart_info["config"]
                     
                     # 生成文本总结
-                    record_count = len(sql_result["data"])
+                    record_count = sql_result["record_count"]
                     summary = f"查询成功！找到 {record_count} 条记录。"
                     
                     # 添加图表信息
@@ -229,7 +416,8 @@ async def chat_endpoint(request: ChatRequest):
                 
                 else:
                     # 对于增删改操作，显示操作结果
-                    operation_data = sql_result["data"][0] if sql_result["data"] else {}
+                    _after_write(sql_result)
+                    operation_data = first_record(sql_result)
                     result["operation_result"] = operation_data
                     
                     operation_type = sql_result["sql_type"]
@@ -255,7 +443,7 @@ async def chat_endpoint(request: ChatRequest):
                 
     except Exception as e:
         error_msg = f"处理请求时发生错误: {str(e)}"
-        print(f"API错误: {error_msg}")
+        logger.exception("处理聊天请求失败", extra={"mode": mode})
         result["success"] = False
         result["text"] = error_msg
         result["html"] = f'<div class="error"><p>{error_msg}</p></div>'
@@ -1,10 +1,20 @@
 # backend/api/schemas.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Literal, Optional
+
+# 内容协商：只返回客户端需要渲染的部分
+# format: raw=只要原始Markdown文本, html=只要渲染后的HTML, both=两者都要（默认，兼容旧客户端）
+# rows_format: records=字典列表 data（默认）, columns=列名 columns + 行数组 rows（更紧凑）
+ContentFormat = Literal["raw", "html", "both"]
+RowsFormat = Literal["records", "columns"]
 
 class ChatRequest(BaseModel):
     message: str
     mode: str  # 'chat' or 'text2sql'
+    format: ContentFormat = "both"
+    rows_format: RowsFormat = "records"
+    # 客户端生成的请求 id，用于 POST /api/chat/cancel/{request_id}；不传时使用 trace_id
+    request_id: Optional[str] = None
 
 class ClearHistoryRequest(BaseModel):
     confirm: bool = True
@@ -14,6 +24,7 @@ class TestAPIRequest(BaseModel):
 
 class SQLExecuteRequest(BaseModel):
     sql: str
+    rows_format: RowsFormat = "records"
 
 class HealthResponse(BaseModel):
     status: str
@@ -22,6 +33,8 @@ class HealthResponse(BaseModel):
     timestamp: str
     chat_history_length: int
     database: str
+    database_message: Optional[str] = None
+    llm: Optional[dict] = None  # DeepSeek 可达性：configured / reachable / status / latency_ms / error
 
 class SystemInfoResponse(BaseModel):
     deepseek_api_configured: bool
@@ -29,14 +42,20 @@ class SystemInfoResponse(BaseModel):
     environment: str
     database: str
     features: list
+    admission: Optional[Dict[str, Dict[str, int]]] = None  # 各模式的并发上限、进行中和排队数
+    circuits: Optional[Dict[str, dict]] = None  # 各模型熔断器的状态
 
 class ChatResponse(BaseModel):
+    # 按请求的 format / rows_format 省略不需要的字段
     success: bool
-    text: str
-    html: str
+    text: Optional[str] = None
+    html: Optional[str] = None
     sql: Optional[str] = None
     data: list = []
+    columns: Optional[List[str]] = None
+    rows: Optional[list] = None
     chart_config: dict = {}
     chart_type: str = "none"
     operation_result: Optional[dict] = None
-    mode: str
\ No newline at end of file
+    mode: str
+    cancelled: Optional[bool] = None
\ No newline at end of file
@@ -0,0 +1,190 @@
+# backend/api/stream_broker.py
+"""
+可恢复的 SSE 流
+
+上游生成（纳西妲的推理流）由 broker 中的后台任务驱动，和 HTTP 连接无关：
+- 每个事件编号，id 为 "<stream_id>:<序号>"，保存在有界的环形缓冲区（STREAM_BUFFER_EVENTS 条）
+- 连接断开后，客户端带上 Last-Event-ID（或 last_event_id 参数）请求
+  GET /api/chat/stream/{stream_id}，从断开处继续接收，不会重新调用上游
+- 流结束后追加 data: [DONE]，STREAM_TTL 秒后过期删除
+- 等待上游时每 STREAM_KEEPALIVE 秒发送一条注释行，及早发现断开的连接
+- 所有连接都断开且 STREAM_ORPHAN_GRACE 秒内没有重连时取消上游生成（关闭 httpx 流，不再消耗 token），
+  也可以用 POST /api/chat/cancel/{stream_id} 立即取消
+
+broker 在进程内，多进程部署时恢复请求需要回到同一个 worker（粘性会话）。
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from backend.config import STREAM_BUFFER_EVENTS, STREAM_TTL, STREAM_KEEPALIVE, STREAM_ORPHAN_GRACE
+from backend.monitoring.metrics import STREAMS_ACTIVE, STREAM_RESUMES, REQUESTS_CANCELLED
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+DONE_EVENT = "data: [DONE]\n\n"
+CANCELLED_EVENT = 'data: {"type": "error", "content": "已取消"}\n\n'
+
+class StreamGone(Exception):
+    """流不存在、已过期，或者请求的位置已经移出缓冲区"""
+
+class BufferedStream:
+    def __init__(self, stream_id: str, capacity: int):
+        self.id = stream_id
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=capacity)
+        self.last_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self.idle_since: Optional[float] = None  # 最后一个连接断开的时间，有连接时为 None
+        self.cancel_reason: Optional[str] = None
+        self.on_idle: Optional[Callable[["BufferedStream"], None]] = None
+        self._changed = asyncio.Condition()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    @property
+    def first_seq(self) -> int:
+        return self.events[0][0] if self.events else self.last_seq + 1
+
+    async def publish(self, text: str):
+        async with self._changed:
+            self.last_seq += 1
+            self.events.append((self.last_seq, text))
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def subscribe(self, after: int = 0) -> AsyncIterator[str]:
+        """从序号 after 之后开始输出 SSE 事件（带 id 行），流结束时返回"""
+        if after and after < self.first_seq - 1:
+            raise StreamGone(f"事件 {self.event_id(after)} 之后的内容已经移出缓冲区")
+        self.subscribers += 1
+        self.idle_since = None
+        try:
+            while True:
+                async with self._changed:
+                    try:
+                        await asyncio.wait_for(
+                            self._changed.wait_for(lambda: self.last_seq > after or self.done),
+                            timeout=STREAM_KEEPALIVE
+                        )
+                    except asyncio.TimeoutError:
+                        batch, done = [], False
+                    else:
+                        batch = [(seq, text) for seq, text in self.events if seq > after]
+                        done = self.done
+                if not batch and not done:
+                    yield ": keepalive\n\n"
+                    continue
+                for seq, text in batch:
+                    yield f"id: {self.event_id(seq)}\n{text}"
+                    after = seq
+                if done and after >= self.last_seq:
+                    return
+        finally:
+            # 连接断开（或正常结束）；生成还没结束时通知 broker 开始等待重连
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.idle_since = time.monotonic()
+                if self.on_idle:
+                    self.on_idle(self)
+
+class StreamBroker:
+    def __init__(self, capacity: int = STREAM_BUFFER_EVENTS, ttl: float = STREAM_TTL,
+                 orphan_grace: float = STREAM_ORPHAN_GRACE):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.orphan_grace = orphan_grace
+        self.streams: Dict[str, BufferedStream] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for stream_id, stream in list(self.streams.items()):
+            if stream.done and now - stream.finished_at > self.ttl:
+                del self.streams[stream_id]
+
+    def start(self, source: AsyncIterator[str], on_finish: Optional[Callable[[], None]] = None) -> BufferedStream:
+        """在后台任务中消费 source（产生 SSE 文本的异步生成器），返回可订阅的流"""
+        self._expire()
+        stream = BufferedStream(uuid.uuid4().hex, self.capacity)
+        stream.on_idle = self._schedule_reap
+        self.streams[stream.id] = stream
+        stream.task = asyncio.create_task(self._pump(stream, source, on_finish))
+        return stream
+
+    async def _pump(self, stream: BufferedStream, source: AsyncIterator[str],
+                    on_finish: Optional[Callable[[], None]]):
+        STREAMS_ACTIVE.inc()
+        try:
+            async for text in source:
+                await stream.publish(text)
+        except asyncio.CancelledError:
+            # 取消会传到 source 内部，关闭上游的 httpx 流
+            REQUESTS_CANCELLED.inc(mode="focus", reason=stream.cancel_reason or "shutdown")
+            logger.info("流式生成已取消", extra={"stream_id": stream.id, "reason": stream.cancel_reason})
+            await stream.publish(CANCELLED_EVENT)
+            raise
+        except Exception:
+            logger.exception("流式生成失败", extra={"stream_id": stream.id})
+        finally:
+            await stream.publish(DONE_EVENT)
+            await stream.finish()
+            STREAMS_ACTIVE.dec()
+            if on_finish:
+                on_finish()
+
+    def _schedule_reap(self, stream: BufferedStream):
+        asyncio.get_running_loop().call_later(self.orphan_grace, self._reap, stream)
+
+    def _reap(self, stream: BufferedStream):
+        """最后一个连接断开已满 orphan_grace 秒且没有重连：没人会再读这个流，取消上游生成"""
+        if stream.idle_since is None or stream.done:
+            return
+        if time.monotonic() - stream.idle_since >= self.orphan_grace - 0.01:
+            self.cancel(stream.id, "orphan")
+
+    def cancel(self, stream_id: str, reason: str = "explicit") -> bool:
+        """取消仍在生成的流；流不存在或已经结束时返回 False"""
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.done or stream.task is None or stream.task.done():
+            return False
+        stream.cancel_reason = reason
+        stream.task.cancel()
+        return True
+
+    def get(self, stream_id: str) -> BufferedStream:
+        self._expire()
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            raise StreamGone(f"流 {stream_id} 不存在或已过期")
+        return stream
+
+    def resume(self, stream_id: str, last_event_id: Optional[str]) -> AsyncIterator[str]:
+        """
+        断线重连：last_event_id 可以是完整的事件 id（"<stream_id>:<序号>"）或只有序号
+        返回从该事件之后开始的事件流
+        """
+        stream = self.get(stream_id)
+        after = 0
+        if last_event_id:
+            _, _, seq = last_event_id.rpartition(":")
+            try:
+                after = int(seq)
+            except ValueError:
+                raise StreamGone(f"无法解析的事件 id: {last_event_id}")
+        if after and after < stream.first_seq - 1:
+            raise StreamGone(f"事件 {stream.event_id(after)} 之后的内容已经移出缓冲区")
+        STREAM_RESUMES.inc()
+        return stream.subscribe(after)
+
+stream_broker = StreamBroker()
@@ -13,6 +13,97 @@ BASE_DIR = Path(__file__).parent.parent.resolve()
 DB_NAME = os.getenv("DB_NAME", "students.db")
 DB_PATH = BASE_DIR / DB_NAME
 
+# 增删改的单写者队列（见 backend/database/writer.py）
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "2"))  # 收集同一批语句的等待时间（毫秒）
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))  # 一个事务最多包含的语句数
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()  # 写连接的 PRAGMA synchronous（WAL 下 NORMAL 不会损坏数据库）
+
+# 记忆文件配置
+MEMORY_FILE_NAME = os.getenv("MEMORY_FILE", "user_memory.json")
+MEMORY_PATH = BASE_DIR / MEMORY_FILE_NAME
+
+# 会话状态存储（local=进程内存 + 记忆文件，sqlite=多进程共享的 SQLite WAL 库）
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local").lower()
+STATE_DB_PATH = BASE_DIR / os.getenv("STATE_DB", "fufu_state.db")
+
+# 链路追踪配置（none / jsonl / otlp）
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE_PATH = BASE_DIR / os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_URL = os.getenv("TRACE_OTLP_URL", "http://127.0.0.1:4318/v1/traces")
+
+# Markdown 渲染缓存配置
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+RENDER_CACHE_MAX_CHARS = int(os.getenv("RENDER_CACHE_MAX_CHARS", "20000"))
+
+# 专注模式回答缓存（见 backend/llm/answer_cache.py，默认关闭）
+FOCUS_CACHE = os.getenv("FOCUS_CACHE", "false").lower() in ("1", "true", "yes")
+FOCUS_CACHE_SIZE = int(os.getenv("FOCUS_CACHE_SIZE", "256"))  # 内存中缓存的回答数
+FOCUS_CACHE_TTL = float(os.getenv("FOCUS_CACHE_TTL", "604800"))  # 回答的有效期（秒），默认 7 天
+FOCUS_CACHE_DB = os.getenv("FOCUS_CACHE_DB", "focus_cache.db")  # 磁盘缓存文件，留空则只用内存
+FOCUS_CACHE_DB_PATH = BASE_DIR / FOCUS_CACHE_DB if FOCUS_CACHE_DB else None
+FOCUS_CACHE_DISK_MAX = int(os.getenv("FOCUS_CACHE_DISK_MAX", "5000"))
+FOCUS_REPLAY_CHUNK_CHARS = int(os.getenv("FOCUS_REPLAY_CHUNK_CHARS", "32"))  # 流式回放缓存时每个事件的字数
+
+# 流式输出时发送服务端增量渲染的 html_patch 事件
+STREAM_HTML_PATCHES = os.getenv("STREAM_HTML_PATCHES", "true").lower() in ("1", "true", "yes")
+STREAM_PATCH_INTERVAL_MS = int(os.getenv("STREAM_PATCH_INTERVAL_MS", "50"))
+# 可恢复的流式输出（见 backend/api/stream_broker.py）
+STREAM_BUFFER_EVENTS = int(os.getenv("STREAM_BUFFER_EVENTS", "10000"))  # 每个流缓存的事件数
+STREAM_TTL = float(os.getenv("STREAM_TTL", "300"))  # 流结束后保留多久（秒），期间可以断线重连
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+STREAM_ORPHAN_GRACE = float(os.getenv("STREAM_ORPHAN_GRACE", "10"))  # 所有连接断开后等待重连的秒数，超时取消上游生成
+
+# 响应压缩配置（只压缩超过阈值的响应体，单位字节）
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# 健康检查配置（后台刷新间隔和响应缓存时间，单位秒）
+HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", "15"))
+HEALTH_CACHE_MAX_AGE = int(os.getenv("HEALTH_CACHE_MAX_AGE", "5"))
+HEALTH_LLM_PROBE = os.getenv("HEALTH_LLM_PROBE", "true").lower() in ("1", "true", "yes")
+HEALTH_LLM_TIMEOUT = float(os.getenv("HEALTH_LLM_TIMEOUT", "3"))
+
+# 准入控制（每种模式的并发上限、等待队列长度和最长等待秒数，按进程计算）
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "chat=8,focus=2,text2sql=4")
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# 后台记忆提取（低优先级：并发数、最多积压任务数、有交互请求排队时最多推迟的秒数）
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "1"))
+EXTRACTION_QUEUE_SIZE = int(os.getenv("EXTRACTION_QUEUE_SIZE", "32"))
+EXTRACTION_MAX_DEFER = float(os.getenv("EXTRACTION_MAX_DEFER", "30"))
+
+# DeepSeek 调用的重试与熔断（见 backend/llm/resilience.py）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # 暂时性错误（429/5xx/连接失败）的最大重试次数
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # Retry-After 超过该值时不再重试
+LLM_SLOW_CALL_RATIO = float(os.getenv("LLM_SLOW_CALL_RATIO", "0.8"))  # 耗时超过 timeout 的该比例记为慢调用
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+CIRCUIT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+# 合并同时进行的相同请求（SQL 生成、图表配置、专注模式）
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+# 对冲请求（见 backend/llm/hedging.py）
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))  # 等待超过该分位数耗时后发出对冲请求
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # 统计耗时的最近调用次数
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", "10"))  # 对冲请求占总请求的上限（%）
+
+# 聊天历史滚动摘要（见 backend/llm/summarizer.py）
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "3000"))  # 历史估算 token 数超过该值时压缩
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "12"))  # 压缩后保留的最近原文消息数
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1500"))
+
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # 按模块设置级别，如 backend.llm.chart_analyzer=DEBUG
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json / text
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
 # API配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/chat/completions")
@@ -22,6 +113,7 @@ DEEPSEEK_REASONER_MODEL = os.getenv("DEEPSEEK_REASONER_MODEL", "deepseek-reasone
 # 服务器配置
 BACKEND_HOST = os.getenv("BACKEND_HOST", "127.0.0.1")
 BACKEND_PORT = int(os.getenv("BACKEND_PORT", "8000"))
+WORKERS = int(os.getenv("WORKERS", "1"))  # uvicorn worker 进程数，大于 1 时使用 sqlite 状态存储
 FRONTEND_HOST = os.getenv("FRONTEND_HOST", "127.0.0.1")
 FRONTEND_PORT = int(os.getenv("FRONTEND_PORT", "8080"))
 
@@ -30,7 +122,12 @@ APP_NAME = "AI学生管理系统"
 APP_VERSION = "2.0.0"
 APP_DESCRIPTION = "基于DeepSeek API的智能学生管理系统"
 
-# 数据库模式
+# 数据库模式目录（见 backend/database/catalog.py）
+CATALOG_MAX_DISTINCT = int(os.getenv("CATALOG_MAX_DISTINCT", "50"))  # 不同取值不超过该数的文本列生成取值字典（生成器有 33 个专业）
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "30"))  # 检查表结构和行数变化的最小间隔（秒）
+CATALOG_REFRESH_RATIO = float(os.getenv("CATALOG_REFRESH_RATIO", "0.05"))  # 行数变化超过该比例时重新生成
+
+# 数据库模式（列的中文说明；实际的列、类型和索引以数据库为准，见 catalog）
 DB_SCHEMA = {
     "students": {
         "columns": [
@@ -1,7 +1,11 @@
 # backend/database/__init__.py
 from .connection import get_connection, check_db_connection, close_connection
 from .models import init_db, get_table_info
-from .operations import execute_sql_query, execute_safe_sql
+from .operations import execute_sql_query, execute_sql_query_columns, execute_safe_sql, first_record, ROWS_FORMATS
+from .generator import generate_students, build_database
+from .state_store import get_state_store, StateStore, LocalStateStore, SQLiteStateStore
+from .catalog import schema_catalog, SchemaCatalog, SchemaSnapshot
+from .writer import db_writer, DatabaseWriter
 
 __all__ = [
     'get_connection',
@@ -10,5 +14,19 @@ __all__ = [
     'init_db',
     'get_table_info',
     'execute_sql_query',
-    'execute_safe_sql'
+    'execute_sql_query_columns',
+    'execute_safe_sql',
+    'first_record',
+    'ROWS_FORMATS',
+    'generate_students',
+    'build_database',
+    'get_state_store',
+    'StateStore',
+    'LocalStateStore',
+    'SQLiteStateStore',
+    'schema_catalog',
+    'SchemaCatalog',
+    'SchemaSnapshot',
+    'db_writer',
+    'DatabaseWriter'
 ]
\ No newline at end of file
@@ -0,0 +1,312 @@
+# backend/database/catalog.py
+"""
+数据库模式目录（schema catalog）
+
+从 SQLite 实际的表结构生成，不再依赖 config.DB_SCHEMA 手写的列表（后者只提供列的中文说明）：
+- 表和列：PRAGMA table_info（类型、非空、主键），索引：PRAGMA index_list / index_info
+- 取值字典：低基数的文本列（不同取值不超过 CATALOG_MAX_DISTINCT 个且不超过行数的一半，
+  如学院、专业、年级、性别）的全部取值及人数
+- 版本号：表结构 DDL + 取值字典 + 示例数据的哈希，即提示词片段依赖的全部内容；
+  各取值的人数不写进提示词，也不计入版本，普通的增删改不会改变提示词
+
+SchemaSnapshot 不可变，提示词片段在生成快照时计算一次；调用点派生的内容（如完整的系统提示）
+用 snapshot.memo() 按版本缓存，版本不变时内容不变。
+
+刷新时机：访问时最多每 CATALOG_CHECK_INTERVAL 秒检查一次 PRAGMA schema_version（DDL）和
+各表行数，表结构变化，或行数变化、本进程增删改的行数超过 CATALOG_REFRESH_RATIO 时重新生成；
+增删改之后（note_write）下一次访问立即检查。SQL 生成、规则降级和图表分析共用同一个快照。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.config import (
+    DB_SCHEMA, CATALOG_MAX_DISTINCT, CATALOG_CHECK_INTERVAL, CATALOG_REFRESH_RATIO
+)
+from backend.database.connection import get_connection
+from backend.monitoring.metrics import CATALOG_REFRESHES
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+# 按 SQLite 的类型亲和性规则判断文本列；只有文本列做取值字典（数值、时间的取值没有枚举意义）
+_TEXT_TYPES = ("CHAR", "CLOB", "TEXT")
+SAMPLE_ROWS = 2
+
+def _is_text(declared_type: str) -> bool:
+    declared_type = declared_type.upper()
+    return declared_type == "" or any(t in declared_type for t in _TEXT_TYPES)
+
+def _is_temporal(declared_type: str) -> bool:
+    declared_type = declared_type.upper()
+    return "DATE" in declared_type or "TIME" in declared_type
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class ColumnInfo:
+    __slots__ = ("name", "type", "not_null", "primary_key", "unique", "indexed", "description", "values")
+
+    def __init__(self, name: str, declared_type: str, not_null: bool, primary_key: bool, description: str = ""):
+        self.name = name
+        self.type = declared_type.upper()
+        self.not_null = not_null
+        self.primary_key = primary_key
+        self.unique = False
+        self.indexed = False
+        self.description = description
+        self.values: Optional[List[Tuple[Any, int]]] = None  # 低基数列的 (取值, 行数)，按行数降序
+
+    @property
+    def is_text(self) -> bool:
+        return _is_text(self.type)
+
+    @property
+    def is_temporal(self) -> bool:
+        return _is_temporal(self.type)
+
+    @property
+    def is_categorical(self) -> bool:
+        """文本列（含学号这类看起来像数字的编号）按分类处理，不转换为数值"""
+        return self.is_text and not self.is_temporal
+
+class TableInfo:
+    __slots__ = ("name", "columns", "indexes", "row_count", "sample_rows")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.columns: List[ColumnInfo] = []
+        self.indexes: List[Dict[str, Any]] = []  # {"name", "unique", "columns"}
+        self.row_count = 0
+        self.sample_rows: List[tuple] = []
+
+    def column(self, name: str) -> Optional[ColumnInfo]:
+        for column in self.columns:
+            if column.name == name:
+                return column
+        return None
+
+class SchemaSnapshot:
+    """某一时刻的表结构和取值字典（不可变），以及按需生成的提示词片段"""
+
+    def __init__(self, tables: Dict[str, TableInfo], schema_version: int, ddl: List[str]):
+        self.tables = tables
+        self.schema_version = schema_version
+        self.row_counts = {name: table.row_count for name, table in tables.items()}
+        self.built_at = time.monotonic()
+        self._columns: Dict[str, ColumnInfo] = {}
+        for table in tables.values():
+            for column in table.columns:
+                self._columns.setdefault(column.name, column)
+        dictionaries = {
+            f"{t.name}.{c.name}": sorted(str(v) for v, _ in c.values)
+            for t in tables.values() for c in t.columns if c.values
+        }
+        samples = {t.name: t.sample_rows for t in tables.values()}
+        raw = json.dumps([ddl, dictionaries, samples], ensure_ascii=False, sort_keys=True, default=str)
+        self.version = hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+        self._memo: Dict[str, Any] = {}
+        self._memo_lock = threading.RLock()  # 派生内容的生成函数里还会用到其他片段
+
+    def table(self, name: str) -> Optional[TableInfo]:
+        return self.tables.get(name)
+
+    def column(self, name: str) -> Optional[ColumnInfo]:
+        """按列名查找（多个表同名时取第一个），查询结果的列名可以直接用来查"""
+        return self._columns.get(name)
+
+    def values(self, column: str) -> List[str]:
+        """低基数文本列的全部取值（按行数降序）；不是低基数列时返回空列表"""
+        info = self._columns.get(column)
+        return [str(v) for v, _ in info.values] if info and info.values else []
+
+    def memo(self, name: str, builder: Callable[["SchemaSnapshot"], Any]) -> Any:
+        """同一版本只计算一次的派生内容（如完整的系统提示）"""
+        value = self._memo.get(name)
+        if value is None:
+            with self._memo_lock:
+                value = self._memo.get(name)
+                if value is None:
+                    value = self._memo[name] = builder(self)
+        return value
+
+    # ---- 提示词片段 ----
+    def schema_text(self, table: str) -> str:
+        """列清单：- 列名 (类型，约束): 说明"""
+        def build(snapshot: "SchemaSnapshot") -> str:
+            info = snapshot.tables.get(table)
+            if info is None:
+                return ""
+            descriptions = {c["name"]: c["description"] for c in DB_SCHEMA.get(table, {}).get("columns", [])}
+            lines = []
+            for column in info.columns:
+                flags = [column.type or "TEXT"]
+                if column.primary_key:
+                    flags.append("主键")
+                elif column.unique:
+                    flags.append("唯一")
+                if column.not_null and not column.primary_key:
+                    flags.append("非空")
+                if column.indexed and not column.primary_key:
+                    flags.append("有索引")
+                description = column.description or descriptions.get(column.name, "")
+                lines.append(f"- {column.name} ({', '.join(flags)})" + (f": {description}" if description else ""))
+            return "\n".join(lines) + "\n"
+        return self.memo(f"schema_text:{table}", build)
+
+    def values_text(self, table: str) -> str:
+        """取值字典：- 列名: 取值1, 取值2…（按取值排序，人数变化不影响内容）"""
+        def build(snapshot: "SchemaSnapshot") -> str:
+            info = snapshot.tables.get(table)
+            if info is None:
+                return ""
+            lines = [
+                f"- {column.name}: " + ", ".join(sorted(str(value) for value, _ in column.values))
+                for column in info.columns if column.values
+            ]
+            return "\n".join(lines) + "\n" if lines else ""
+        return self.memo(f"values_text:{table}", build)
+
+    def sample_text(self, table: str) -> str:
+        """示例数据（表中实际的前几行，表为空时用 DB_SCHEMA 中的示例）"""
+        def build(snapshot: "SchemaSnapshot") -> str:
+            info = snapshot.tables.get(table)
+            if info is not None and info.sample_rows:
+                rows = [", ".join("" if v is None else str(v) for v in row) for row in info.sample_rows]
+            else:
+                rows = DB_SCHEMA.get(table, {}).get("sample_data", [])
+            return "".join(f"- 示例{i}: {row}\n" for i, row in enumerate(rows, 1))
+        return self.memo(f"sample_text:{table}", build)
+
+def _introspect_table(cursor: sqlite3.Cursor, name: str) -> TableInfo:
+    table = TableInfo(name)
+    quoted = _quote(name)
+    for _, column_name, declared_type, not_null, _, pk in cursor.execute(f"PRAGMA table_info({quoted})").fetchall():
+        table.columns.append(ColumnInfo(column_name, declared_type or "", bool(not_null), bool(pk)))
+
+    for _, index_name, unique, *_ in cursor.execute(f"PRAGMA index_list({quoted})").fetchall():
+        columns = [row[2] for row in cursor.execute(f"PRAGMA index_info({_quote(index_name)})").fetchall()]
+        table.indexes.append({"name": index_name, "unique": bool(unique), "columns": columns})
+        for position, column_name in enumerate(columns):
+            column = table.column(column_name)
+            if column is None:
+                continue
+            if position == 0:
+                column.indexed = True
+            if unique and len(columns) == 1:
+                column.unique = True
+
+    table.row_count = cursor.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+
+    # 取值字典：DISTINCT ... LIMIT 在找到 CATALOG_MAX_DISTINCT + 1 个不同取值后就停止，高基数列（姓名、电话）很快返回
+    for column in table.columns:
+        if column.primary_key or column.unique or not column.is_categorical or table.row_count == 0:
+            continue
+        col = _quote(column.name)
+        distinct = cursor.execute(
+            f"SELECT DISTINCT {col} FROM {quoted} WHERE {col} IS NOT NULL LIMIT ?", (CATALOG_MAX_DISTINCT + 1,)
+        ).fetchall()
+        # 取值大多各不相同的列（姓名、电话）不是分类，即使表很小也不列出
+        if len(distinct) > CATALOG_MAX_DISTINCT or len(distinct) * 2 > table.row_count:
+            continue
+        column.values = [
+            tuple(row) for row in cursor.execute(
+                f"SELECT {col}, COUNT(*) AS n FROM {quoted} WHERE {col} IS NOT NULL GROUP BY {col} ORDER BY n DESC, {col}"
+            ).fetchall()
+        ]
+
+    # 示例数据不含主键和时间列（和原来手写的示例一致）
+    shown = [c.name for c in table.columns if not c.primary_key and not c.is_temporal]
+    if shown and table.row_count:
+        table.sample_rows = cursor.execute(
+            f"SELECT {', '.join(_quote(c) for c in shown)} FROM {quoted} ORDER BY rowid LIMIT ?", (SAMPLE_ROWS,)
+        ).fetchall()
+    return table
+
+def build_snapshot() -> SchemaSnapshot:
+    """读取数据库生成新的快照"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+        ddl_rows = cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%' ORDER BY type DESC, name"
+        ).fetchall()
+        tables = {
+            name: _introspect_table(cursor, name)
+            for kind, name, _ in ddl_rows if kind == "table"
+        }
+    return SchemaSnapshot(tables, schema_version, [sql or "" for _, _, sql in ddl_rows])
+
+class SchemaCatalog:
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL, refresh_ratio: float = CATALOG_REFRESH_RATIO):
+        self.check_interval = check_interval
+        self.refresh_ratio = refresh_ratio
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._checked_at = 0.0
+        self._pending_rows = 0  # 上次刷新后本进程增删改的行数
+        self._lock = threading.Lock()
+
+    def get(self) -> SchemaSnapshot:
+        """当前快照；需要时先检查并刷新（读数据库失败时继续使用旧快照）"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return snapshot
+            try:
+                reason = "initial" if snapshot is None else self._stale_reason(snapshot)
+                if reason:
+                    snapshot = self._refresh(reason)
+            except sqlite3.Error as e:
+                if snapshot is None:
+                    raise
+                logger.warning("检查数据库模式失败，继续使用旧的目录", extra={"error": str(e)})
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def _stale_reason(self, snapshot: SchemaSnapshot) -> Optional[str]:
+        """表结构变了返回 "ddl"，行数或修改的行数超过比例返回 "data"，否则 None"""
+        total = sum(snapshot.row_counts.values())
+        if self._pending_rows > max(1, total * self.refresh_ratio):
+            return "data"
+        with get_connection() as conn:
+            if conn.execute("PRAGMA schema_version").fetchone()[0] != snapshot.schema_version:
+                return "ddl"
+            for name, before in snapshot.row_counts.items():
+                now = conn.execute(f"SELECT COUNT(*) FROM {_quote(name)}").fetchone()[0]
+                if abs(now - before) > max(1, before * self.refresh_ratio):
+                    return "data"
+        return None
+
+    def _refresh(self, reason: str) -> SchemaSnapshot:
+        start = time.perf_counter()
+        snapshot = build_snapshot()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self._pending_rows = 0
+        CATALOG_REFRESHES.inc(reason=reason)
+        logger.info("数据库模式目录已更新", extra={
+            "reason": reason, "version": snapshot.version,
+            "changed": previous is None or previous.version != snapshot.version,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+        return snapshot
+
+    def note_write(self, rows: int = 0):
+        """增删改了 rows 行之后调用：下一次访问时立即检查是否需要刷新"""
+        self._pending_rows += max(0, rows)
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """丢弃当前快照，下一次访问时重新生成"""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+schema_catalog = SchemaCatalog()
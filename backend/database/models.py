@@ -2,33 +2,46 @@
 import sqlite3
 from typing import Dict, Any
 
+from backend.database.connection import get_connection
+
+# 学生表结构（init_db 和数据生成器共用）
+STUDENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        student_id TEXT UNIQUE NOT NULL,
+        class_name TEXT,
+        college TEXT,
+        major TEXT,
+        grade TEXT,
+        gender TEXT CHECK(gender IN ('男', '女')),
+        phone TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+STUDENTS_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_college ON students(college)',
+    'CREATE INDEX IF NOT EXISTS idx_major ON students(major)',
+    'CREATE INDEX IF NOT EXISTS idx_grade ON students(grade)',
+    'CREATE INDEX IF NOT EXISTS idx_gender ON students(gender)',
+]
+
+def create_schema(cursor: sqlite3.Cursor, with_indexes: bool = True):
+    """创建学生表（以及索引）"""
+    cursor.execute(STUDENTS_TABLE_SQL)
+    if with_indexes:
+        for index_sql in STUDENTS_INDEX_SQL:
+            cursor.execute(index_sql)
+
 def init_db():
     """初始化数据库，创建表并插入测试数据"""
     try:
-        with sqlite3.connect('students.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
-            # 创建学生表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS students (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    student_id TEXT UNIQUE NOT NULL,
-                    class_name TEXT,
-                    college TEXT,
-                    major TEXT,
-                    grade TEXT,
-                    gender TEXT CHECK(gender IN ('男', '女')),
-                    phone TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # 创建索引
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_college ON students(college)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_major ON students(major)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_grade ON students(grade)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_gender ON students(gender)')
+            # 创建学生表和索引
+            create_schema(cursor)
             
             # 插入一些测试数据（如果表是空的）
             cursor.execute("SELECT count(*) FROM students")
@@ -80,7 +93,7 @@ def init_db():
 def get_table_info() -> Dict[str, Any]:
     """获取表结构信息"""
     try:
-        with sqlite3.connect('students.db') as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             
             # 获取students表的结构
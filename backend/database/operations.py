@@ -1,133 +1,159 @@
 # backend/database/operations.py
 import sqlite3
-import datetime
 from typing import List, Dict, Any, Tuple
 
 from backend.database.connection import get_connection
+from backend.database.writer import db_writer
+from backend.monitoring.metrics import SQL_EXECUTE_SECONDS
+from backend.monitoring.log import get_logger
+from backend.utils.cancellation import current_token, Cancelled
+
+logger = get_logger(__name__)
+
+ROWS_FORMATS = ("records", "columns")
+WRITE_TYPES = ("INSERT", "UPDATE", "DELETE")
 
 def execute_sql_query(sql_query: str) -> Tuple[List[Dict], str]:
     """
     执行 SQL 查询并返回可序列化的数据
     支持 SELECT/INSERT/UPDATE/DELETE 操作
     """
+    columns, rows, error = execute_sql_query_columns(sql_query)
+    return _to_records(columns, rows), error
+
+def execute_sql_query_columns(sql_query: str) -> Tuple[List[str], List[list], str]:
+    """
+    执行 SQL 查询，返回列式结果 (列名, 行数组, 错误)
+    比字典列表紧凑：列名只出现一次
+    """
+    sql_type = _get_sql_type(sql_query)
+    with SQL_EXECUTE_SECONDS.time(sql_type=sql_type):
+        return _execute_sql_query(sql_query)
+
+def _to_records(columns: List[str], rows: List[list]) -> List[Dict]:
+    """列式结果转换为字典列表"""
+    return [dict(zip(columns, row)) for row in rows]
+
+def _execute_sql_query(sql_query: str) -> Tuple[List[str], List[list], str]:
+    """execute_sql_query_columns 的实际执行逻辑"""
+    token = current_token()
     try:
+        sql_type = _get_sql_type(sql_query)
+        if sql_type in WRITE_TYPES:
+            # 增删改交给单写者队列，和同时到达的写操作一起提交
+            return _write_result(sql_type, *db_writer.execute(sql_query))
         with get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 记录SQL类型
-            sql_upper = sql_query.strip().upper()
-            
-            # 执行SQL
-            cursor.execute(sql_query)
-            
-            # 根据SQL类型处理结果
-            if sql_upper.startswith("SELECT"):
-                # 获取列名
-                columns = [description[0] for description in cursor.description] if cursor.description else []
-                
-                # 获取数据
-                rows = cursor.fetchall()
-                
-                # 转换为字典列表
-                result = []
-                for row in rows:
-                    row_dict = {}
-                    for i, col in enumerate(columns):
-                        value = row[i]
-                        # 转换不可序列化的类型
-                        if isinstance(value, (datetime.date, datetime.datetime)):
-                            value = str(value)
-                        elif hasattr(value, 'item'):  # numpy类型
-                            value = value.item()
-                        row_dict[col] = value
-                    result.append(row_dict)
-                
-                conn.commit()
-                return result, None
-                
-            elif sql_upper.startswith("INSERT"):
-                # 获取插入的ID
-                last_id = cursor.lastrowid
-                conn.commit()
-                
-                # 返回插入结果信息
-                result = [{
-                    "operation": "INSERT",
-                    "affected_rows": cursor.rowcount,
-                    "last_insert_id": last_id,
-                    "message": f"成功插入 {cursor.rowcount} 条记录"
-                }]
-                return result, None
-                
-            elif sql_upper.startswith("UPDATE"):
-                affected_rows = cursor.rowcount
-                conn.commit()
-                
-                # 返回更新结果信息
-                result = [{
-                    "operation": "UPDATE",
-                    "affected_rows": affected_rows,
-                    "message": f"成功更新 {affected_rows} 条记录"
-                }]
-                return result, None
-                
-            elif sql_upper.startswith("DELETE"):
-                affected_rows = cursor.rowcount
-                conn.commit()
-                
-                # 返回删除结果信息
-                result = [{
-                    "operation": "DELETE",
-                    "affected_rows": affected_rows,
-                    "message": f"成功删除 {affected_rows} 条记录"
-                }]
-                return result, None
-                
-            else:
-                # 其他SQL操作
-                conn.commit()
-                return [], "不支持的操作类型"
+            if token is None:
+                return _run_statement(conn, sql_query)
+            # 请求被取消时中断正在执行的语句
+            token.raise_if_cancelled()
+            token.add_callback(conn.interrupt)
+            try:
+                return _run_statement(conn, sql_query)
+            finally:
+                token.remove_callback(conn.interrupt)
                 
     except sqlite3.Error as e:
+        if token is not None and token.cancelled:
+            raise Cancelled(token.reason) from e
         error_msg = f"SQL执行错误: {str(e)}"
-        print(f"SQL错误: {error_msg}")
-        return [], error_msg
+        logger.warning("SQL执行错误", extra={"error": str(e), "sql": sql_query})
+        return [], [], error_msg
     except Exception as e:
         error_msg = f"执行SQL时发生未知错误: {str(e)}"
-        print(f"未知错误: {error_msg}")
-        return [], error_msg
+        logger.exception("执行SQL时发生未知错误", extra={"sql": sql_query})
+        return [], [], error_msg
+
+def _run_statement(conn: sqlite3.Connection, sql_query: str) -> Tuple[List[str], List[list], str]:
+    """在 conn 上执行一条语句并按类型整理结果"""
+    cursor = conn.cursor()
+    
+    # 记录SQL类型
+    sql_upper = sql_query.strip().upper()
+    
+    # 执行SQL
+    cursor.execute(sql_query)
+    
+    # 根据SQL类型处理结果
+    if sql_upper.startswith("SELECT"):
+        # 获取列名
+        columns = [description[0] for description in cursor.description] if cursor.description else []
+        
+        # 获取数据（行元组直接返回，日期和 NumPy 等类型由 FastJSONResponse 序列化）
+        rows = cursor.fetchall()
+        
+        conn.commit()
+        return columns, rows, None
+        
+    else:
+        # 其他SQL操作
+        conn.commit()
+        return [], [], "不支持的操作类型"
+
+def _write_result(sql_type: str, affected_rows: int, last_id: int) -> Tuple[List[str], List[list], str]:
+    """增删改的结果信息（单写者队列返回的影响行数和最后插入的 id）"""
+    if sql_type == "INSERT":
+        # 返回插入结果信息
+        return (
+            ["operation", "affected_rows", "last_insert_id", "message"],
+            [["INSERT", affected_rows, last_id, f"成功插入 {affected_rows} 条记录"]],
+            None
+        )
+    
+    # 返回更新/删除结果信息
+    action = "更新" if sql_type == "UPDATE" else "删除"
+    return (
+        ["operation", "affected_rows", "message"],
+        [[sql_type, affected_rows, f"成功{action} {affected_rows} 条记录"]],
+        None
+    )
 
-def execute_safe_sql(sql_query: str) -> Dict[str, Any]:
+def execute_safe_sql(sql_query: str, rows_format: str = "records") -> Dict[str, Any]:
     """
     安全执行SQL查询，返回详细的执行结果
+    rows_format="records" 时结果放在 data（字典列表），
+    rows_format="columns" 时放在 columns + rows（列名 + 行数组）
     """
-    data, error = execute_sql_query(sql_query)
+    columns, rows, error = execute_sql_query_columns(sql_query)
+    if rows_format == "columns":
+        payload = {"columns": columns, "rows": rows}
+    else:
+        payload = {"data": _to_records(columns, rows)}
     
     if error:
         return {
             "success": False,
-            "data": [],
+            **payload,
             "error": error,
             "sql_type": "ERROR"
         }
     
-    # 判断SQL类型
+    return {
+        "success": True,
+        **payload,
+        "error": None,
+        "sql_type": _get_sql_type(sql_query),  # 判断SQL类型
+        "record_count": len(rows)
+    }
+
+def first_record(sql_result: Dict[str, Any]) -> Dict[str, Any]:
+    """取 execute_safe_sql 结果的第一行（字典形式），两种 rows_format 通用"""
+    if "data" in sql_result:
+        return sql_result["data"][0] if sql_result["data"] else {}
+    if sql_result.get("rows"):
+        return dict(zip(sql_result["columns"], sql_result["rows"][0]))
+    return {}
+
+def _get_sql_type(sql_query: str) -> str:
+    """判断SQL类型"""
     sql_upper = sql_query.strip().upper()
     if sql_upper.startswith("SELECT"):
-        sql_type = "SELECT"
+        return "SELECT"
     elif sql_upper.startswith("INSERT"):
-        sql_type = "INSERT"
+        return "INSERT"
     elif sql_upper.startswith("UPDATE"):
-        sql_type = "UPDATE"
+        return "UPDATE"
     elif sql_upper.startswith("DELETE"):
-        sql_type = "DELETE"
+        return "DELETE"
     else:
-        sql_type = "OTHER"
-    
-    return {
-        "success": True,
-        "data": data,
-        "error": None,
-        "sql_type": sql_type,
-        "record_count": len(data) if isinstance(data, list) else 1
-    }
\ No newline at end of file
+        return "OTHER"
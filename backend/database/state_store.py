@@ -0,0 +1,331 @@
+# backend/database/state_store.py
+"""
+会话状态存储（聊天历史 + 长期记忆）
+
+- local：单进程模式（默认）。聊天历史保存在进程内存中，记忆保存在 user_memory.json，
+  写入时加跨进程文件锁并原子替换，文件被其他进程修改后会重新读取
+- sqlite：多进程模式。历史和记忆都放在 STATE_DB（WAL 模式）中，所有 worker 共享；
+  每个进程每个线程一个连接，记忆的读-改-写用 BEGIN IMMEDIATE 串行化
+
+通过 STATE_BACKEND 选择；WORKERS > 1 时必须使用 sqlite。
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+from backend.config import STATE_BACKEND, STATE_DB_PATH, MEMORY_PATH
+from backend.monitoring.metrics import MEMORY_SAVE_SECONDS
+from backend.monitoring.log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger(__name__)
+
+Message = Dict[str, str]
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """跨进程排他锁（锁文件）"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class StateStore(ABC):
+    """状态存储接口（子类缺少任何一个方法时实例化就会报错）"""
+    name = ""
+
+    # ---- 记忆 ----
+    @abstractmethod
+    def load_memory(self) -> Dict[str, Any]:
+        """读取记忆（返回的字典不要直接修改，修改请用 edit_memory）"""
+
+    @abstractmethod
+    def edit_memory(self) -> ContextManager[Dict[str, Any]]:
+        """跨进程互斥的读-改-写，退出时内容有变化才写入（子类用 @contextmanager 实现）"""
+
+    # ---- 聊天历史 ----
+    @abstractmethod
+    def get_history(self, limit: Optional[int] = None) -> List[Message]:
+        """最近 limit 条消息（按时间顺序）"""
+
+    @abstractmethod
+    def append_history(self, messages: List[Message], keep: int, trim_to: Optional[int] = None):
+        """追加消息；超过 keep 条时裁剪到最后 trim_to 条（默认 keep）。
+        trim_to 小于 keep 时历史按块裁剪，两次裁剪之间只追加，提示词前缀保持稳定"""
+
+    @abstractmethod
+    def seed_history(self, messages: List[Message]) -> int:
+        """历史为空时写入 messages（启动时恢复上次的上下文），返回写入的条数"""
+
+    @abstractmethod
+    def drop_history_prefix(self, messages: List[Message]) -> int:
+        """删除历史开头与 messages 重合的部分（已经摘要过的消息），返回删除的条数。
+        期间历史可能被追加或从开头裁剪过，只删除仍然存在的那部分"""
+
+    @abstractmethod
+    def clear_history(self):
+        """清空聊天历史"""
+
+    @abstractmethod
+    def history_length(self) -> int:
+        """当前历史消息条数"""
+
+def _prefix_overlap(history: List[Message], messages: List[Message]) -> int:
+    """最大的 k，使 history 的前 k 条等于 messages 的后 k 条"""
+    for k in range(min(len(history), len(messages)), 0, -1):
+        if history[:k] == messages[len(messages) - k:]:
+            return k
+    return 0
+
+class LocalStateStore(StateStore):
+    name = "local"
+
+    def __init__(self, memory_path: Path = MEMORY_PATH):
+        self.memory_path = Path(memory_path)
+        self.lock_path = self.memory_path.with_name(self.memory_path.name + ".lock")
+        self._memory: Dict[str, Any] = {}
+        self._mtime: Optional[float] = None
+        self._history: List[Message] = []
+        self._lock = threading.RLock()
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return self.memory_path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            return
+        try:
+            with open(self.memory_path, "r", encoding="utf-8") as f:
+                self._memory = json.load(f)
+        except Exception as e:
+            logger.error("加载记忆文件失败", extra={"error": str(e)})
+
+    def load_memory(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_if_changed()
+            return self._memory
+
+    @contextmanager
+    def edit_memory(self) -> Iterator[Dict[str, Any]]:
+        with self._lock, _file_lock(self.lock_path):
+            self._reload_if_changed()
+            before = copy.deepcopy(self._memory)
+            yield self._memory
+            if self._memory != before:
+                self._write()
+
+    def _write(self):
+        """写临时文件后原子替换，读者不会看到写了一半的 JSON"""
+        tmp_path = self.memory_path.with_name(self.memory_path.name + ".tmp")
+        with MEMORY_SAVE_SECONDS.time():
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._memory, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.memory_path)
+                self._mtime = self._file_mtime()
+            except Exception as e:
+                logger.error("保存记忆文件失败", extra={"error": str(e)})
+
+    def get_history(self, limit: Optional[int] = None) -> List[Message]:
+        with self._lock:
+            return list(self._history[-limit:] if limit else self._history)
+
+    def append_history(self, messages: List[Message], keep: int, trim_to: Optional[int] = None):
+        with self._lock:
+            self._history.extend(messages)
+            if len(self._history) > keep:
+                self._history[:] = self._history[-(trim_to or keep):]
+
+    def seed_history(self, messages: List[Message]) -> int:
+        with self._lock:
+            if self._history or not messages:
+                return 0
+            self._history.extend(messages)
+            return len(messages)
+
+    def drop_history_prefix(self, messages: List[Message]) -> int:
+        with self._lock:
+            count = _prefix_overlap(self._history, messages)
+            del self._history[:count]
+            return count
+
+    def clear_history(self):
+        with self._lock:
+            self._history.clear()
+
+    def history_length(self) -> int:
+        return len(self._history)
+
+class SQLiteStateStore(StateStore):
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS memory (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        data TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, db_path: Path = STATE_DB_PATH, import_from: Optional[Path] = MEMORY_PATH):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._initialize(import_from)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个进程每个线程一个连接（fork 出的 worker 不复用父进程的连接）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：BEGIN IMMEDIATE 立即拿到写锁，避免读-改-写过程中被其他进程插入"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def _initialize(self, import_from: Optional[Path]):
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        # 第一次使用时导入单进程模式留下的记忆文件
+        with self._transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM memory WHERE id = 1").fetchone()
+            if exists is None and import_from is not None and Path(import_from).exists():
+                try:
+                    with open(import_from, "r", encoding="utf-8") as f:
+                        data = f.read()
+                    json.loads(data)
+                    conn.execute("INSERT INTO memory (id, data) VALUES (1, ?)", (data,))
+                    logger.info("已从记忆文件导入状态库", extra={"path": str(import_from)})
+                except Exception as e:
+                    logger.error("导入记忆文件失败", extra={"error": str(e)})
+
+    def load_memory(self) -> Dict[str, Any]:
+        row = self._connect().execute("SELECT data FROM memory WHERE id = 1").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    @contextmanager
+    def edit_memory(self) -> Iterator[Dict[str, Any]]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM memory WHERE id = 1").fetchone()
+            memory = json.loads(row[0]) if row else {}
+            before = copy.deepcopy(memory)
+            yield memory
+            if memory != before:
+                with MEMORY_SAVE_SECONDS.time():
+                    conn.execute(
+                        "INSERT INTO memory (id, data) VALUES (1, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                        (json.dumps(memory, ensure_ascii=False),)
+                    )
+
+    def get_history(self, limit: Optional[int] = None) -> List[Message]:
+        sql = "SELECT role, content FROM chat_history ORDER BY id DESC"
+        rows = self._connect().execute(sql + " LIMIT ?", (limit,)) if limit else self._connect().execute(sql)
+        return [{"role": role, "content": content} for role, content in reversed(rows.fetchall())]
+
+    def append_history(self, messages: List[Message], keep: int, trim_to: Optional[int] = None):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO chat_history (role, content) VALUES (?, ?)",
+                [(m["role"], m["content"]) for m in messages]
+            )
+            if conn.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0] > keep:
+                conn.execute(
+                    "DELETE FROM chat_history WHERE id <= (SELECT MAX(id) FROM chat_history) - ?",
+                    (trim_to or keep,)
+                )
+
+    def seed_history(self, messages: List[Message]) -> int:
+        if not messages:
+            return 0
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM chat_history LIMIT 1").fetchone():
+                return 0
+            conn.executemany(
+                "INSERT INTO chat_history (role, content) VALUES (?, ?)",
+                [(m["role"], m["content"]) for m in messages]
+            )
+            return len(messages)
+
+    def drop_history_prefix(self, messages: List[Message]) -> int:
+        if not messages:
+            return 0
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content FROM chat_history ORDER BY id LIMIT ?", (len(messages),)
+            ).fetchall()
+            count = _prefix_overlap([{"role": role, "content": content} for _, role, content in rows], messages)
+            if count:
+                conn.execute("DELETE FROM chat_history WHERE id <= ?", (rows[count - 1][0],))
+            return count
+
+    def clear_history(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chat_history")
+
+    def history_length(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+
+_store: Optional[StateStore] = None
+_store_lock = threading.Lock()
+
+def get_state_store() -> StateStore:
+    """按 STATE_BACKEND 创建全局状态存储（第一次调用时创建）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STATE_BACKEND == "sqlite":
+                    _store = SQLiteStateStore()
+                else:
+                    if STATE_BACKEND != "local":
+                        logger.warning("未知的 STATE_BACKEND，使用 local", extra={"backend": STATE_BACKEND})
+                    _store = LocalStateStore()
+    return _store
@@ -0,0 +1,193 @@
+# backend/database/writer.py
+"""
+单写者队列与组提交（group commit）
+
+SQLite 同一时间只允许一个写事务。原来每条 INSERT/UPDATE/DELETE 各开一个连接、各自提交，
+并发写入时互相争锁（database is locked），每次提交都要单独刷盘。现在所有增删改都交给
+一个专门的写线程：
+- 调用方把语句放进队列，等待自己的结果（影响行数、最后插入的 id）
+- 写线程取到第一条后再等 DB_WRITE_BATCH_WINDOW_MS 毫秒，把这段时间内到达的语句
+  （最多 DB_WRITE_BATCH_MAX 条）放进同一个事务，一次提交、一次刷盘
+- 每条语句在自己的 SAVEPOINT 里执行，某条失败只回滚这一条，错误只返回给它的调用方
+- 写连接打开 WAL 日志模式（写在数据库文件里，对所有连接生效），读查询不再被写事务阻塞
+提交成功后才返回结果；提交失败时这一批的调用方都收到同一个错误。
+请求在排队时被取消，语句被标记为放弃，写线程不会执行它；语句一旦被写线程取出，
+取消就不再生效，调用方照常等到提交结果，不会出现"返回已取消、数据却写进去了"的情况。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from backend.config import DB_PATH, DB_WRITE_BATCH_WINDOW_MS, DB_WRITE_BATCH_MAX, DB_SYNCHRONOUS
+from backend.monitoring.metrics import DB_WRITE_BATCH_SIZE, DB_WRITE_COMMIT_SECONDS
+from backend.monitoring.log import get_logger
+from backend.utils.cancellation import Cancelled, current_token
+
+logger = get_logger(__name__)
+
+WriteResult = Tuple[int, Optional[int]]  # (影响行数, 最后插入的 id)
+
+class _Write:
+    __slots__ = ("sql", "future", "state", "_lock")
+
+    QUEUED, TAKEN, ABANDONED = range(3)
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.future: Future = Future()
+        self.state = self.QUEUED
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """写线程取出语句时调用；调用方已经放弃时返回 False"""
+        with self._lock:
+            if self.state == self.ABANDONED:
+                return False
+            self.state = self.TAKEN
+            return True
+
+    def abandon(self) -> bool:
+        """调用方取消时调用；语句已经被写线程取出时返回 False"""
+        with self._lock:
+            if self.state == self.TAKEN:
+                return False
+            self.state = self.ABANDONED
+            return True
+
+class DatabaseWriter:
+    def __init__(self, db_path: Path = DB_PATH, window_ms: float = DB_WRITE_BATCH_WINDOW_MS,
+                 max_batch: int = DB_WRITE_BATCH_MAX, synchronous: str = DB_SYNCHRONOUS):
+        self.db_path = Path(db_path)
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.synchronous = synchronous
+        self._queue: "queue.Queue[Optional[_Write]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """第一次写入时启动写线程（fork 出的 worker 里重新启动）"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def execute(self, sql: str) -> WriteResult:
+        """执行一条增删改语句，提交后返回 (影响行数, 最后插入的 id)；语句出错时抛出 sqlite3.Error"""
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        self._ensure_started()
+        item = _Write(sql)
+        self._queue.put(item)
+        if token is None:
+            return item.future.result()
+
+        # 排队时可以被取消；已经被写线程取出的语句照常等待提交结果
+        wake = threading.Event()
+        item.future.add_done_callback(lambda _: wake.set())
+        token.add_callback(wake.set)
+        try:
+            wake.wait()
+        finally:
+            token.remove_callback(wake.set)
+        if not item.future.done() and item.abandon():
+            raise Cancelled(token.reason)
+        return item.future.result()
+
+    def close(self, timeout: float = 5.0):
+        """处理完已经排队的语句后停止写线程"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    # ---- 写线程 ----
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def _collect(self, first: _Write) -> Tuple[List[_Write], bool]:
+        """取出和 first 同一批的语句；返回 (这一批, 是否收到了停止信号)"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            if item.take():
+                batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn: Optional[sqlite3.Connection] = None
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            if not first.take():
+                continue
+            batch, stop = self._collect(first)
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._commit(conn, batch)
+            except Exception as e:
+                logger.warning("批量写入失败", extra={"error": str(e), "statements": len(batch)})
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                # 连接可能已经不可用，下一批重新连接
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[_Write]):
+        """在一个事务里执行这一批语句，每条语句一个保存点；提交后再把结果交给调用方"""
+        results: List[Tuple[_Write, WriteResult]] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for item in batch:
+                conn.execute("SAVEPOINT stmt")
+                try:
+                    cursor = conn.execute(item.sql)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO stmt")
+                    conn.execute("RELEASE stmt")
+                    item.future.set_exception(e)
+                    continue
+                conn.execute("RELEASE stmt")
+                results.append((item, (cursor.rowcount, cursor.lastrowid)))
+            with DB_WRITE_COMMIT_SECONDS.time():
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        DB_WRITE_BATCH_SIZE.observe(len(batch))
+        for item, result in results:
+            item.future.set_result(result)
+
+db_writer = DatabaseWriter()
@@ -1,10 +1,36 @@
 # backend/llm/__init__.py
-from .sql_generator import generate_sql_with_ai
-from .chart_analyzer import analyze_data_for_chart_with_instruction,analyze_data_for_chart
+"""
+各子模块在第一次访问对应名称时才导入（PEP 562），
+导入 backend.llm 不会连带导入 pandas、httpx 等重量级依赖
+"""
+import importlib
+
+# memory_manager 与子模块同名，必须直接导入，否则属性会被子模块本身覆盖
 from .memory_manager import memory_manager
-from .focus_mode import get_nahida_response,stream_nahida_response
-from .chat_mode import get_chat_response, get_chat_history_length, clear_chat_history
-from .db_mode import get_db_response 
+
+_LAZY_EXPORTS = {
+    'generate_sql_with_ai': 'sql_generator',
+    'analyze_data_for_chart_with_instruction': 'chart_analyzer',
+    'analyze_data_for_chart': 'chart_analyzer',
+    'get_nahida_response': 'focus_mode',
+    'stream_nahida_response': 'focus_mode',
+    'get_chat_response': 'chat_mode',
+    'get_chat_history_length': 'chat_mode',
+    'clear_chat_history': 'chat_mode',
+    'restore_saved_context': 'chat_mode',
+    'get_db_response': 'db_mode',
+}
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 __all__ = [
     'clear_chat_history',
@@ -15,7 +41,7 @@ __all__ = [
     'memory_manager',
     'get_nahida_response',
     'get_chat_response',
-    'get_chat_history_length',
     'get_db_response',
-    'stream_nahida_response'
-]
\ No newline at end of file
+    'stream_nahida_response',
+    'restore_saved_context'
+]
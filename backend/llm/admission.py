@@ -0,0 +1,237 @@
+# backend/llm/admission.py
+"""
+LLM 接口的准入控制
+
+- 每种模式（chat / focus / text2sql）一个并发上限，超出的请求进入有界等待队列
+- 队列已满立即返回 429，排队超过 ADMISSION_QUEUE_TIMEOUT 返回 503，都带 Retry-After
+- 后台记忆提取走单独的低优先级通道：并发和排队数量有限，有交互请求在排队时先让路，
+  积压过多时直接丢弃（记忆提取丢一次不影响对话）
+
+限制按进程计算，多进程部署时总并发为 WORKERS × 上限。
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from backend.config import (
+    ADMISSION_LIMITS, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT,
+    EXTRACTION_CONCURRENCY, EXTRACTION_QUEUE_SIZE, EXTRACTION_MAX_DEFER
+)
+from backend.monitoring.metrics import (
+    ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS,
+    BACKGROUND_EXTRACTION_QUEUE
+)
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_LIMITS = {"chat": 8, "focus": 2, "text2sql": 4}
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """解析 "chat=8,focus=2" 格式的并发上限"""
+    limits = dict(DEFAULT_LIMITS)
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        mode, value = item.split("=", 1)
+        try:
+            limits[mode.strip()] = int(value)
+        except ValueError:
+            logger.warning("无法解析并发上限", extra={"item": item})
+    return limits
+
+class Overloaded(Exception):
+    """请求未被接纳；reason 为 queue_full（对应 429）或 timeout（对应 503）"""
+    def __init__(self, mode: str, reason: str, retry_after: int):
+        super().__init__(f"{mode} 模式繁忙（{reason}），请 {retry_after} 秒后重试")
+        self.mode = mode
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.reason == "queue_full" else 503
+
+class Ticket:
+    """已获得的并发名额；release() 可以重复调用"""
+    __slots__ = ("gate", "start", "_released")
+
+    def __init__(self, gate: "ModeGate"):
+        self.gate = gate
+        self.start = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.gate._release(time.perf_counter() - self.start)
+
+class ModeGate:
+    """单个模式的并发上限 + 有界等待队列（在事件循环中使用）"""
+    def __init__(self, mode: str, limit: int, queue_size: int, queue_timeout: float,
+                 on_change: Optional[Callable[[], None]] = None):
+        self.mode = mode
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._avg_seconds = 1.0  # 平均处理时间（指数滑动平均），用于估算 Retry-After
+        self._on_change = on_change  # 排队数或并发数减少时调用（通知后台通道）
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 延迟创建，绑定到当前事件循环（事件循环更换且没有进行中的请求时重建）
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or (self._loop is not loop and self.in_flight == 0):
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    def retry_after(self) -> int:
+        """按排队人数和平均处理时间估算多久后再试（1~60 秒）"""
+        rounds = (self.waiting + 1) / self.limit
+        return int(min(60, max(1, math.ceil(rounds * self._avg_seconds))))
+
+    @property
+    def busy(self) -> bool:
+        return self.waiting > 0 or self.in_flight >= self.limit
+
+    async def acquire(self) -> Ticket:
+        semaphore = self._get_semaphore()
+        if self.in_flight >= self.limit and self.waiting >= self.queue_size:
+            ADMISSION_REJECTED.inc(mode=self.mode, reason="queue_full")
+            raise Overloaded(self.mode, "queue_full", self.retry_after())
+
+        start = time.perf_counter()
+        self.waiting += 1
+        ADMISSION_QUEUED.inc(mode=self.mode)
+        # 在单独的任务里等待名额：Python 3.12 之前 wait_for 超时和 acquire 完成同时发生时，
+        # 名额会被拿走却没有人归还；这里超时（或请求被取消）时检查 acquire 是否已经成功
+        acquiring = asyncio.ensure_future(semaphore.acquire())
+        try:
+            await asyncio.wait_for(asyncio.shield(acquiring), timeout=self.queue_timeout)
+        except BaseException as e:
+            if acquiring.done() and not acquiring.cancelled() and acquiring.exception() is None:
+                semaphore.release()
+            else:
+                acquiring.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_REJECTED.inc(mode=self.mode, reason="timeout")
+                raise Overloaded(self.mode, "timeout", self.retry_after()) from None
+            raise
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUED.dec(mode=self.mode)
+            self._notify()
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, mode=self.mode)
+
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.inc(mode=self.mode)
+        return Ticket(self)
+
+    def _release(self, elapsed: float):
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.dec(mode=self.mode)
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        self._semaphore.release()
+        self._notify()
+
+    def _notify(self):
+        if self._on_change is not None:
+            self._on_change()
+
+class AdmissionController:
+    def __init__(self, limits: Dict[str, int], queue_size: int, queue_timeout: float):
+        # 交互请求的排队数或并发数减少时通知等待中的后台任务（后台任务在线程池里，用线程条件变量）
+        self.changed = threading.Condition()
+        self.gates = {
+            mode: ModeGate(mode, limit, queue_size, queue_timeout, on_change=self._notify)
+            for mode, limit in limits.items()
+        }
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def gate(self, mode: str) -> ModeGate:
+        gate = self.gates.get(mode)
+        if gate is None:
+            raise KeyError(f"未配置并发上限的模式: {mode}")
+        return gate
+
+    async def acquire(self, mode: str) -> Ticket:
+        """获取名额，失败抛出 Overloaded；用完必须 release()（流式响应在生成器结束时释放）"""
+        return await self.gate(mode).acquire()
+
+    @asynccontextmanager
+    async def slot(self, mode: str):
+        ticket = await self.acquire(mode)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def interactive_busy(self) -> bool:
+        """是否有交互请求在排队或某个模式已满"""
+        return any(gate.busy for gate in self.gates.values())
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {
+            mode: {"limit": gate.limit, "in_flight": gate.in_flight, "waiting": gate.waiting}
+            for mode, gate in self.gates.items()
+        }
+
+admission = AdmissionController(parse_limits(ADMISSION_LIMITS), ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+
+class BackgroundLane:
+    """
+    低优先级后台任务通道（线程池）
+    任务开始前如果有交互请求在排队，最多推迟 max_defer 秒；积压超过 max_pending 时丢弃新任务
+    changed 在 busy() 可能变为 False 时被通知，推迟的任务不用轮询
+    """
+    def __init__(self, name: str, workers: int, max_pending: int, max_defer: float,
+                 busy: Callable[[], bool], changed: threading.Condition):
+        self.name = name
+        self.max_pending = max_pending
+        self.max_defer = max_defer
+        self.busy = busy
+        self.changed = changed
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+
+    def submit(self, func: Callable, *args) -> bool:
+        """提交任务，被丢弃时返回 False"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                ADMISSION_REJECTED.inc(mode=self.name, reason="shed")
+                logger.warning("后台任务积压，丢弃本次任务", extra={"lane": self.name, "pending": self.pending})
+                return False
+            self.pending += 1
+        BACKGROUND_EXTRACTION_QUEUE.inc()
+        self._executor.submit(self._run, func, args)
+        return True
+
+    def _run(self, func: Callable, args):
+        try:
+            with self.changed:
+                self.changed.wait_for(lambda: not self.busy(), timeout=self.max_defer)
+            func(*args)
+        except Exception:
+            logger.exception("后台任务执行失败", extra={"lane": self.name})
+        finally:
+            with self._lock:
+                self.pending -= 1
+            BACKGROUND_EXTRACTION_QUEUE.dec()
+
+extraction_lane = BackgroundLane(
+    "extraction", EXTRACTION_CONCURRENCY, EXTRACTION_QUEUE_SIZE, EXTRACTION_MAX_DEFER,
+    busy=admission.interactive_busy, changed=admission.changed
+)
@@ -0,0 +1,183 @@
+# backend/llm/answer_cache.py
+"""
+专注模式（纳西妲）的回答缓存（默认关闭，FOCUS_CACHE=true 开启）
+
+专注模式是无状态的：回答只取决于 NAHIDA_PROMPT、模型和问题本身，
+相同的问题不必每次都让推理模型重新思考几十秒。
+- 键：规范化后的问题（NFKC、小写、合并空白、去掉结尾的标点）+ 人设提示的哈希 + 模型 + CACHE_VERSION，
+  修改人设或换模型后旧缓存自然失效
+- 值：思考过程和最终回答，非流式接口和流式接口共用（流式命中时快速回放，见 focus_mode）
+- 两级：进程内 LRU（FOCUS_CACHE_SIZE 条）+ 磁盘 SQLite（FOCUS_CACHE_DB，WAL 模式，多个 worker 共享，
+  最多 FOCUS_CACHE_DISK_MAX 条，按最近访问时间淘汰）；两级都在 FOCUS_CACHE_TTL 秒后过期
+- 只缓存正常结束（流式收到 [DONE] 且 finish_reason 为 stop）且回答非空的结果
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backend.config import (
+    FOCUS_CACHE, FOCUS_CACHE_SIZE, FOCUS_CACHE_TTL, FOCUS_CACHE_DB_PATH, FOCUS_CACHE_DISK_MAX,
+    NAHIDA_PROMPT
+)
+from backend.monitoring.metrics import CACHE_REQUESTS
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+# 缓存内容的格式或回答的生成方式变化时加一，让旧缓存失效
+CACHE_VERSION = 1
+
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?!.~。、，,…～]+$")
+
+def normalize_question(text: str) -> str:
+    """问题的规范形式：'什么是云计算？' 和 ' 什么是云计算 ' 视为同一个问题"""
+    text = unicodedata.normalize("NFKC", text).strip().lower()
+    text = _SPACES.sub(" ", text)
+    return _TRAILING_PUNCT.sub("", text)
+
+def cache_key(question: str, model: str, prompt: str = NAHIDA_PROMPT) -> str:
+    prompt_hash = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).hexdigest()
+    raw = json.dumps([CACHE_VERSION, model, prompt_hash, normalize_question(question)], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+Entry = Dict[str, str]  # {"reasoning": ..., "answer": ...}
+
+class AnswerCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS focus_answers (
+        key TEXT PRIMARY KEY,
+        reasoning TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_focus_answers_accessed ON focus_answers (accessed_at);
+    """
+
+    def __init__(self, capacity: int = FOCUS_CACHE_SIZE, ttl: float = FOCUS_CACHE_TTL,
+                 db_path: Optional[Path] = FOCUS_CACHE_DB_PATH, disk_max: int = FOCUS_CACHE_DISK_MAX):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.db_path = Path(db_path) if db_path else None
+        self.disk_max = disk_max
+        self._memory: "OrderedDict[str, Tuple[float, Entry]]" = OrderedDict()  # key -> (过期时间, 内容)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+
+    # ---- 磁盘 ----
+    def _connect(self) -> sqlite3.Connection:
+        """每个进程每个线程一个连接（同 SQLiteStateStore）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.executescript(self.SCHEMA)
+            self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key: str) -> Tuple[Optional[Entry], float]:
+        """返回 (内容, 剩余寿命秒数)"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT reasoning, answer, created_at FROM focus_answers WHERE key = ? AND created_at > ?",
+            (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None, 0.0
+        conn.execute("UPDATE focus_answers SET accessed_at = ? WHERE key = ?", (now, key))
+        return {"reasoning": row[0], "answer": row[1]}, row[2] + self.ttl - now
+
+    def _disk_put(self, key: str, entry: Entry):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO focus_answers (key, reasoning, answer, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, entry["reasoning"], entry["answer"], now, now)
+            )
+            # 淘汰过期的和超出上限的最久未访问条目
+            conn.execute("DELETE FROM focus_answers WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM focus_answers WHERE key IN "
+                "(SELECT key FROM focus_answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max,)
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    # ---- 内存 ----
+    def _memory_put(self, key: str, entry: Entry, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, entry)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Entry]:
+        """先查内存再查磁盘，磁盘命中时放回内存；返回的字典不要修改"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._memory.move_to_end(key)
+                    CACHE_REQUESTS.inc(cache="focus_answer", result="hit")
+                    return item[1]
+                del self._memory[key]
+
+        entry, remaining = None, 0.0
+        if self.db_path is not None:
+            try:
+                entry, remaining = self._disk_get(key)
+            except sqlite3.Error as e:
+                logger.warning("读取回答缓存失败", extra={"error": str(e)})
+        if entry is None:
+            CACHE_REQUESTS.inc(cache="focus_answer", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="focus_answer", result="disk_hit")
+        self._memory_put(key, entry, now + remaining)
+        return entry
+
+    def put(self, key: str, reasoning: str, answer: str):
+        if not answer.strip():
+            return
+        entry = {"reasoning": reasoning, "answer": answer}
+        self._memory_put(key, entry, time.monotonic() + self.ttl)
+        if self.db_path is not None:
+            try:
+                self._disk_put(key, entry)
+            except sqlite3.Error as e:
+                logger.warning("写入回答缓存失败", extra={"error": str(e)})
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.db_path is not None and self.db_path.exists():
+            self._connect().execute("DELETE FROM focus_answers")
+
+    def __len__(self):
+        return len(self._memory)
+
+# FOCUS_CACHE 关闭时为 None
+answer_cache: Optional[AnswerCache] = AnswerCache() if FOCUS_CACHE and FOCUS_CACHE_SIZE > 0 else None
@@ -1,22 +1,31 @@
 # backend/llm/chart_analyzer.py
 import re
-import pandas as pd
-import requests
 import json
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any
+import logging
 import warnings
-from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, DEEPSEEK_MODEL
+from .client import chat_completion, LLMError, CircuitOpenError
+from backend.config import DEEPSEEK_MODEL
+from backend.database.catalog import schema_catalog
+from backend.monitoring.metrics import CHART_ANALYSIS_SECONDS, FALLBACKS
+from backend.monitoring.tracing import span
+from backend.monitoring.log import get_logger
+
+if TYPE_CHECKING:
+    import pandas as pd  # 运行时在用到时才导入（pandas 导入约 0.4 秒）
+
+logger = get_logger(__name__)
 
 warnings.filterwarnings('ignore', category=UserWarning, module='pandas')
 
-def analyze_data_for_chart(df: pd.DataFrame, sql: str = "", user_input: str = "") -> Dict[str, Any]:
+def analyze_data_for_chart(df: "pd.DataFrame", sql: str = "", user_input: str = "") -> Dict[str, Any]:
     """
     智能分析数据，返回图表类型和建议配置
     增强版：支持用户指令和智能推荐
     """
     return analyze_data_for_chart_with_instruction(df, sql, user_input)
 
-def analyze_data_for_chart_with_instruction(df: pd.DataFrame, sql: str, user_input: str = "") -> Dict[str, Any]:
+def analyze_data_for_chart_with_instruction(df: "pd.DataFrame", sql: str, user_input: str = "") -> Dict[str, Any]:
     """
     智能分析数据，返回图表类型和配置
     1. 如果用户明确指定图表类型/要求，优先遵循
@@ -25,15 +34,61 @@ def analyze_data_for_chart_with_instruction(df: pd.DataFrame, sql: str, user_inp
     if df is None or df.empty:
         return {"chart_type": "none", "config": {}}
     
+    with CHART_ANALYSIS_SECONDS.time():
+        return _analyze(df, sql, user_input)
+
+def _analyze(df: "pd.DataFrame", sql: str, user_input: str) -> Dict[str, Any]:
+    """图表分析主流程（指令提取 -> 类型推断 -> LLM 推荐）"""
     # 分析用户指令
     instruction = _extract_chart_instruction(user_input)
     
     # 数据特征分析
+    with span("chart.infer_column_types", **{"df.rows": len(df), "df.columns": len(df.columns)}):
+        numeric_cols, categorical_cols, datetime_cols = _infer_column_types(df)
+    
+    # 构建默认配置
+    default_config = {
+        "title": "数据可视化",
+        "show_title": True,
+        "show_legend": len(numeric_cols) > 1 or len(categorical_cols) > 1,
+        "animation": True
+    }
+    
+    # 直接智能推荐
+    config = _call_deepseek_for_chart(user_input, df, sql, numeric_cols, categorical_cols, datetime_cols)
+    config.update(default_config)
+    
+    return {
+        "chart_type": config["chart_type"],
+        "config": config,
+        "instruction_followed": False,
+        "explicit_instruction": instruction
+    }
+        
+
+def _infer_column_types(df: "pd.DataFrame"):
+    """
+    推断每一列的数据类型，返回 (数值列, 分类列, 日期时间列)
+    注意：能转换成数值/日期的文本列会被原地转换；
+    模式目录中声明为文本的列（如学号、年级）保持分类，不按内容转换成数值
+    """
+    import pandas as pd
+    
     numeric_cols = []
     categorical_cols = []
     datetime_cols = []
+    try:
+        snapshot = schema_catalog.get()
+    except Exception:
+        snapshot = None
     
     for col in df.columns:
+        # 0. 数据库中声明为文本的列直接作为分类数据
+        info = snapshot.column(col) if snapshot is not None else None
+        if info is not None and info.is_categorical and not pd.api.types.is_numeric_dtype(df[col]):
+            categorical_cols.append(col)
+            continue
+        
         # 1. 先检查是否已经是数值类型
         if pd.api.types.is_numeric_dtype(df[col]):
             numeric_cols.append(col)
@@ -67,25 +122,7 @@ def analyze_data_for_chart_with_instruction(df: pd.DataFrame, sql: str, user_inp
         # 5. 否则作为分类数据
         categorical_cols.append(col)
     
-    # 构建默认配置
-    default_config = {
-        "title": "数据可视化",
-        "show_title": True,
-        "show_legend": len(numeric_cols) > 1 or len(categorical_cols) > 1,
-        "animation": True
-    }
-    
-    # 直接智能推荐
-    config = _call_deepseek_for_chart(user_input, df, sql, numeric_cols, categorical_cols, datetime_cols)
-    config.update(default_config)
-    
-    return {
-        "chart_type": config["chart_type"],
-        "config": config,
-        "instruction_followed": False,
-        "explicit_instruction": instruction
-    }
-        
+    return numeric_cols, categorical_cols, datetime_cols
 
 def _extract_chart_instruction(user_input: str) -> Dict[str, Any]:
     """
@@ -180,79 +217,56 @@ def _extract_chart_instruction(user_input: str) -> Dict[str, Any]:
         "has_chart_instruction": explicit_chart_type is not None or len(requirements) > 0
     }
 
-def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical_cols, datetime_cols) -> dict:
-    """
-    调用DeepSeek API智能选择图表类型和配置
-    """
-    # 准备数据信息
-    data_info = {
-        "columns": df.columns.tolist(),
-        "shape": df.shape,
-        "numeric_cols": numeric_cols,
-        "categorical_cols": categorical_cols,
-        "datetime_cols": datetime_cols
-    }
-
-    # 构建系统提示 - 优化版本
-    system_prompt = f"""你是一个专业而且智能的数据可视化助手。根据用户的输入、sql语句和数据特征，智能选择最适合的图表类型并返回对应的配置参数。
-
-数据信息：
-- 数据列: {data_info["columns"]}
-- 数据形状: {data_info["shape"]}
-- 数值列: {data_info["numeric_cols"]}
-- 分类列: {data_info["categorical_cols"]}
-- 日期时间列: {data_info["datetime_cols"]}
-
-用户输入: {user_input}
-使用的sql语句：{sql}
+# 图表分析的系统提示：只包含固定的图表目录和选择规则，所有请求字节相同
+CHART_SYSTEM_PROMPT = """你是一个专业而且智能的数据可视化助手。根据用户的输入、sql语句和数据特征，智能选择最适合的图表类型并返回对应的配置参数。
 
 根据不同的图表类型，请返回对应的JSON配置：
 
 1. 柱状图 (bar_chart):
-{{
+{
     "chart_type": "bar_chart",
     "x_axis": "X轴数据列名",
     "y_axis": "Y轴数据列名",
     "title": "图表标题",
     "orientation": "vertical"  # 可选: vertical或horizontal
-}}
+}
 
 2. 折线图 (line_chart):
-{{
+{
     "chart_type": "line_chart",
     "x_axis": "X轴数据列名",
     "y_axis": "Y轴数据列名",
     "title": "图表标题",
     "smooth": true  # 可选: true或false，是否平滑曲线
-}}
+}
 
 3. 饼图 (pie_chart):
-{{
+{
     "chart_type": "pie_chart",
     "x_axis": "对应的柱状图的X数据列名",
     "y_axis": "对应的柱状图的Y轴数据列名",
     "name_col": "分类列名（显示在饼图上的名称）",
     "value_col": "数值列名（决定扇形大小的数值）",
     "title": "图表标题"
-}}
+}
 
 4. 散点图 (scatter_chart):
-{{
+{
     "chart_type": "scatter_chart",
     "x_axis": "X轴数据列名",
     "y_axis": "Y轴数据列名",
     "title": "图表标题",
     "size_col": "可选，决定点大小的列名",
     "color_col": "可选，决定点颜色的列名"
-}}
+}
 
 5. 多系列柱状图 (multi_bar_chart):
-{{
+{
     "chart_type": "multi_bar_chart",
     "x_axis": "X轴数据列名",
     "y_axes": ["数值列1", "数值列2", ...],
     "title": "图表标题"
-}}
+}
 
 图表选择规则：
 1. 比较分类数据 -> 柱状图
@@ -271,16 +285,39 @@ def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical
 请根据数据分析结果返回JSON格式的图表配置，只返回JSON，不要其他任何内容！
 """
 
+def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical_cols, datetime_cols) -> dict:
+    """
+    调用DeepSeek API智能选择图表类型和配置
+    """
+    # 准备数据信息
+    data_info = {
+        "columns": df.columns.tolist(),
+        "shape": df.shape,
+        "numeric_cols": numeric_cols,
+        "categorical_cols": categorical_cols,
+        "datetime_cols": datetime_cols
+    }
+
+    # 每次查询不同的数据信息放在用户消息里，系统提示（图表目录和规则）固定
+    user_prompt = f"""数据信息：
+- 数据列: {data_info["columns"]}
+- 数据形状: {data_info["shape"]}
+- 数值列: {data_info["numeric_cols"]}
+- 分类列: {data_info["categorical_cols"]}
+- 日期时间列: {data_info["datetime_cols"]}
+
+用户输入: {user_input}
+使用的sql语句：{sql}
+
+请基于以上数据和查询，智能推荐最适合的图表配置。
+
+请只返回JSON配置:"""
+
     messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"请基于以上数据和查询，智能推荐最适合的图表配置。\n用户输入: {user_input}\n\n请只返回JSON配置:"}
+        {"role": "system", "content": CHART_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
     ]
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-
     payload = {
         "model": DEEPSEEK_MODEL,
         "messages": messages,
@@ -291,20 +328,11 @@ def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical
     }
 
     try:
-        response = requests.post(
-            DEEPSEEK_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
+        data = chat_completion("chart", payload, timeout=30, coalesce=True, hedge=True)
 
-        print("请求成功，内容为" + response.text)
-
-        data = response.json()
-
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise ValueError("API响应格式错误")
+        # 完整响应体只在开启 DEBUG 时输出（LOG_LEVELS=backend.llm.chart_analyzer=DEBUG）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("图表分析原始响应", extra={"body": data})
 
         config_str = data["choices"][0]["message"]["content"].strip()
 
@@ -319,7 +347,7 @@ def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical
                 config_str = config_str[:-3]
             config_str = config_str.strip()
 
-            print(f"清理后的JSON字符串: {config_str}")
+            logger.debug("清理后的图表配置JSON", extra={"config": config_str})
             config = json.loads(config_str)
             
             # 验证配置的完整性
@@ -327,14 +355,20 @@ def _call_deepseek_for_chart(user_input: str, df, sql, numeric_cols, categorical
             return config
             
         except json.JSONDecodeError as e:
-            print(f"JSON解析失败: {str(e)}, 使用默认智能推荐配置")
+            logger.warning("图表配置JSON解析失败，使用默认智能推荐配置", extra={"error": str(e)})
+            FALLBACKS.inc(kind="chart_smart", reason="json_error")
             return _get_smart_chart_config(df, sql, numeric_cols, categorical_cols, datetime_cols)
 
-    except requests.exceptions.RequestException as e:
-        print(f"API请求失败: {str(e)}, 使用默认智能推荐配置")
+    except CircuitOpenError:
+        FALLBACKS.inc(kind="chart_smart", reason="circuit_open")
+        return _get_smart_chart_config(df, sql, numeric_cols, categorical_cols, datetime_cols)
+    except LLMError as e:
+        logger.warning("图表分析API请求失败，使用默认智能推荐配置", extra={"error": str(e)})
+        FALLBACKS.inc(kind="chart_smart", reason="llm_error")
         return _get_smart_chart_config(df, sql, numeric_cols, categorical_cols, datetime_cols)
     except (KeyError, IndexError, ValueError) as e:
-        print(f"配置处理失败: {str(e)}, 使用默认智能推荐配置")
+        logger.warning("图表配置处理失败，使用默认智能推荐配置", extra={"error": str(e)})
+        FALLBACKS.inc(kind="chart_smart", reason="bad_response")
         return _get_smart_chart_config(df, sql, numeric_cols, categorical_cols, datetime_cols)
 
 def _validate_chart_config(config, df, numeric_cols, categorical_cols, datetime_cols):
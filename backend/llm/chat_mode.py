@@ -1,26 +1,48 @@
 # backend/llm/chat_mode.py
-import threading
+import contextvars
 from typing import Dict, Any, List
-import requests
 import json
 from .memory_manager import memory_manager
+from backend.database.state_store import get_state_store
+from .client import chat_completion, LLMAuthError, LLMTimeoutError, CircuitOpenError
 from backend.utils import markdown_to_html, create_error_html
-from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, DEEPSEEK_MODEL, FUFU_PROMPT
+from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_MODEL, FUFU_PROMPT
+from .admission import extraction_lane
+from .summarizer import history_compactor
+from backend.monitoring.log import get_logger
 
-# 全局变量用于存储聊天历史
-_chat_history = []
+logger = get_logger(__name__)
+
+# 聊天历史保存在状态存储中（单进程为进程内存，多进程为共享 SQLite），见 get_state_store()
 # 聊天历史最大消息数
 Tough_Memory = 80
+# 历史超过上限时一次裁掉的消息数：历史在两次裁剪之间只追加，前缀保持不变
+HISTORY_TRIM_STEP = 20
+
+# 上次保存的对话上下文是否已经恢复
+_context_restored = False
 
-# 在启动时加载保存的对话上下文结尾，为了使其不忘记最近的话。
-saved_context = memory_manager.get_saved_context()
-if saved_context:
-    _chat_history.extend(saved_context)
-    print(f"🔄 [系统] 已恢复上次最后的 {len(saved_context)} 条对话记录")
+def restore_saved_context() -> int:
+    """
+    恢复上次保存的对话上下文结尾，为了使其不忘记最近的话。
+    在应用启动（lifespan 预热）时调用，只执行一次，返回恢复的消息数
+    """
+    global _context_restored
+    if _context_restored:
+        return 0
+    _context_restored = True
+    # 历史不为空时（多进程模式下其他 worker 已恢复，或共享库中已有历史）不重复写入
+    restored = get_state_store().seed_history(memory_manager.get_saved_context())
+    if restored:
+        logger.info("已恢复上次最后的对话记录", extra={"messages": restored})
+    return restored
 
-def _call_deepseek_api(prompt: str, history: List[Dict[str, str]] = None, system_prompt: str = None) -> Dict[str, str]:
+def _call_deepseek_api(prompt: str, history: List[Dict[str, str]] = None, system_prompt: str = None,
+                       memory_context: str = None, summary: str = None) -> Dict[str, str]:
     """
     调用 DeepSeek API，返回原始Markdown和转换后的HTML
+    消息顺序：固定的人设在最前面，然后是较早对话的摘要（只在压缩时变化）和只会追加的聊天历史，
+    经常变化的记忆放在最后（当前用户消息之前）
     """
     if not DEEPSEEK_API_KEY:
         raise ValueError("未设置 DEEPSEEK_API_KEY 环境变量")
@@ -32,19 +54,22 @@ def _call_deepseek_api(prompt: str, history: List[Dict[str, str]] = None, system
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     
+    # 已经压缩掉的较早对话
+    if summary:
+        messages.append({"role": "system", "content": f"【之前对话的摘要】{summary}"})
+    
     # 如果有历史记录，添加到消息中
     if history:
         for msg in history:
             messages.append(msg)
     
+    # 长期记忆
+    if memory_context and memory_context.strip():
+        messages.append({"role": "system", "content": memory_context.strip()})
+    
     # 添加当前用户消息
     messages.append({"role": "user", "content": prompt})
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-    
     payload = {
         "model": DEEPSEEK_MODEL,
         "messages": messages,
@@ -54,22 +79,17 @@ def _call_deepseek_api(prompt: str, history: List[Dict[str, str]] = None, system
     }
     
     try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
+        data = chat_completion("chat", payload, timeout=30)
         
         # 提取 AI 回复
         if "choices" in data and len(data["choices"]) > 0:
             ai_reply = data["choices"][0]["message"]["content"]
             
-            # 更新聊天历史
-            _chat_history.append({"role": "user", "content": prompt})
-            _chat_history.append({"role": "assistant", "content": ai_reply})
-                
-            # 限制单次的硬历史长度在40条以内
-            if len(_chat_history) > Tough_Memory:
-                _chat_history[:] = _chat_history[(0-Tough_Memory):]
+            # 更新聊天历史（限制单次的硬历史长度在 Tough_Memory 条以内）
+            get_state_store().append_history(
+                [{"role": "user", "content": prompt}, {"role": "assistant", "content": ai_reply}],
+                keep=Tough_Memory, trim_to=Tough_Memory - HISTORY_TRIM_STEP
+            )
             
             # 将Markdown转换为HTML
             html_content = markdown_to_html(ai_reply)
@@ -81,8 +101,6 @@ def _call_deepseek_api(prompt: str, history: List[Dict[str, str]] = None, system
         else:
             raise ValueError("API响应格式错误")
             
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"API调用失败: {str(e)}")
     except (KeyError, IndexError) as e:
         raise Exception(f"解析API响应失败: {str(e)}")
 
@@ -90,6 +108,9 @@ def get_chat_response(user_input: str) -> Dict[str, str]:
     """
     获取AI聊天响应，返回包含raw和html格式的字典
     """
+    # 没有经过应用启动流程（脚本直接调用）时在这里恢复
+    restore_saved_context()
+    
     # 如果没有设置 API 密钥，使用模拟模式
     if not DEEPSEEK_API_KEY:
         raw_response = f"【模拟AI】收到消息：'{user_input}'。要使用真实的DeepSeek API，请在.env文件中设置DEEPSEEK_API_KEY。"
@@ -105,44 +126,52 @@ def get_chat_response(user_input: str) -> Dict[str, str]:
     
     try:
         
-        # 1. 准备 System Prompt (人设 + 长期的记忆点)
+        # 1. 准备 System Prompt (固定的人设) 和长期的记忆点（放在历史之后，见 _call_deepseek_api）
         memory_context = memory_manager.get_memory_context()
-        full_system_prompt = FUFU_PROMPT + memory_context
         
         # 使用最近的聊天历史（最多最近的40轮对话）
-        recent_history = _chat_history[(0-Tough_Memory):] 
+        recent_history = get_state_store().get_history(Tough_Memory)
         
         # 调用 DeepSeek API
         response = _call_deepseek_api(
             prompt=user_input, 
             history=recent_history, 
-            system_prompt=full_system_prompt
+            system_prompt=FUFU_PROMPT,
+            memory_context=memory_context,
+            summary=memory_manager.get_summary()
         )
         
         # 这样无论何时关闭程序，最后10轮对话都会被记住，用于承接下次对话
-        memory_manager.save_chat_context(_chat_history)
+        current_history = recent_history + [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": response["raw"]}
+        ]
+        memory_manager.save_chat_context(current_history)
         
-        # 启动后台线程进行长期记忆信息提取和存储
+        # 历史太长时在后台把较早的对话折叠进摘要
+        history_compactor.maybe_compact(current_history)
+        
+        # 提交到低优先级后台通道进行长期记忆信息提取和存储（有交互请求排队时让路，积压过多时丢弃）
         if len(user_input) > 2: # 记忆太短的话不做存储和分析了
-            thread = threading.Thread(
-            target=_extract_info_background, 
-            args=(user_input, response["raw"])
-            )
-            thread.daemon = True # 设置为守护线程
-            thread.start()
+            # 复制当前上下文，后台提取的 span 会挂在本次请求的 trace 下
+            context = contextvars.copy_context()
+            extraction_lane.submit(context.run, _extract_info_background, user_input, response["raw"])
         return response
         
     except Exception as e:
         error_msg = str(e)
-        print(f"DeepSeek API调用失败: {error_msg}")
+        logger.error("DeepSeek API调用失败", extra={"error": error_msg})
         
-        # 如果错误是因为API密钥无效，给出提示
-        if "401" in error_msg or "unauthorized" in error_msg.lower():
+        # 按异常类型给出提示（client 抛出的都是 LLMError 的子类）
+        if isinstance(e, LLMAuthError):
             error_raw = "【API密钥错误】请检查.env文件中的DEEPSEEK_API_KEY是否正确。"
             error_html = create_error_html("【API密钥错误】请检查.env文件中的DEEPSEEK_API_KEY是否正确。")
-        elif "timeout" in error_msg.lower():
+        elif isinstance(e, LLMTimeoutError):
             error_raw = "【网络超时】API调用超时，请检查网络连接后重试。"
             error_html = create_error_html("【网络超时】API调用超时，请检查网络连接后重试。")
+        elif isinstance(e, CircuitOpenError):
+            error_raw = f"【服务暂不可用】DeepSeek 最近连续出错，已暂停调用，请 {e.retry_after:.0f} 秒后重试。"
+            error_html = create_error_html(error_raw)
         else:
             error_raw = f"【API调用失败】{error_msg}。请稍后重试。"
             error_html = create_error_html(f"【API调用失败】{error_msg}。请稍后重试。")
@@ -264,13 +293,9 @@ def _extract_info_background(user_input: str, ai_reply: str):
         """
 
         # 构造 prompt
-        prompt = f"用户说：'{user_input}'\n(上下文参考 - AI回复：'{ai_reply}')"
+        # 会变化的内容（已知用户名、本轮对话）都放在用户消息里，系统提示固定
+        prompt = f"用户说：'{user_input}'\n(上下文参考 - AI回复：'{ai_reply}')\n(已知用户名：{current_name})"
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-        }
-        
         payload = {
             "model": DEEPSEEK_MODEL,
             "messages": [
@@ -282,9 +307,8 @@ def _extract_info_background(user_input: str, ai_reply: str):
             "response_format": {"type": "json_object"}
         }
         
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=20)
-        if response.status_code == 200:
-            result = response.json()
+        result = chat_completion("extraction", payload, timeout=20)
+        if result:
             content = result["choices"][0]["message"]["content"]
             
             # 清理 Markdown
@@ -321,17 +345,20 @@ def _extract_info_background(user_input: str, ai_reply: str):
                             memory_manager.add_ai_state(str(state))
                         
             except json.JSONDecodeError:
-                print(f"⚠️ 记忆提取失败: JSON解析错误 - {content}")
+                logger.warning("记忆提取失败: JSON解析错误", extra={"content": content})
                 
     except Exception as e:
-        print(f"⚠️ 后台记忆提取出错: {e}")
+        logger.warning("后台记忆提取出错", extra={"error": str(e)})
 
 def clear_chat_history() -> bool:
     """清除聊天历史"""
-    global _chat_history
-    _chat_history.clear()
+    global _context_restored
+    with history_compactor.clearing():
+        get_state_store().clear_history()
+        memory_manager.set_summary("")
+    _context_restored = True
     return True
 
 def get_chat_history_length() -> int:
     """获取聊天历史长度"""
-    return len(_chat_history)
\ No newline at end of file
+    return get_state_store().history_length()
\ No newline at end of file
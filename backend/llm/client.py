@@ -0,0 +1,231 @@
+# backend/llm/client.py
+"""
+DeepSeek 调用的统一入口
+
+所有非流式调用都经过 chat_completion()，在这里统一记录耗时、token 用量和追踪 span，
+并按 resilience 模块的策略重试和熔断，各调用点只需要关心提示词、结果解析和降级。
+失败时抛出 LLMError 的子类，调用点按类型区分（不要匹配异常文本）。
+当前请求被取消（见 backend/utils/cancellation.py）时抛出 Cancelled：不再发出新的请求或重试，
+等待中的调用立即返回（requests 无法中断正在读取的连接，已发出的请求在后台线程里结束）。
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, LLM_SLOW_CALL_RATIO, LLM_COALESCE, LLM_HEDGE
+from backend.monitoring.metrics import (
+    LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_PROMPT_CACHE_TOKENS, LLM_RETRIES, LLM_COALESCED
+)
+from backend.monitoring.tracing import span, set_attributes
+from backend.monitoring.log import get_logger
+from backend.utils.cancellation import current_token, cancel_scope, is_cancelled, raise_if_cancelled, sleep
+from .resilience import get_breaker, backoff_delay, should_retry, parse_retry_after
+from .singleflight import SingleFlight, request_key
+from .hedging import hedged_call
+
+logger = get_logger(__name__)
+
+class LLMError(Exception):
+    """DeepSeek 调用失败（网络错误、HTTP 错误或响应格式错误）"""
+    retryable = False  # 是否为可以重试的暂时性错误
+
+    def __init__(self, message: str, status: Optional[int] = None, body: str = "",
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def breaker_failure(self) -> bool:
+        """是否计入熔断器的失败（请求本身有问题的 4xx 不算服务故障）"""
+        return not (self.status is not None and 400 <= self.status < 500 and self.status != 429)
+
+class LLMAuthError(LLMError):
+    """API 密钥无效或没有权限（401/403）"""
+
+class LLMRateLimitError(LLMError):
+    """被限流（429）"""
+    retryable = True
+
+class LLMServerError(LLMError):
+    """服务端错误（5xx）"""
+    retryable = True
+
+class LLMConnectionError(LLMError):
+    """连接失败"""
+    retryable = True
+
+class LLMTimeoutError(LLMError):
+    """超时（超时预算已经用完，不再重试）"""
+
+class CircuitOpenError(LLMError):
+    """熔断器断开，请求没有发出"""
+
+def error_for_status(status: int, message: str, body: str = "", retry_after: Optional[float] = None) -> LLMError:
+    """按 HTTP 状态码构造对应的异常类型"""
+    if status in (401, 403):
+        cls = LLMAuthError
+    elif status == 429:
+        cls = LLMRateLimitError
+    elif status >= 500:
+        cls = LLMServerError
+    else:
+        cls = LLMError
+    return cls(message, status=status, body=body, retry_after=retry_after)
+
+def build_headers() -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+    }
+
+def record_usage(call_site: str, model: str, usage: Optional[Dict[str, Any]]):
+    """记录 token 用量"""
+    if not usage:
+        return
+    LLM_TOKENS.inc(usage.get("prompt_tokens", 0), call_site=call_site, model=model, direction="in")
+    LLM_TOKENS.inc(usage.get("completion_tokens", 0), call_site=call_site, model=model, direction="out")
+    # DeepSeek 的前缀缓存：请求开头与近期请求字节相同的部分（以 64 token 为单位）直接复用，
+    # 命中的 token 更快也更便宜。所以各调用点把固定内容放在最前面并保持字节不变，
+    # 经常变化的内容放在后面（通常是最后一条用户消息）。命中情况按调用点记录在这里
+    if "prompt_cache_hit_tokens" in usage:
+        LLM_PROMPT_CACHE_TOKENS.inc(usage["prompt_cache_hit_tokens"], call_site=call_site, model=model, result="hit")
+        LLM_PROMPT_CACHE_TOKENS.inc(usage.get("prompt_cache_miss_tokens", 0), call_site=call_site, model=model, result="miss")
+
+def prompt_chars(messages) -> int:
+    """提示词总字符数（用于追踪属性）"""
+    return sum(len(m.get("content") or "") for m in messages or [])
+
+def usage_attributes(usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """token 用量转换为 span 属性"""
+    if not usage:
+        return {}
+    attributes = {
+        "llm.tokens_in": usage.get("prompt_tokens", 0),
+        "llm.tokens_out": usage.get("completion_tokens", 0),
+    }
+    if "prompt_cache_hit_tokens" in usage:
+        attributes["llm.cache_hit_tokens"] = usage["prompt_cache_hit_tokens"]
+        attributes["llm.cache_miss_tokens"] = usage.get("prompt_cache_miss_tokens", 0)
+    return attributes
+
+# 进行中的可合并请求
+_inflight = SingleFlight()
+
+def chat_completion(call_site: str, payload: Dict[str, Any], timeout: float = 30,
+                    coalesce: bool = False, hedge: bool = False) -> Dict[str, Any]:
+    """
+    发送一次 /chat/completions 请求，返回解析后的 JSON
+    失败时抛出 LLMError
+    coalesce=True 时，与正在进行的相同请求（请求体完全一致）共享一次上游调用，
+    只用于结果不依赖调用方状态的确定性调用点
+    hedge=True 时，响应慢于该调用点的 p90 耗时就再发一个相同的请求，用先返回的结果（见 hedging），
+    只用于幂等的调用点
+    """
+    model = payload.get("model", "")
+    attributes = {
+        "llm.call_site": call_site,
+        "llm.model": model,
+        "llm.messages": len(payload.get("messages", [])),
+        "llm.prompt_chars": prompt_chars(payload.get("messages")),
+    }
+    with span(f"llm.{call_site}", **attributes) as current:
+        token = current_token()
+        call = _hedged_completion if hedge and LLM_HEDGE else _chat_completion
+        if coalesce and LLM_COALESCE:
+            data, shared = _wait(token, _inflight.do, request_key(payload), _detached,
+                                 call, call_site, model, payload, timeout)
+            if shared:
+                LLM_COALESCED.inc(call_site=call_site, model=model)
+                current.set_attribute("llm.coalesced", True)
+        else:
+            data = _wait(token, call, call_site, model, payload, timeout)
+        current.set_attributes(**usage_attributes(data.get("usage")))
+        current.set_attribute("llm.completion_chars", len(data["choices"][0].get("message", {}).get("content") or ""))
+        return data
+
+def _wait(token, func, *args):
+    """有取消令牌时在后台线程中执行，取消后不再等待"""
+    return func(*args) if token is None else token.run(func, *args)
+
+def _detached(call, *args):
+    """合并的上游调用可能还有其他等待者，不受发起请求的客户端取消的影响"""
+    with cancel_scope(None):
+        return call(*args)
+
+def _hedged_completion(call_site: str, model: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    return hedged_call(
+        call_site, timeout, lambda cancelled: _chat_completion(call_site, model, payload, timeout, cancelled)
+    )
+
+def _chat_completion(call_site: str, model: str, payload: Dict[str, Any], timeout: float,
+                     cancelled: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    带重试和熔断的调用；所有尝试共享 timeout 预算
+    cancelled 被设置（对冲请求已有结果）或当前请求被取消后不再重试
+    """
+    breaker = get_breaker(model)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        raise_if_cancelled()
+        if not breaker.allow():
+            LLM_REQUEST_SECONDS.observe(0, call_site=call_site, model=model, outcome="circuit_open")
+            retry_in = max(1.0, breaker.retry_in())
+            raise CircuitOpenError(f"{model} 熔断中，{retry_in:.0f} 秒后再试", retry_after=retry_in)
+
+        start = time.perf_counter()
+        try:
+            data = _send_once(call_site, model, payload, max(0.1, deadline - time.monotonic()))
+        except LLMError as e:
+            breaker.record(failed=e.breaker_failure)
+            delay = backoff_delay(attempt, e.retry_after)
+            if (not e.retryable or not should_retry(attempt, delay, deadline)
+                    or (cancelled and cancelled.is_set()) or is_cancelled()):
+                raise
+            attempt += 1
+            LLM_RETRIES.inc(call_site=call_site, model=model, reason=str(e.status or "connection"))
+            logger.warning("DeepSeek 调用失败，稍后重试", extra={
+                "call_site": call_site, "attempt": attempt, "status": e.status, "delay": round(delay, 2)
+            })
+            sleep(delay)
+            continue
+
+        breaker.record(failed=time.perf_counter() - start >= timeout * LLM_SLOW_CALL_RATIO)
+        if attempt:
+            set_attributes(**{"llm.retries": attempt})
+        return data
+
+def _send_once(call_site: str, model: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    import requests  # 延迟导入，加快启动
+    
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        try:
+            response = requests.post(DEEPSEEK_API_URL, headers=build_headers(), json=payload, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise error_for_status(
+                e.response.status_code, str(e), e.response.text,
+                parse_retry_after(e.response.headers.get("Retry-After"))
+            ) from e
+        except requests.exceptions.Timeout as e:
+            raise LLMTimeoutError(str(e)) from e
+        except requests.exceptions.RequestException as e:
+            raise LLMConnectionError(str(e)) from e
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise LLMError(f"响应不是合法的JSON: {e}", status=response.status_code, body=response.text) from e
+
+        if "choices" not in data or len(data["choices"]) == 0:
+            raise LLMError("API响应格式错误", status=response.status_code, body=response.text)
+
+        outcome = "ok"
+        record_usage(call_site, model, data.get("usage"))
+        return data
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, call_site=call_site, model=model, outcome=outcome)
@@ -1,33 +1,46 @@
 # backend/llm/focus_mode.py
-import httpx 
-import requests
-import markdown
+import asyncio
 import json
+import time
+from .client import (
+    chat_completion, build_headers, record_usage, usage_attributes, prompt_chars, error_for_status, LLMError
+)
+from .resilience import get_breaker
+from .answer_cache import answer_cache, cache_key
 from backend.config import (
-    DEEPSEEK_API_KEY, 
     DEEPSEEK_API_URL, 
     DEEPSEEK_REASONER_MODEL,
-    NAHIDA_PROMPT
+    NAHIDA_PROMPT,
+    STREAM_HTML_PATCHES,
+    STREAM_PATCH_INTERVAL_MS,
+    FOCUS_REPLAY_CHUNK_CHARS
 )
+from backend.monitoring.metrics import LLM_REQUEST_SECONDS, LLM_FIRST_TOKEN_SECONDS
+from backend.monitoring.tracing import start_span
+from backend.monitoring.log import get_logger
+from backend.utils.markdown_renderer import render_markdown, IncrementalRenderer
+
+logger = get_logger(__name__)
 
 def get_nahida_response(user_input: str) -> dict:
     """
     纳西妲专属处理函数 (无状态 + 深度思考)
     """
-    # 1. 构造请求头
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
+    # 0. 无状态，开启回答缓存时相同的问题直接返回上次的回答
+    key = cache_key(user_input, DEEPSEEK_REASONER_MODEL) if answer_cache is not None else None
+    if key:
+        cached = answer_cache.get(key)
+        if cached is not None:
+            return _nahida_result(cached["reasoning"], cached["answer"])
     
-    # 2. 构造消息
+    # 1. 构造消息
     # 注意：这里不传入 _chat_history，纳西妲每次都基于全新的视角思考
     messages = [
         {"role": "system", "content": NAHIDA_PROMPT},
         {"role": "user", "content": user_input}
     ]
     
-    # 3. 构造 Payload，切换到推理模型
+    # 2. 构造 Payload，切换到推理模型
     payload = {
         "model": DEEPSEEK_REASONER_MODEL,
         "messages": messages,
@@ -37,36 +50,26 @@ def get_nahida_response(user_input: str) -> dict:
     }
     
     try:
-        print(f"🌱 [纳西妲] 正在链接虚空终端进行思考... (Model: {DEEPSEEK_REASONER_MODEL})")
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=90) # 推理模型较慢，超时设长点
-        
-        # 调试：打印一下看看是否出错
-        if response.status_code != 200:
-            print(f"API Error: {response.text}")
-            
-        response.raise_for_status()
-        data = response.json()
+        logger.debug("纳西妲正在链接虚空终端进行思考", extra={"model": DEEPSEEK_REASONER_MODEL})
+        try:
+            data = chat_completion("focus", payload, timeout=90, coalesce=True, hedge=True) # 推理模型较慢，超时设长点
+        except LLMError as e:
+            logger.warning("纳西妲模式API调用失败", extra={"status": e.status, "body": e.body[:500]})
+            raise
         
         if "choices" in data and len(data["choices"]) > 0:
             message_obj = data["choices"][0]["message"]
+            finish_reason = data["choices"][0].get("finish_reason")
             
-            # 4. 关键点：提取思维链 (Reasoning Content)
+            # 3. 关键点：提取思维链 (Reasoning Content)
             # DeepSeek R1 会把思考过程放在 reasoning_content 字段，把结果放在 content 字段
-            reasoning_text = message_obj.get("reasoning_content", "")
-            final_content = message_obj.get("content", "")
-            
-            # 如果用的是普通模型兼容，reasoning_text 可能为空，我们做个处理
-            if not reasoning_text:
-                reasoning_text = "（纳西妲正在整理虚空中的知识...）"
+            reasoning_text = message_obj.get("reasoning_content") or ""
+            final_content = message_obj.get("content") or ""
+            # 只缓存正常结束的回答（finish_reason 为 length 时回答被截断）
+            if key and finish_reason == "stop":
+                answer_cache.put(key, reasoning_text, final_content)
             
-            # 5. 格式化为前端可展示的 HTML
-            html_output = _format_nahida_html(reasoning_text, final_content)
-            
-            return {
-                "raw": final_content,
-                "html": html_output,
-                "mode": "focus"
-            }
+            return _nahida_result(reasoning_text, final_content)
         else:
             raise ValueError("API响应格式异常")
 
@@ -78,14 +81,54 @@ def get_nahida_response(user_input: str) -> dict:
             "mode": "focus"
         }
 
-async def stream_nahida_response(user_input: str):
+def _nahida_result(reasoning_text: str, final_content: str) -> dict:
+    # 如果用的是普通模型兼容，reasoning_text 可能为空，我们做个处理
+    if not reasoning_text:
+        reasoning_text = "（纳西妲正在整理虚空中的知识...）"
+    
+    # 4. 格式化为前端可展示的 HTML
+    html_output = _format_nahida_html(reasoning_text, final_content)
+    
+    return {
+        "raw": final_content,
+        "html": html_output,
+        "mode": "focus"
+    }
+
+def _sse(packet: dict) -> str:
+    return f"data: {json.dumps(packet, ensure_ascii=False)}\n\n"
+
+def _html_patch(target: str, patch) -> str:
+    """
+    html_patch 事件：commit 为新完成块的HTML（客户端追加保存），tail 为未完成尾部的HTML（客户端整体替换）
+    target 为 thinking 或 answer
+    """
+    return _sse({"type": "html_patch", "target": target, "commit": patch["commit"], "tail": patch["tail"]})
+
+def _replay(entry: dict, emit_raw: bool, emit_html: bool):
+    """把缓存的回答按实时流的事件格式一次性回放（原文分块发送，HTML 整块提交）"""
+    step = max(1, FOCUS_REPLAY_CHUNK_CHARS)
+    for target, text, profile in (("thinking", entry["reasoning"], "nahida_reasoning"),
+                                  ("answer", entry["answer"], "nahida_answer")):
+        if not text:
+            continue
+        if emit_raw:
+            for i in range(0, len(text), step):
+                yield _sse({"type": target, "content": text[i:i + step]})
+        if emit_html:
+            yield _html_patch(target, {"commit": render_markdown(text, profile), "tail": ""})
+
+async def stream_nahida_response(user_input: str, content_format: str = "both"):
     """
     纳西妲深度思考模式的流式生成器
+    content_format:
+    - raw  只发送原始文本增量（thinking / answer）
+    - html 只发送服务端增量渲染的 html_patch 事件
+    - both 两者都发送（html_patch 受 STREAM_HTML_PATCHES 控制）
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
+    import httpx  # 延迟导入，加快启动
+    
+    headers = build_headers()
     
     messages = [
         {"role": "system", "content": NAHIDA_PROMPT},
@@ -96,10 +139,51 @@ async def stream_nahida_response(user_input: str):
         "model": DEEPSEEK_REASONER_MODEL,
         "messages": messages,
         "stream": True,  # 必须开启流式
+        "stream_options": {"include_usage": True},  # 最后一个数据块带上 token 用量
         "max_tokens": 4096,
         "temperature": 0.6
     }
     
+    start = time.perf_counter()
+    first_token = True
+    outcome = "error"
+    chunks = 0
+    interval = STREAM_PATCH_INTERVAL_MS / 1000
+    emit_raw = content_format != "html"
+    emit_html = content_format == "html" or (content_format == "both" and STREAM_HTML_PATCHES)
+    renderers = {
+        "thinking": IncrementalRenderer("nahida_reasoning", interval),
+        "answer": IncrementalRenderer("nahida_answer", interval),
+    } if emit_html else {}
+    # 生成器会跨 yield 执行，这里手动结束 span，不切换当前上下文
+    stream_span = start_span(
+        "llm.focus_stream",
+        **{"llm.call_site": "focus_stream", "llm.model": DEEPSEEK_REASONER_MODEL,
+           "llm.prompt_chars": prompt_chars(messages)}
+    )
+    # 回答缓存命中时不调用模型，直接回放（磁盘缓存在线程里读，不阻塞事件循环）
+    key = cache_key(user_input, DEEPSEEK_REASONER_MODEL) if answer_cache is not None else None
+    cached = await asyncio.to_thread(answer_cache.get, key) if key else None
+    if cached is not None:
+        stream_span.set_attribute("llm.cache_hit", True)
+        stream_span.end()
+        for event in _replay(cached, emit_raw, emit_html):
+            yield event
+        return
+    reasoning_parts, answer_parts = [], []
+    done_seen = False
+    finish_reason = None
+    # 流式调用不重试（可能已经输出了一部分），但和非流式调用共用熔断器
+    breaker = get_breaker(DEEPSEEK_REASONER_MODEL)
+    if not breaker.allow():
+        outcome = "circuit_open"
+        stream_span.status = "error"
+        stream_span.error = outcome
+        LLM_REQUEST_SECONDS.observe(0, call_site="focus_stream", model=DEEPSEEK_REASONER_MODEL, outcome=outcome)
+        stream_span.end()
+        yield _sse({'type': 'error', 'content': f"虚空终端暂时无法连接，请 {max(1.0, breaker.retry_in()):.0f} 秒后再试"})
+        return
+    failed = None  # 客户端断开时保持 None，不计入熔断统计
     try:
         # 增加超时时间，DeepSeek R1 思考时间可能较长
         timeout = httpx.Timeout(connect=10.0, read=120.0, write=10.0, pool=10.0)
@@ -107,10 +191,14 @@ async def stream_nahida_response(user_input: str):
         async with httpx.AsyncClient(timeout=timeout) as client:
             async with client.stream("POST", DEEPSEEK_API_URL, headers=headers, json=payload) as response:
                 
+                stream_span.set_attribute("http.status", response.status_code)
                 if response.status_code != 200:
                     error_msg = f"API Error: {response.status_code} - {response.reason_phrase}"
+                    failed = error_for_status(response.status_code, error_msg).breaker_failure
+                    stream_span.status = "error"
+                    stream_span.error = error_msg
                     # 发送错误事件给前端
-                    yield f"data: {json.dumps({'type': 'error', 'content': error_msg}, ensure_ascii=False)}\n\n"
+                    yield _sse({'type': 'error', 'content': error_msg})
                     return
 
                 # 使用 aiter_lines() 逐行读取，并处理可能的空行
@@ -125,47 +213,118 @@ async def stream_nahida_response(user_input: str):
                         
                         # 检查结束标记
                         if json_str.strip() == "[DONE]":
+                            done_seen = True
                             break
                         
                         try:
                             chunk = json.loads(json_str)
+                            if chunk.get("usage"):
+                                record_usage("focus_stream", DEEPSEEK_REASONER_MODEL, chunk["usage"])
+                                stream_span.set_attributes(**usage_attributes(chunk["usage"]))
                             if "choices" not in chunk or len(chunk["choices"]) == 0:
                                 continue
+                            finish_reason = chunk["choices"][0].get("finish_reason") or finish_reason
                                 
                             delta = chunk["choices"][0]["delta"]
+                            if first_token and (delta.get("reasoning_content") or delta.get("content")):
+                                first_token = False
+                                ttft = time.perf_counter() - start
+                                LLM_FIRST_TOKEN_SECONDS.observe(
+                                    ttft, call_site="focus_stream", model=DEEPSEEK_REASONER_MODEL
+                                )
+                                stream_span.set_attribute("llm.first_token_ms", round(ttft * 1000, 1))
+                            chunks += 1
                             
                             # A. 捕捉思考过程 (Reasoning Content)
                             if "reasoning_content" in delta and delta["reasoning_content"]:
+                                if key:
+                                    reasoning_parts.append(delta["reasoning_content"])
                                 packet = {
                                     "type": "thinking", 
                                     "content": delta["reasoning_content"]
                                 }
-                                yield f"data: {json.dumps(packet, ensure_ascii=False)}\n\n"
+                                if emit_raw:
+                                    yield _sse(packet)
+                                if renderers:
+                                    patch = renderers["thinking"].feed(delta["reasoning_content"])
+                                    if patch:
+                                        yield _html_patch("thinking", patch)
                             
                             # B. 捕捉最终回答 (Content)
                             elif "content" in delta and delta["content"]:
+                                if key:
+                                    answer_parts.append(delta["content"])
                                 packet = {
                                     "type": "answer", 
                                     "content": delta["content"]
                                 }
-                                yield f"data: {json.dumps(packet, ensure_ascii=False)}\n\n"
+                                if emit_raw:
+                                    yield _sse(packet)
+                                if renderers:
+                                    # 开始回答说明思考已经结束，先把思考过程的尾部提交
+                                    patch = renderers["thinking"].finish()
+                                    if patch:
+                                        yield _html_patch("thinking", patch)
+                                    patch = renderers["answer"].feed(delta["content"])
+                                    if patch:
+                                        yield _html_patch("answer", patch)
                                 
                         except json.JSONDecodeError:
-                            print(f"⚠️ JSON解析失败: {line}")
+                            logger.warning("流式数据块JSON解析失败", extra={"line": line})
                             continue
+                
+                # 提交剩余的尾部
+                for target, renderer in renderers.items():
+                    patch = renderer.finish()
+                    if patch:
+                        yield _html_patch(target, patch)
+                if not done_seen:
+                    # 上游没有发送 [DONE] 就断开了：回答不完整
+                    outcome = "truncated"
+                    failed = True
+                    stream_span.status = "error"
+                    stream_span.error = "stream ended without [DONE]"
+                    yield _sse({'type': 'error', 'content': "虚空终端的连接中断了，回答可能不完整"})
+                    return
+                failed = False
+                if finish_reason != "stop":
+                    # 例如 finish_reason 为 length：回答达到长度上限被截断，不缓存
+                    outcome = "truncated"
+                    stream_span.set_attribute("llm.finish_reason", finish_reason or "")
+                    return
+                outcome = "ok"
+                if key and answer_parts:
+                    await asyncio.to_thread(answer_cache.put, key, "".join(reasoning_parts), "".join(answer_parts))
                             
+    except asyncio.CancelledError:
+        # 没有人再接收这个流（见 stream_broker）：退出 async with 时关闭上游连接，不再消耗 token
+        outcome = "cancelled"
+        stream_span.set_attribute("llm.cancelled", True)
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc() # 打印后端报错详情
-        yield f"data: {json.dumps({'type': 'error', 'content': str(e)}, ensure_ascii=False)}\n\n"
+        logger.exception("纳西妲流式输出失败")
+        failed = True
+        stream_span.record_error(e)
+        yield _sse({'type': 'error', 'content': str(e)})
+    finally:
+        if failed is None:
+            breaker.cancel()
+        else:
+            breaker.record(failed=failed)
+        LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            call_site="focus_stream", model=DEEPSEEK_REASONER_MODEL, outcome=outcome
+        )
+        stream_span.set_attribute("llm.chunks", chunks)
+        stream_span.end()
 
 def _format_nahida_html(reasoning: str, content: str) -> str:
     """
     将纳西妲的思考过程和回答包装成漂亮的 HTML
     """
     # 将 Markdown 转换为 HTML
-    content_html = markdown.markdown(content, extensions=['fenced_code', 'tables', 'nl2br'])
-    reasoning_html = markdown.markdown(reasoning, extensions=['fenced_code', 'nl2br'])
+    content_html = render_markdown(content, "nahida_answer")
+    reasoning_html = render_markdown(reasoning, "nahida_reasoning")
     
     html = f"""
     <div class="nahida-container">
@@ -0,0 +1,133 @@
+# backend/llm/hedging.py
+"""
+对冲请求（hedged requests），降低 LLM 调用的长尾延迟
+
+幂等的调用点（SQL 生成、图表配置、无状态的专注模式）在等待超过自适应阈值后，
+再发出一个完全相同的请求，谁先成功用谁，另一个被放弃。
+- 阈值：该调用点最近 HEDGE_WINDOW 次调用耗时的 HEDGE_PERCENTILE 分位数（默认 p90），
+  样本不足 HEDGE_MIN_SAMPLES 时不对冲
+- 预算：每个请求积累 HEDGE_BUDGET_PERCENT% 个令牌，每次对冲消耗 1 个，
+  对冲流量不会超过总流量的这个比例，上游变慢时不会把负载翻倍
+
+requests 无法中断正在读取的连接，被放弃的请求在后台线程里跑完（受原来的超时限制），
+但不会再重试，结果直接丢弃。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Callable, Deque, Dict, Optional
+
+from backend.config import (
+    HEDGE_PERCENTILE, HEDGE_WINDOW, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY, HEDGE_BUDGET_PERCENT
+)
+from backend.monitoring.metrics import LLM_HEDGES
+
+class LatencyTracker:
+    """单个调用点最近若干次调用的耗时"""
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class HedgeBudget:
+    """令牌桶：每个请求积累 percent/100 个令牌，每次对冲消耗 1 个"""
+    def __init__(self, percent: float = HEDGE_BUDGET_PERCENT, burst: float = 5.0):
+        self.rate = max(0.0, percent) / 100
+        self.burst = burst
+        self.tokens = 1.0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.rate)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+budget = HedgeBudget()
+
+def tracker(call_site: str) -> LatencyTracker:
+    with _trackers_lock:
+        return _trackers.setdefault(call_site, LatencyTracker())
+
+def hedge_delay(call_site: str, timeout: float) -> Optional[float]:
+    """多久没有响应就发出对冲请求；None 表示不对冲"""
+    threshold = tracker(call_site).quantile(HEDGE_PERCENTILE)
+    if threshold is None:
+        return None
+    delay = max(HEDGE_MIN_DELAY, threshold)
+    # 剩余时间不够再跑一个请求时不对冲
+    return delay if delay < timeout / 2 else None
+
+def _start(func: Callable, cancelled: threading.Event, on_done: Optional[Callable] = None) -> Future:
+    """在新线程中执行 func(cancelled)，沿用当前上下文（trace 等）"""
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        start = time.perf_counter()
+        try:
+            future.set_result(context.run(func, cancelled))
+            if on_done:
+                on_done(time.perf_counter() - start)
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+    return future
+
+def hedged_call(call_site: str, timeout: float, func: Callable[[threading.Event], object]):
+    """
+    执行 func(cancelled)，超过阈值仍未返回时再执行一次，返回先成功的结果
+    func 在 cancelled 被设置后应尽快放弃（不再重试）
+    """
+    budget.on_request()
+    delay = hedge_delay(call_site, timeout)
+    # 只用主请求的耗时更新统计（对冲的结果会让分布偏低）
+    primary_cancelled = threading.Event()
+    primary = _start(func, primary_cancelled, on_done=tracker(call_site).observe)
+    if delay is None:
+        return primary.result()
+
+    done, _ = wait([primary], timeout=delay)
+    if done or not budget.try_spend():
+        if not done:
+            LLM_HEDGES.inc(call_site=call_site, result="budget_exhausted")
+        return primary.result()
+
+    LLM_HEDGES.inc(call_site=call_site, result="fired")
+    hedge_cancelled = threading.Event()
+    hedge = _start(func, hedge_cancelled)
+    pending = {primary: primary_cancelled, hedge: hedge_cancelled}
+    first_error = None
+    while pending:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.pop(future)
+            if future.exception() is None:
+                for cancelled in pending.values():
+                    cancelled.set()
+                if future is hedge:
+                    LLM_HEDGES.inc(call_site=call_site, result="won")
+                return future.result()
+            if first_error is None or future is primary:
+                first_error = future.exception()
+    raise first_error
@@ -1,10 +1,10 @@
 # backend/llm/memory_manager.py
-import json
-import os
-import threading
-from pathlib import Path
-from typing import Dict, List, Any
-from backend.config import BASE_DIR
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any
+from backend.database.state_store import get_state_store
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
 
 ## 设置各类记忆的最大保存数量
 # AI记住的用户长期事实
@@ -16,139 +16,115 @@ aistate_num=80
 # AI记住的聊天上下文（10个对话，20条）
 savedcontext_num=20
 
-# 定义记忆文件路径
-MEMORY_FILE = BASE_DIR / "user_memory.json"
+def _default_memory() -> Dict[str, Any]:
+    return {
+        "user_profile": {},     # 用户画像：姓名、年龄、专业等
+        "facts": [],            # 事实列表：用户发生过的事、喜好等
+        "lately_things": [],    # 关于用户最近的动态
+        "ai_state": [],         # AI 状态信息
+        "saved_context": [],    # 保存的上次聊天上下文
+        "summary": ""           # 较早聊天历史的滚动摘要
+    }
 
 class MemoryManager:
+    """
+    长期记忆
+    数据保存在状态存储中（见 backend.database.state_store）：单进程模式是 user_memory.json，
+    多进程模式是共享的 SQLite。每次修改都是一次跨进程互斥的读-改-写，多个 worker 不会互相覆盖。
+    """
     _instance = None
-    _lock = threading.Lock() # 线程锁，防止读写冲突
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(MemoryManager, cls).__new__(cls)
-            cls._instance._initialize()
         return cls._instance
 
-    def _initialize(self):
-        """初始化加载记忆"""
-        self.memory = {
-            "user_profile": {},     # 用户画像：姓名、年龄、专业等
-            "facts": [],            # 事实列表：用户发生过的事、喜好等
-            "lately_things": [],    # 关于用户最近的动态
-            "ai_state": [],         # AI 状态信息
-            "saved_context": [],    # 保存的上次聊天上下文
-            "summary": ""           # 总体摘要
-        }
-        self.load_memory()
+    @property
+    def store(self):
+        return get_state_store()
+
+    @property
+    def memory(self) -> Dict[str, Any]:
+        """当前记忆（只读快照）"""
+        return {**_default_memory(), **self.store.load_memory()}
 
     def load_memory(self):
-        """从文件加载记忆"""
-        with self._lock:
-            if MEMORY_FILE.exists():
-                try:
-                    with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self.memory.update(data)
-                except Exception as e:
-                    print(f"Error loading memory: {e}")
-
-    def save_memory(self):
-        """保存记忆到文件"""
-        with self._lock:
-            try:
-                with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(self.memory, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"Error saving memory: {e}")
+        """预先读取记忆（启动预热时调用）"""
+        self.store.load_memory()
+
+    @contextmanager
+    def _edit(self) -> Iterator[Dict[str, Any]]:
+        with self.store.edit_memory() as memory:
+            for key, value in _default_memory().items():
+                memory.setdefault(key, value)
+            yield memory
 
     def update_profile(self, key: str, value: str):
         """更新用户画像 (key 存在则覆盖)"""
         if not key or not value:
             return
         
-        # 简单的去重逻辑：如果值一样就不更新
-        if self.memory["user_profile"].get(key) == value:
+        with self._edit() as memory:
+            # 简单的去重逻辑：如果值一样就不更新
+            if memory["user_profile"].get(key) == value:
+                return
+                
+            logger.info("记忆更新: 画像", extra={"key": key, "value": value})
+            memory["user_profile"][key] = value
+
+    def _append(self, field: str, item: str, limit: int, event: str, label: str):
+        """追加一条记忆（去重），只保留最后 limit 条"""
+        if not item:
             return
-            
-        print(f"🧠 [记忆更新] 画像: {key} = {value}")
-        self.memory["user_profile"][key] = value
-        self.save_memory()
+        
+        with self._edit() as memory:
+            # 简单的去重
+            if item in memory[field]:
+                return
+                
+            logger.info(event, extra={label: item})
+            memory[field].append(item)
+            if len(memory[field]) > limit:
+                memory[field] = memory[field][(0-limit):]
 
     def add_fact(self, fact: str):
         """添加一条事实 (追加模式)"""
-        if not fact:
-            return
-            
-        # 简单的去重
-        if fact in self.memory["facts"]:
-            return
-            
-        print(f"🧠 [记忆更新] 事实: {fact}")
-        self.memory["facts"].append(fact)
-        # 限制事实数量
-        if len(self.memory["facts"]) > fact_num:
-            self.memory["facts"] = self.memory["facts"][(0-fact_num):]
-            
-        self.save_memory()
+        self._append("facts", fact, fact_num, "记忆更新: 事实", "fact")
 
     def add_lately_thing(self, thing: str):
         """添加一条近期动态 (追加模式)"""
-        if not thing:
-            return
-            
-        # 简单的去重
-        if thing in self.memory["lately_things"]:
-            return
-            
-        print(f"🧠 [记忆更新] 近期动态: {thing}")
-        self.memory["lately_things"].append(thing)
-        # 限制近期动态数量
-        if len(self.memory["lately_things"]) > lastly_num:
-            self.memory["lately_things"] = self.memory["lately_things"][(0-lastly_num):]
-            
-        self.save_memory()
+        self._append("lately_things", thing, lastly_num, "记忆更新: 近期动态", "thing")
         
     def add_ai_state(self, state: str):
         """添加一条 AI 状态信息 (追加模式)"""
-        if not state:
-            return
-            
-        # 简单的去重
-        if state in self.memory["ai_state"]:
-            return
-            
-        print(f"🧠 [记忆更新] AI状态: {state}")
-        self.memory["ai_state"].append(state)
-        # 限制ai状态记忆数量，只保留最近40条
-        if len(self.memory["ai_state"]) > aistate_num:
-            self.memory["ai_state"] = self.memory["ai_state"][(0-aistate_num):]
-        self.save_memory()
+        self._append("ai_state", state, aistate_num, "记忆更新: AI状态", "state")
         
     def get_memory_context(self) -> str:
         """
         生成注入到 System Prompt 的上下文文本
         """
         context = []
+        memory = self.memory
         
         # 1. 构建用户画像部分
-        if self.memory["user_profile"]:
-            profile_str = ", ".join([f"{k}: {v}" for k, v in self.memory["user_profile"].items()])
+        if memory["user_profile"]:
+            profile_str = ", ".join([f"{k}: {v}" for k, v in memory["user_profile"].items()])
             context.append(f"【用户基本资料】{profile_str}")
         
         # 2. 构建用户的事实记忆部分
-        recent_facts = self.memory["facts"][(0-fact_num):]
+        recent_facts = memory["facts"][(0-fact_num):]
         if recent_facts:
             facts_str = "; ".join(recent_facts)
             context.append(f"【你们的共同回忆/已知事实】{facts_str}")
 
         # 3. 构建近期动态部分
-        recent_lately = self.memory["lately_things"][(0-lastly_num):]
+        recent_lately = memory["lately_things"][(0-lastly_num):]
         if recent_lately:
             lately_str = "; ".join(recent_lately)
             context.append(f"【用户近期动态】{lately_str}")
         
         # 4. 构建AI状态部分
-        recent_states = self.memory["ai_state"][(0-aistate_num):]
+        recent_states = memory["ai_state"][(0-aistate_num):]
         if recent_states:
             states_str = "; ".join(recent_states)
             context.append(f"【AI最近信息】{states_str}")
@@ -167,11 +143,9 @@ class MemoryManager:
         # 保留最后 savedcontextnum 条消息
         recent_context = history[(0-savedcontext_num):]
         
-        # 只有当内容发生变化时才写入文件，减少IO
-        if self.memory.get("saved_context") != recent_context:
-            self.memory["saved_context"] = recent_context
-            self.save_memory()
-            # print(f"💾 [系统] 已保存最后 {len(recent_context)} 条对话上下文")
+        # 只有当内容发生变化时才写入，减少IO
+        with self._edit() as memory:
+            memory["saved_context"] = recent_context
 
     # 获取保存的上下文
     def get_saved_context(self) -> List[Dict[str, str]]:
@@ -180,5 +154,13 @@ class MemoryManager:
         """
         return self.memory.get("saved_context", [])
 
+    # 聊天历史的滚动摘要（见 backend/llm/summarizer.py）
+    def get_summary(self) -> str:
+        return self.memory.get("summary") or ""
+
+    def set_summary(self, summary: str):
+        with self._edit() as memory:
+            memory["summary"] = summary
+
 # 创建全局实例
 memory_manager = MemoryManager()
\ No newline at end of file
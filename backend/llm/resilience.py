@@ -0,0 +1,155 @@
+# backend/llm/resilience.py
+"""
+DeepSeek 调用的重试与熔断
+
+- 重试：只重试暂时性错误（429、5xx、连接失败），指数退避加随机抖动，
+  服务端给出 Retry-After 时至少等待这么久；所有尝试共享调用方给的超时预算，
+  重试不会让总耗时超过原来的 timeout
+- 熔断：每个模型一个熔断器，统计最近 CIRCUIT_WINDOW_SECONDS 秒内的调用，
+  失败（含耗时超过 timeout × LLM_SLOW_CALL_RATIO 的慢调用）比例超过阈值就断开，
+  断开期间调用立即失败，各调用点直接走本地降级；CIRCUIT_OPEN_SECONDS 后放行一个探测请求，
+  成功则恢复
+"""
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Optional, Tuple
+
+from backend.config import (
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    CIRCUIT_WINDOW_SECONDS, CIRCUIT_MIN_REQUESTS, CIRCUIT_ERROR_RATE, CIRCUIT_OPEN_SECONDS
+)
+from backend.monitoring.metrics import LLM_CIRCUIT_STATE
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第 attempt 次重试前的等待时间（full jitter），不少于服务端要求的 Retry-After"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def should_retry(attempt: int, delay: float, deadline: float) -> bool:
+    """还有重试次数、等待时间在上限内、并且等完之后还有超时预算"""
+    if attempt >= LLM_MAX_RETRIES or delay > LLM_RETRY_MAX_DELAY:
+        return False
+    return time.monotonic() + delay < deadline
+
+class CircuitBreaker:
+    """单个模型的熔断器（线程安全）"""
+    def __init__(self, name: str, window: float = CIRCUIT_WINDOW_SECONDS, min_requests: int = CIRCUIT_MIN_REQUESTS,
+                 error_rate: float = CIRCUIT_ERROR_RATE, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._events: Deque[Tuple[float, bool]] = deque()  # (时间, 是否失败)
+        self._probing = False
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.set(0, model=name)
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("熔断器状态变化", extra={"model": self.name, "from": self.state, "to": state})
+        self.state = state
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[state], model=self.name)
+
+    def _trim(self, now: float):
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def allow(self) -> bool:
+        """是否放行本次调用；半开状态下同一时间只放行一个探测请求"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, failed: bool):
+        """记录一次调用结果（重试的每次尝试分别记录）"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._events.clear()
+                    self._set_state(CLOSED)
+                return
+            self._events.append((now, failed))
+            self._trim(now)
+            failures = sum(1 for _, f in self._events if f)
+            if (self.state == CLOSED and len(self._events) >= self.min_requests
+                    and failures / len(self._events) >= self.error_rate):
+                self._open(now)
+
+    def cancel(self):
+        """调用被取消（例如客户端断开），不计入统计；半开时允许下一个探测请求"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now: float):
+        self.opened_at = now
+        self._events.clear()
+        self._set_state(OPEN)
+
+    def retry_in(self) -> float:
+        """距离下一次探测还有多少秒"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "state": self.state,
+                "recent_calls": len(self._events),
+                "recent_failures": sum(1 for _, f in self._events if f),
+                "retry_in": round(self.retry_in(), 1),
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(model, CircuitBreaker(model))
+    return breaker
+
+def breaker_snapshot() -> Dict[str, Dict]:
+    """所有熔断器的状态（用于健康检查）"""
+    return {model: breaker.snapshot() for model, breaker in list(_breakers.items())}
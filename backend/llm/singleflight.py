@@ -0,0 +1,70 @@
+# backend/llm/singleflight.py
+"""
+相同请求合并（single-flight）
+
+同一时刻有多个完全相同的请求时，只有第一个（leader）真正调用上游，
+其余请求等待它完成并共享结果或异常。只用于结果与调用方无关的确定性调用点
+（低温度的 SQL 生成、图表配置，以及不带历史的专注模式），不是缓存：
+leader 完成后记录立即删除，之后的请求会重新调用。
+"""
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """按模型、消息和采样参数（即整个请求体）计算合并用的键"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, func: Callable, *args) -> Tuple[Any, bool]:
+        """
+        执行 func(*args)，相同 key 的并发调用只执行一次
+        返回 (结果, 是否共享了其他请求的结果)；共享的结果是深拷贝，调用方可以随意修改
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        result = None
+        try:
+            result = func(*args)
+            return result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            # 删除后不会再有新的等待者；留一份副本给等待者，leader 的调用方修改结果不影响它们
+            if call.waiters and call.error is None:
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -1,19 +1,32 @@
 # backend/llm/sql_generator.py
-import os
-import sys
 import re
-import requests
 import random
 import time
+import sqlite3
 from typing import Dict, Any
 import json
 
-# 添加项目根目录到路径
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-if project_root not in sys.path:
-    sys.path.append(project_root)
+from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_MODEL
+from backend.database.catalog import schema_catalog, SchemaSnapshot
+from backend.database.generator import FIRST_NAMES, LAST_NAMES, CLASSES, COLLEGES, MAJORS
+from backend.monitoring.metrics import FALLBACKS
+from backend.monitoring.log import get_logger
+from .client import chat_completion, CircuitOpenError
 
-from config import DB_SCHEMA, DEEPSEEK_API_KEY, DEEPSEEK_API_URL, DEEPSEEK_MODEL
+logger = get_logger(__name__)
+
+# 测试用的自然语言问题集（test_sql_generation 和规模测试 benchmarks/scale_harness.py 共用）
+SQL_TEST_CASES = [
+    "随机插入2名2024级的学生",
+    "查看计算机学院不同专业人数，按专业划分",
+    "统计各学院人数",
+    "查询所有男生信息",
+    "查找软件工程专业的学生",
+    "显示2023级的学生，按学号排序",
+    "查看计算机学院的男生",
+    "统计各专业人数并按人数降序排列",
+    "查询所有学生信息，按创建时间倒序"
+]
 
 def generate_sql_with_ai(user_input: str) -> str:
     """
@@ -22,41 +35,51 @@ def generate_sql_with_ai(user_input: str) -> str:
     """
     # 检查API密钥
     if not DEEPSEEK_API_KEY or DEEPSEEK_API_KEY == "your_api_key_here":
-        print("⚠️ API密钥未配置或为默认值，使用规则匹配")
+        logger.warning("API密钥未配置或为默认值，使用规则匹配")
+        FALLBACKS.inc(kind="sql_rules", reason="no_api_key")
         return _generate_sql_by_rules(user_input)
     
     try:
-        print(f"🤖 使用AI生成SQL: {user_input}")
+        logger.debug("使用AI生成SQL", extra={"user_input": user_input})
         # 尝试调用AI生成SQL
         sql = _call_deepseek_for_sql(user_input)
         
         # 验证SQL是否有效
         if _is_valid_sql(sql):
-            print(f"✅ AI生成的SQL: {sql}")
+            logger.info("AI生成SQL成功", extra={"sql": sql})
             return sql
         else:
-            print(f"⚠️ AI生成的SQL可能无效，降级到规则匹配: {sql}")
+            logger.warning("AI生成的SQL可能无效，降级到规则匹配", extra={"sql": sql})
+            FALLBACKS.inc(kind="sql_rules", reason="invalid_sql")
             return _generate_sql_by_rules(user_input)
             
+    except CircuitOpenError:
+        # 熔断期间不发请求，直接用规则匹配
+        FALLBACKS.inc(kind="sql_rules", reason="circuit_open")
+        return _generate_sql_by_rules(user_input)
     except Exception as e:
-        print(f"❌ AI生成SQL失败，降级到规则匹配: {e}")
+        logger.warning("AI生成SQL失败，降级到规则匹配", extra={"error": str(e)})
         # 降级到规则匹配
+        FALLBACKS.inc(kind="sql_rules", reason="llm_error")
         return _generate_sql_by_rules(user_input)
 
-def _call_deepseek_for_sql(user_input: str) -> str:
-    """
-    调用DeepSeek API生成SQL
-    """
-    # 构建系统提示
-    system_prompt = f"""你是一个专业的SQL生成助手。根据用户的问题生成SQLite SQL查询语句。
+def _sql_system_prompt() -> str:
+    """SQL 生成的系统提示（由模式目录生成，同一版本只生成一次）"""
+    return schema_catalog.get().memo("sql_system_prompt", _build_sql_system_prompt)
+
+def _build_sql_system_prompt(snapshot: SchemaSnapshot) -> str:
+    values = snapshot.values_text("students")
+    values_section = f"""
+字段取值（WHERE 条件请使用这些实际取值）：
+{values}""" if values else ""
+    return f"""你是一个专业的SQL生成助手。根据用户的问题生成SQLite SQL查询语句。
 
 数据库结构：
 表名：students
 字段列表：
-{_format_table_schema()}
-
+{snapshot.schema_text("students")}
 示例数据：
-{_format_sample_data()}
+{snapshot.sample_text("students")}{values_section}
 
 生成规则：
 1. 只返回纯SQL语句，不要任何解释、注释或Markdown标记
@@ -73,16 +96,18 @@ def _call_deepseek_for_sql(user_input: str) -> str:
 
 重要：只返回SQL语句，不要其他任何内容！"""
 
+def _call_deepseek_for_sql(user_input: str) -> str:
+    """
+    调用DeepSeek API生成SQL
+    """
+    # 系统提示只随模式版本变化，问题只出现在用户消息里
+    system_prompt = _sql_system_prompt()
+
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"请为以下问题生成SQL查询：{user_input}"}
     ]
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-    
     payload = {
         "model": DEEPSEEK_MODEL,
         "messages": messages,
@@ -93,18 +118,7 @@ def _call_deepseek_for_sql(user_input: str) -> str:
     }
     
     try:
-        response = requests.post(
-            DEEPSEEK_API_URL, 
-            headers=headers, 
-            json=payload, 
-            timeout=30
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise ValueError("API响应格式错误")
+        data = chat_completion("sql", payload, timeout=30, coalesce=True, hedge=True)
         
         sql = data["choices"][0]["message"]["content"].strip()
         
@@ -113,8 +127,6 @@ def _call_deepseek_for_sql(user_input: str) -> str:
         
         return sql
         
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"API请求失败: {str(e)}")
     except (KeyError, IndexError, ValueError) as e:
         raise Exception(f"解析API响应失败: {str(e)}")
 
@@ -152,11 +164,11 @@ def _clean_sql_response(sql: str) -> str:
     # ========== 新增：针对INSERT语句的特判和补全 ==========
     sql_upper = cleaned_sql.upper()
     if sql_upper.startswith("INSERT"):
-        print(f"🔍 检测到INSERT语句，进行完整性检查...")
+        logger.debug("检测到INSERT语句，进行完整性检查")
         
         # 检查INSERT语句是否完整
         if not _is_insert_sql_complete(cleaned_sql):
-            print(f"⚠️ INSERT语句不完整，尝试使用备用规则生成")
+            logger.warning("INSERT语句不完整，尝试使用备用规则生成", extra={"sql": cleaned_sql})
             
             # 根据用户输入判断是否需要生成随机学生
             user_input_lower = ""  # 这里需要从调用上下文获取，暂时设为空
@@ -259,12 +271,12 @@ def _generate_random_insert_sql() -> str:
     生成随机插入学生的SQL语句（可靠的备用方案）
     新增：专门处理随机插入学生的请求
     """
-    # 随机信息池
-    first_names = ["张", "王", "李", "赵", "刘", "陈", "杨", "黄", "周", "吴", "郑", "孙", "钱", "冯", "程"]
-    last_names = ["伟", "芳", "娜", "秀英", "敏", "静", "磊", "强", "洋", "艳", "明", "华", "军", "杰", "婷"]
-    classes = ["一班", "二班", "三班", "四班", "五班"]
-    colleges = ["计算机学院", "经管学院", "文学院", "理学院", "医学院", "法学院", "艺术学院"]
-    majors = ["软件工程", "人工智能", "数据科学", "计算机科学", "物联网工程", "会计学", "金融学", "临床医学", "法学", "汉语言文学"]
+    # 随机信息池（与大规模数据生成器共用）
+    first_names = FIRST_NAMES
+    last_names = LAST_NAMES
+    classes = CLASSES
+    colleges = COLLEGES
+    majors = MAJORS
     
     # 生成两个不同的学号（基于时间戳加随机数，降低冲突概率）
     base_id = int(time.time()) % 10000
@@ -295,20 +307,81 @@ def _generate_random_insert_sql() -> str:
 ('{name1}', '{student_id_1}', '{class1}', '{college1}', '{major1}', '2024级', '{gender1}', '{phone1}'),
 ('{name2}', '{student_id_2}', '{class2}', '{college2}', '{major2}', '2024级', '{gender2}', '{phone2}')"""
     
-    print(f"✅ 使用备用规则生成随机插入SQL")
+    logger.info("使用备用规则生成随机插入SQL")
     return sql
 
+# 规则匹配的关键词 → 取值；模式目录中有对应的取值字典时以数据库的实际取值为准
+_DEFAULT_COLLEGE_MAPPING = {
+    "计算机": "计算机学院",
+    "经管": "经管学院",
+    "经管学院": "经管学院",
+    "计算机学院": "计算机学院",
+    "文学院": "文学院",
+    "理学院": "理学院",
+    "医学院": "医学院"
+}
+_DEFAULT_MAJOR_MAPPING = {
+    "软件工程": "软件工程",
+    "会计学": "会计学",
+    "计算机科学": "计算机科学",
+    "人工智能": "人工智能",
+    "金融学": "金融学",
+    "临床医学": "临床医学"
+}
+_DEFAULT_GRADE_MAPPING = {
+    "2022级": "2022级",
+    "2023级": "2023级",
+    "2024级": "2024级",
+    "大一": "2024级",
+    "大二": "2023级",
+    "大三": "2022级"
+}
+_GRADE_ALIASES = {"大一": "2024级", "大二": "2023级", "大三": "2022级"}
+
+def _build_rule_mappings(snapshot: SchemaSnapshot) -> Dict[str, Dict[str, str]]:
+    """按取值字典生成学院、专业、年级的关键词映射（先匹配全称，再匹配去掉"学院"的简称）"""
+    colleges = snapshot.values("college")
+    college_mapping = dict(_DEFAULT_COLLEGE_MAPPING)
+    if colleges:
+        college_mapping = {college: college for college in colleges}
+        for college in colleges:
+            short = college[:-2] if college.endswith("学院") else ""
+            if len(short) >= 2:
+                college_mapping.setdefault(short, college)
+
+    majors = snapshot.values("major")
+    major_mapping = {major: major for major in majors} if majors else dict(_DEFAULT_MAJOR_MAPPING)
+
+    grades = snapshot.values("grade")
+    grade_mapping = dict(_DEFAULT_GRADE_MAPPING)
+    if grades:
+        grade_mapping = {grade: grade for grade in grades}
+        grade_mapping.update({alias: grade for alias, grade in _GRADE_ALIASES.items() if grade in grades})
+    return {"college": college_mapping, "major": major_mapping, "grade": grade_mapping}
+
+def _rule_mappings() -> Dict[str, Dict[str, str]]:
+    try:
+        return schema_catalog.get().memo("sql_rule_mappings", _build_rule_mappings)
+    except sqlite3.Error as e:
+        # 规则匹配是最后的降级方案，读不到数据库时用内置的映射
+        logger.warning("读取模式目录失败，规则匹配使用内置映射", extra={"error": str(e)})
+        return {"college": _DEFAULT_COLLEGE_MAPPING, "major": _DEFAULT_MAJOR_MAPPING, "grade": _DEFAULT_GRADE_MAPPING}
+
 def _generate_sql_by_rules(user_input: str) -> str:
     """
     规则匹配生成SQL（降级方案）
     增强版：支持更复杂的查询
     """
     user_input_lower = user_input.lower()
+    mappings = _rule_mappings()
+    college_mapping = mappings["college"]
+    major_mapping = mappings["major"]
+    grade_mapping = mappings["grade"]
     
     # ========== 新增：专门处理随机插入的请求 ==========
     if "随机" in user_input_lower and "插入" in user_input_lower and "学生" in user_input_lower:
         if "2024级" in user_input or "2024" in user_input:
-            print("🎲 检测到随机插入2024级学生请求，使用规则生成")
+            logger.info("检测到随机插入2024级学生请求，使用规则生成")
             return _generate_random_insert_sql()
         else:
             # 默认插入2名学生
@@ -318,18 +391,19 @@ def _generate_sql_by_rules(user_input: str) -> str:
     if any(keyword in user_input_lower for keyword in ["统计", "计数", "多少", "人数", "数量", "分布"]):
         # 专业人数统计（如：查看计算机学院不同专业人数）
         if "专业" in user_input_lower and "学院" in user_input_lower:
-            # 提取学院名称
+            # 提取学院名称：先找已知的学院，再按模式提取
+            college = next((name for keyword, name in college_mapping.items() if keyword in user_input), None)
             college_patterns = [
                 r'([\u4e00-\u9fa5]+学院)',
                 r'学院[：:]?\s*([\u4e00-\u9fa5]+)',
                 r'([\u4e00-\u9fa5]+)学院'
             ]
-            college = "计算机学院"  # 默认
-            for pattern in college_patterns:
+            for pattern in college_patterns if college is None else []:
                 match = re.search(pattern, user_input)
                 if match:
                     college = match.group(1)
                     break
+            college = college or "计算机学院"  # 默认
             
             return f"SELECT major, COUNT(*) as 人数 FROM students WHERE college = '{college}' GROUP BY major ORDER BY 人数 DESC"
         
@@ -360,44 +434,16 @@ def _generate_sql_by_rules(user_input: str) -> str:
     # 2. 查询类（增强）
     elif any(keyword in user_input_lower for keyword in ["查询", "查看", "显示", "找", "列出", "显示所有", "查看所有"]):
         # 学院查询
-        college_mapping = {
-            "计算机": "计算机学院",
-            "经管": "经管学院",
-            "经管学院": "经管学院",
-            "计算机学院": "计算机学院",
-            "文学院": "文学院",
-            "理学院": "理学院",
-            "医学院": "医学院"
-        }
-        
         for keyword, college_name in college_mapping.items():
             if keyword in user_input:
                 return f"SELECT * FROM students WHERE college = '{college_name}'"
         
         # 专业查询
-        major_mapping = {
-            "软件工程": "软件工程",
-            "会计学": "会计学",
-            "计算机科学": "计算机科学",
-            "人工智能": "人工智能",
-            "金融学": "金融学",
-            "临床医学": "临床医学"
-        }
-        
         for keyword, major_name in major_mapping.items():
             if keyword in user_input:
                 return f"SELECT * FROM students WHERE major = '{major_name}'"
         
         # 年级查询
-        grade_mapping = {
-            "2022级": "2022级",
-            "2023级": "2023级",
-            "2024级": "2024级",
-            "大一": "2024级",
-            "大二": "2023级",
-            "大三": "2022级"
-        }
-        
         for keyword, grade_name in grade_mapping.items():
             if keyword in user_input_lower:
                 return f"SELECT * FROM students WHERE grade = '{grade_name}'"
@@ -528,36 +574,10 @@ VALUES ('{name}', '2023999', '一班', '计算机学院', '软件工程', '{grad
     # 默认查询
     return "SELECT * FROM students LIMIT 10"
 
-def _format_table_schema() -> str:
-    """格式化表结构信息"""
-    schema_text = ""
-    for column in DB_SCHEMA["students"]["columns"]:
-        schema_text += f"- {column['name']} ({column['type']}): {column['description']}\n"
-    return schema_text
-
-def _format_sample_data() -> str:
-    """格式化示例数据"""
-    sample_text = ""
-    for i, data in enumerate(DB_SCHEMA["students"]["sample_data"], 1):
-        sample_text += f"- 示例{i}: {data}\n"
-    return sample_text
-
 # 测试函数
 def test_sql_generation():
     """测试SQL生成"""
-    test_cases = [
-        "随机插入2名2024级的学生",
-        "查看计算机学院不同专业人数，按专业划分",
-        "统计各学院人数",
-        "查询所有男生信息",
-        "查找软件工程专业的学生",
-        "显示2023级的学生，按学号排序",
-        "查看计算机学院的男生",
-        "统计各专业人数并按人数降序排列",
-        "查询所有学生信息，按创建时间倒序"
-    ]
-    
-    for test_input in test_cases:
+    for test_input in SQL_TEST_CASES:
         print(f"\n测试输入: {test_input}")
         try:
             sql = generate_sql_with_ai(test_input)
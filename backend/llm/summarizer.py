@@ -0,0 +1,150 @@
+# backend/llm/summarizer.py
+"""
+聊天历史的滚动摘要（压缩）
+
+聊天历史的估算 token 数超过 SUMMARY_TRIGGER_TOKENS 时，在后台通道里把较早的对话
+连同已有摘要一起交给 LLM 折叠成新的摘要，保存在记忆的 summary 字段，再从历史中删掉
+这些已经摘要过的消息，只保留最近 SUMMARY_KEEP_MESSAGES 条原文。
+聊天时摘要放在人设之后、历史之前（见 chat_mode._call_deepseek_api），
+每轮提示词的大小基本恒定，不再随历史线性增长到 80 条。
+
+同一进程内同一时间只有一个压缩任务；多进程模式下重复压缩只会让摘要多改写一次，
+已经被其他 worker 删掉的消息不会重复删除（见 StateStore.drop_history_prefix）。
+等待摘要期间用户清空了历史（clearing()）时丢弃这次结果，已清空的对话不会被写回摘要。
+"""
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from backend.config import DEEPSEEK_MODEL, SUMMARY_TRIGGER_TOKENS, SUMMARY_KEEP_MESSAGES, SUMMARY_MAX_CHARS
+from backend.database.state_store import get_state_store
+from backend.monitoring.metrics import HISTORY_COMPACTIONS
+from backend.monitoring.log import get_logger
+from .admission import extraction_lane
+from .client import chat_completion, LLMError
+from .memory_manager import memory_manager
+
+logger = get_logger(__name__)
+
+# 固定的系统提示（所有压缩请求相同）
+SUMMARY_PROMPT = f"""你是一个对话摘要员，负责把用户和AI助手"芙芙"之间较早的对话压缩成一段摘要，
+让芙芙在看不到原文的情况下也能自然地接着聊下去。
+
+【要求】
+1. 在已有摘要的基础上合并新的对话，输出一段完整的新摘要（不是只总结新增部分）
+2. 保留：聊过的话题和结论、用户提到的计划和约定、双方的情绪变化、还没聊完的事情
+3. 删掉：寒暄、重复内容、和后续对话无关的细节
+4. 用第三人称叙述（"用户……，芙芙……"），按时间顺序，不要分点
+5. 只输出摘要正文，不要标题、解释或 Markdown
+6. 摘要不超过 {SUMMARY_MAX_CHARS} 字"""
+
+_CJK = re.compile(r'[一-鿿]')
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文约 1 字 1 token，其他字符约 4 个 1 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def history_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+
+def _split_point(history: List[Dict[str, str]]) -> int:
+    """要摘要的消息数：保留最近 SUMMARY_KEEP_MESSAGES 条，并让保留部分从用户消息开始"""
+    cut = max(0, len(history) - SUMMARY_KEEP_MESSAGES)
+    while cut > 0 and history[cut]["role"] != "user":
+        cut -= 1
+    return cut
+
+def _truncate(summary: str) -> str:
+    """超长的摘要保留开头，在最后一个句号处截断"""
+    if len(summary) <= SUMMARY_MAX_CHARS:
+        return summary
+    head = summary[:SUMMARY_MAX_CHARS]
+    end = head.rfind("。")
+    return head[:end + 1] if end >= SUMMARY_MAX_CHARS // 2 else head
+
+def _format_turns(messages: List[Dict[str, str]]) -> str:
+    names = {"user": "用户", "assistant": "芙芙"}
+    return "\n".join(f"{names.get(m['role'], m['role'])}：{m['content']}" for m in messages)
+
+class HistoryCompactor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = 0  # 每次清空历史加一
+        self._apply_lock = threading.Lock()  # 保存压缩结果和清空历史互斥
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    @contextmanager
+    def clearing(self) -> Iterator[None]:
+        """清空历史时使用：进行中的压缩不再保存结果"""
+        with self._apply_lock:
+            self._epoch += 1
+            yield
+
+    def maybe_compact(self, history: List[Dict[str, str]]) -> bool:
+        """历史超过阈值时提交后台压缩任务，返回是否已提交"""
+        if self.running or len(history) <= SUMMARY_KEEP_MESSAGES:
+            return False
+        if history_tokens(history) < SUMMARY_TRIGGER_TOKENS:
+            return False
+        # 复制当前上下文，压缩的 span 会挂在本次请求的 trace 下
+        context = contextvars.copy_context()
+        return extraction_lane.submit(context.run, self.compact)
+
+    def compact(self) -> int:
+        """执行一次压缩（阻塞），返回从历史中删掉的消息数"""
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            epoch = self._epoch
+            store = get_state_store()
+            history = store.get_history()
+            cut = _split_point(history)
+            if cut == 0:
+                return 0
+            older = history[:cut]
+            previous = memory_manager.get_summary()
+
+            payload = {
+                "model": DEEPSEEK_MODEL,
+                "messages": [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"【已有摘要】\n{previous or '（无）'}\n\n【新的对话】\n{_format_turns(older)}"}
+                ],
+                "stream": False,
+                "max_tokens": SUMMARY_MAX_CHARS,  # 中文约 1 字 1 token 以内
+                "temperature": 0.3
+            }
+            try:
+                data = chat_completion("summary", payload, timeout=30)
+                summary = (data["choices"][0]["message"]["content"] or "").strip()
+            except (LLMError, KeyError, IndexError) as e:
+                HISTORY_COMPACTIONS.inc(outcome="error")
+                logger.warning("对话摘要失败，下次再试", extra={"error": str(e)})
+                return 0
+            if not summary:
+                HISTORY_COMPACTIONS.inc(outcome="empty")
+                return 0
+
+            with self._apply_lock:
+                if self._epoch != epoch:
+                    HISTORY_COMPACTIONS.inc(outcome="discarded")
+                    logger.info("压缩期间历史已被清空，丢弃摘要")
+                    return 0
+                # 先保存摘要再删历史：中间的请求最多看到重复内容，不会丢失内容
+                memory_manager.set_summary(_truncate(summary))
+                dropped = store.drop_history_prefix(older)
+            HISTORY_COMPACTIONS.inc(outcome="ok")
+            logger.info("对话历史已压缩", extra={
+                "summarized": len(older), "dropped": dropped, "summary_chars": len(summary)
+            })
+            return dropped
+        finally:
+            self._lock.release()
+
+history_compactor = HistoryCompactor()
@@ -1,16 +1,31 @@
 # backend/main.py
 import os
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from backend.config import (
     APP_NAME, APP_VERSION, APP_DESCRIPTION,
-    BACKEND_HOST, BACKEND_PORT
+    BACKEND_HOST, BACKEND_PORT, WORKERS, STATE_BACKEND,
+    COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
 )
-from backend.database import init_db, check_db_connection
+from backend.database import init_db, check_db_connection, db_writer
 from backend.api import router
+from backend.api.responses import FastJSONResponse
+from backend.api.compression import CompressionMiddleware
+from backend.monitoring.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS
+from backend.monitoring.tracing import span, normalize_trace_id
+from backend.monitoring.log import setup_logging
+from backend.monitoring.health import health_monitor
+from backend.warmup import readiness
+
+# 需要压缩的接口
+COMPRESSED_PATHS = {"/api/chat", "/api/execute-sql", "/api/db-info"}
+
+# 探活和指标抓取不记录 trace，避免淹没真实请求
+UNTRACED_PATHS = {"/api/health", "/api/ready", "/api/metrics"}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -36,17 +51,35 @@ async def lifespan(app: FastAPI):
         print("警告: DeepSeek API配置: 未设置 (将使用模拟模式)")
     
     print("=" * 50)
+    
+    # 后台定期刷新健康检查快照；后台预热（加载记忆、导入重量级依赖），完成后 /api/ready 返回 200
+    health_monitor.start()
+    readiness.start()
     yield
     # 关闭时的代码
     print("系统正在关闭...")
+    health_monitor.stop()
+    db_writer.close()
 
 def create_app() -> FastAPI:
     """创建FastAPI应用"""
+    setup_logging()
+    
     app = FastAPI(
         title=APP_NAME,
         description=APP_DESCRIPTION,
         version=APP_VERSION,
-        lifespan=lifespan
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse
+    )
+    
+    # 压缩结果集较大的响应（流式接口不在列表中）
+    app.add_middleware(
+        CompressionMiddleware,
+        paths=COMPRESSED_PATHS,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=COMPRESSION_GZIP_LEVEL,
+        brotli_quality=COMPRESSION_BROTLI_QUALITY
     )
     
     # 配置CORS
@@ -56,8 +89,49 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Trace-Id", "X-Request-Id", "X-Stream-Id", "Retry-After"],
     )
     
+    # 请求计数和耗时指标
+    @app.middleware("http")
+    async def metrics_middleware(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        HTTP_IN_FLIGHT.inc()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=getattr(route, "path", "unmatched"),
+                status=str(status)
+            )
+    
+    # 请求级链路追踪：每个 /api 请求一个 trace，响应头带上 X-Trace-Id
+    @app.middleware("http")
+    async def tracing_middleware(request: Request, call_next):
+        path = request.url.path
+        if not path.startswith("/api/") or path in UNTRACED_PATHS:
+            return await call_next(request)
+        
+        trace_id = normalize_trace_id(request.headers.get("x-trace-id"))
+        with span(f"{request.method} {path}", trace_id=trace_id,
+                  **{"http.method": request.method, "http.path": path}) as root:
+            response = await call_next(request)
+            route = request.scope.get("route")
+            if route is not None:
+                root.name = f"{request.method} {route.path}"
+            root.set_attribute("http.status", response.status_code)
+            if response.status_code >= 500:
+                root.status = "error"
+        response.headers["X-Trace-Id"] = root.trace_id
+        return response
+    
     # 包含API路由
     app.include_router(router)
     
@@ -80,8 +154,10 @@ def create_app() -> FastAPI:
                 "clear_history": "/api/clear-history (POST)",
                 "test_api": "/api/test-api (POST)",
                 "health": "/api/health (GET)",
+                "ready": "/api/ready (GET)",
                 "system_info": "/api/system-info (GET)",
-                "db_info": "/api/db-info (GET)"
+                "db_info": "/api/db-info (GET)",
+                "metrics": "/api/metrics (GET)"
             },
             "docs": "/docs",
             "redoc": "/redoc"
@@ -97,13 +173,29 @@ def main():
     print(f"{APP_NAME} v{APP_VERSION}")
     print(f"启动服务器: http://{BACKEND_HOST}:{BACKEND_PORT}")
     print(f"API文档: http://{BACKEND_HOST}:{BACKEND_PORT}/docs")
-    print("现在等待6秒来启动前端服务器...")
-    print("=" * 50)
+    print(f"就绪检查: http://{BACKEND_HOST}:{BACKEND_PORT}/api/ready")
+    
+    if WORKERS <= 1:
+        print("=" * 50)
+        uvicorn.run(
+            app, 
+            host=BACKEND_HOST, 
+            port=BACKEND_PORT,
+            log_level="info"
+        )
+        return
     
+    # 多进程模式：聊天历史和记忆必须放在共享的状态库中（worker 子进程会继承这个环境变量）
+    if STATE_BACKEND != "sqlite":
+        print(f"多进程模式需要共享状态存储，STATE_BACKEND 已从 {STATE_BACKEND} 切换为 sqlite")
+        os.environ["STATE_BACKEND"] = "sqlite"
+    print(f"Worker 进程数: {WORKERS}")
+    print("=" * 50)
     uvicorn.run(
-        app, 
-        host=BACKEND_HOST, 
+        "backend.main:app",
+        host=BACKEND_HOST,
         port=BACKEND_PORT,
+        workers=WORKERS,
         log_level="info"
     )
 
@@ -0,0 +1,5 @@
+# backend/monitoring/__init__.py
+from .metrics import registry, Counter, Gauge, Histogram
+from .tracing import span, start_span, current_trace_id
+
+__all__ = ['registry', 'Counter', 'Gauge', 'Histogram', 'span', 'start_span', 'current_trace_id']
@@ -0,0 +1,157 @@
+# backend/monitoring/health.py
+"""
+后台健康检查
+
+HealthMonitor 在后台线程中按 HEALTH_REFRESH_INTERVAL 定期刷新数据库状态、表统计和
+DeepSeek 可达性，结果保存为内存快照。/api/health 和 /api/db-info 直接返回快照（带 ETag），
+探活请求不再每次打开数据库连接、执行 COUNT(*) 和 GROUP BY。
+
+快照的 JSON 在刷新时序列化一次，ETag 只由内容决定（不含检查时间），内容不变时客户端
+带 If-None-Match 会得到 304。数据被修改后调用 request_refresh() 提前刷新。
+快照只会被新的快照整体替换，不会被清空：刷新进行中时读到的是上一次的快照。
+"""
+import datetime
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from backend.config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_API_URL,
+    HEALTH_REFRESH_INTERVAL, HEALTH_LLM_PROBE, HEALTH_LLM_TIMEOUT
+)
+from backend.database import check_db_connection, get_table_info
+from backend.monitoring.metrics import HEALTH_CHECK_SECONDS
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+def _llm_probe_url() -> str:
+    """由对话接口地址推出模型列表地址（/chat/completions -> /models）"""
+    base = DEEPSEEK_API_URL.rstrip("/")
+    if base.endswith("/chat/completions"):
+        base = base[:-len("/chat/completions")]
+    return base + "/models"
+
+def etag_of(body: bytes) -> str:
+    """弱 ETag：压缩中间件可能对同一内容返回 gzip/br 或原始字节，强 ETag 要求字节完全相同"""
+    return 'W/"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+class Snapshot:
+    """一次刷新的结果；body 为预先序列化好的 JSON"""
+    __slots__ = ("data", "body", "etag", "checked_at")
+
+    def __init__(self, data: Dict[str, Any], body: bytes, checked_at: str):
+        self.data = data
+        self.body = body
+        self.etag = etag_of(body)
+        self.checked_at = checked_at
+
+def check_llm() -> Dict[str, Any]:
+    """DeepSeek 可达性：能拿到任何 HTTP 响应就算可达，401 说明密钥无效"""
+    if not DEEPSEEK_API_KEY:
+        return {"configured": False, "reachable": None, "status": None, "latency_ms": None, "error": None}
+    if not HEALTH_LLM_PROBE:
+        return {"configured": True, "reachable": None, "status": None, "latency_ms": None, "error": None}
+    import requests
+    
+    start = time.perf_counter()
+    try:
+        response = requests.get(
+            _llm_probe_url(),
+            headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
+            timeout=HEALTH_LLM_TIMEOUT
+        )
+        return {
+            "configured": True,
+            "reachable": True,
+            "status": response.status_code,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": None if response.status_code < 400 else response.reason,
+        }
+    except requests.exceptions.RequestException as e:
+        return {
+            "configured": True,
+            "reachable": False,
+            "status": None,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": type(e).__name__,
+        }
+
+class HealthMonitor:
+    def __init__(self, interval: float = HEALTH_REFRESH_INTERVAL):
+        self.interval = interval
+        self.health: Optional[Snapshot] = None
+        self.db_info: Optional[Snapshot] = None
+        self._lock = threading.Lock()       # 保证同一时间只有一次刷新
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stale = False  # 后台线程未运行时，数据被修改后标记为过期，下次读取时刷新
+
+    def refresh(self) -> None:
+        """执行一次全部检查并替换快照（阻塞）"""
+        # backend.api 会导入本模块，这里延迟导入避免循环引用
+        from backend.api.responses import dumps
+
+        with self._lock:
+            self._stale = False
+            with HEALTH_CHECK_SECONDS.time(check="database"):
+                db_ok, db_message = check_db_connection()
+            with HEALTH_CHECK_SECONDS.time(check="db_info"):
+                table_info = get_table_info() if db_ok else {"error": db_message}
+            with HEALTH_CHECK_SECONDS.time(check="llm"):
+                llm = check_llm()
+
+            checked_at = datetime.datetime.now().isoformat()
+            health = {
+                "database": "connected" if db_ok else "disconnected",
+                "database_message": db_message,
+                "llm": llm,
+            }
+            self.health = Snapshot(health, dumps(health), checked_at)
+            self.db_info = Snapshot(table_info, dumps(table_info), checked_at)
+        if not db_ok:
+            logger.warning("健康检查：数据库不可用", extra={"error": db_message})
+
+    @property
+    def needs_refresh(self) -> bool:
+        """还没有快照（后台线程未启动或首次刷新未完成）或快照已过期"""
+        return self.health is None or self.db_info is None or self._stale
+
+    def ensure_fresh(self) -> None:
+        """需要时同步刷新一次"""
+        if self.needs_refresh:
+            self.refresh()
+
+    def request_refresh(self) -> None:
+        """数据被修改后提前刷新（后台线程未运行时标记为过期，下次读取时再刷新）"""
+        if self._thread is not None and self._thread.is_alive():
+            self._wakeup.set()
+        else:
+            self._stale = True
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("健康检查刷新失败")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=HEALTH_LLM_TIMEOUT + 1)
+            self._thread = None
+
+health_monitor = HealthMonitor()
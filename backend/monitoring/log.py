@@ -0,0 +1,155 @@
+# backend/monitoring/log.py
+"""
+结构化日志
+
+- 请求路径上只把日志记录放进队列（QueueHandler），格式化和写出由后台线程完成，不阻塞请求
+- 输出 JSON（LOG_FORMAT=json，默认）或便于本地阅读的文本（LOG_FORMAT=text）
+- 按模块设置级别：LOG_LEVEL=INFO，LOG_LEVELS="backend.llm.chart_analyzer=DEBUG,backend.llm.sql_generator=WARNING"
+- DEBUG 事件按 LOG_DEBUG_SAMPLE_RATE 采样，单条日志可以用 extra={"sample_rate": 0.1} 覆盖
+- 自动附带当前请求的 trace_id
+
+用法：
+    from backend.monitoring.log import get_logger
+    logger = get_logger(__name__)
+    logger.info("AI生成SQL", extra={"sql": sql})
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import traceback
+from typing import Dict, Optional
+
+from backend.config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE, LOG_QUEUE_SIZE
+from backend.monitoring.metrics import LOG_RECORDS_DROPPED
+from backend.monitoring.tracing import current_trace_id
+
+ROOT_LOGGER = "backend"
+
+# LogRecord 自带的属性，其余的都视为 extra 字段输出
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "exception", "trace_id", "sample_rate"}
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """解析 "模块=级别,模块=级别" 格式的配置"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[name.strip()] = value
+    return levels
+
+def _extra_fields(record: logging.LogRecord) -> Dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED and not k.startswith("_")}
+
+class JSONFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        entry.update(_extra_fields(record))
+        if getattr(record, "exception", None):
+            entry["exception"] = record.exception
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """本地调试用的单行文本"""
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S.%f")[:-3]
+        trace = f" [{record.trace_id[:8]}]" if getattr(record, "trace_id", None) else ""
+        fields = " ".join(f"{k}={v}" for k, v in _extra_fields(record).items())
+        line = f"{ts} {record.levelname:<7} {record.name}{trace} {record.getMessage()}"
+        if fields:
+            line += f"  {fields}"
+        if getattr(record, "exception", None):
+            line += "\n" + record.exception
+        return line
+
+class SamplingFilter(logging.Filter):
+    """按比例丢弃 DEBUG 日志"""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1.0 or random.random() < rate
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """在调用线程只做最少的工作：取 trace_id、拼消息，然后入队"""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.trace_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 输出跟不上时丢弃，不让日志拖慢请求
+            LOG_RECORDS_DROPPED.inc()
+
+def setup_logging(force: bool = False):
+    """配置 backend.* 日志（幂等）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JSONFormatter())
+
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _NonBlockingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.handlers = [handler]
+        root.setLevel(parse_levels(f"{ROOT_LOGGER}={LOG_LEVEL}").get(ROOT_LOGGER, logging.INFO))
+        root.propagate = False
+        for name, level in parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        _listener.start()
+
+def shutdown_logging():
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,281 @@
+# backend/monitoring/metrics.py
+"""
+轻量级指标系统（Prometheus 文本格式）
+
+每个指标一把锁，记录一次只是几次字典查找和加法，可以在生产环境常开。
+通过 /api/metrics 暴露，直接用 Prometheus 抓取即可。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 秒级耗时的默认分桶（覆盖 LLM 调用这种长耗时）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+# 毫秒级操作（SQL、渲染、文件写入）的分桶
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.collect())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    """可增可减的瞬时值（队列深度、并发数等）"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track(self, **labels):
+        """进入时 +1，退出时 -1"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    """分桶直方图，记录耗时分布"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数..., +Inf 计数], 总和, 总数
+        self._data: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                data = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._data[key] = data
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文管理器"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        data = self._data.get(self._key(labels))
+        return data[2] if data else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._data.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """指标注册表"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+# 全局注册表
+registry = MetricsRegistry()
+
+# ========== 指标定义 ==========
+# HTTP
+HTTP_IN_FLIGHT = registry.gauge(
+    "fufu_http_requests_in_flight", "正在处理的 HTTP 请求数")
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "fufu_http_request_seconds", "HTTP 请求耗时", ["method", "route", "status"])
+
+# LLM
+LLM_REQUEST_SECONDS = registry.histogram(
+    "fufu_llm_request_seconds", "DeepSeek 调用耗时（按调用点和模型）", ["call_site", "model", "outcome"])
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "fufu_llm_first_token_seconds", "流式调用的首 token 时间", ["call_site", "model"])
+LLM_TOKENS = registry.counter(
+    "fufu_llm_tokens_total", "DeepSeek token 用量（in=提示词, out=生成）", ["call_site", "model", "direction"])
+LLM_PROMPT_CACHE_TOKENS = registry.counter(
+    "fufu_llm_prompt_cache_tokens_total", "提示词 token 的前缀缓存命中情况（hit=命中, miss=未命中）",
+    ["call_site", "model", "result"])
+LLM_RETRIES = registry.counter(
+    "fufu_llm_retries_total", "DeepSeek 调用重试次数", ["call_site", "model", "reason"])
+LLM_CIRCUIT_STATE = registry.gauge(
+    "fufu_llm_circuit_state", "熔断器状态（0=闭合, 1=半开, 2=断开）", ["model"])
+LLM_HEDGES = registry.counter(
+    "fufu_llm_hedges_total", "对冲请求（fired=已发出, won=对冲请求先返回, budget_exhausted=超出预算未发出）",
+    ["call_site", "result"])
+LLM_COALESCED = registry.counter(
+    "fufu_llm_coalesced_total", "与进行中的相同请求合并、没有单独调用上游的次数", ["call_site", "model"])
+
+# 数据库 / 图表 / 渲染 / 记忆
+SQL_EXECUTE_SECONDS = registry.histogram(
+    "fufu_sql_execute_seconds", "SQL 执行耗时", ["sql_type"], buckets=FAST_BUCKETS)
+DB_WRITE_BATCH_SIZE = registry.histogram(
+    "fufu_db_write_batch_size", "单写者队列每次提交包含的语句数", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+DB_WRITE_COMMIT_SECONDS = registry.histogram(
+    "fufu_db_write_commit_seconds", "单写者队列每次提交（COMMIT）的耗时", buckets=FAST_BUCKETS)
+CHART_ANALYSIS_SECONDS = registry.histogram(
+    "fufu_chart_analysis_seconds", "图表分析耗时（含 LLM 调用）")
+MARKDOWN_RENDER_SECONDS = registry.histogram(
+    "fufu_markdown_render_seconds", "Markdown 渲染耗时", buckets=FAST_BUCKETS)
+MEMORY_SAVE_SECONDS = registry.histogram(
+    "fufu_memory_save_seconds", "记忆文件保存耗时", buckets=FAST_BUCKETS)
+
+HTTP_COMPRESSION_BYTES = registry.counter(
+    "fufu_http_compression_bytes_total", "压缩中间件处理的字节数（raw=压缩前, compressed=压缩后）",
+    ["encoding", "stage"])
+
+HEALTH_CHECK_SECONDS = registry.histogram(
+    "fufu_health_check_seconds", "后台健康检查各项耗时", ["check"])
+
+# 准入控制
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "fufu_admission_in_flight", "已获准入、正在处理的 LLM 请求数", ["mode"])
+ADMISSION_QUEUED = registry.gauge(
+    "fufu_admission_queued", "排队等待准入的请求数", ["mode"])
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "fufu_admission_wait_seconds", "等待准入的时间", ["mode"], buckets=FAST_BUCKETS + (10.0, 30.0))
+ADMISSION_REJECTED = registry.counter(
+    "fufu_admission_rejected_total", "未被接纳的请求数（queue_full=429, timeout=503, shed=后台任务丢弃）",
+    ["mode", "reason"])
+
+# 缓存 / 降级 / 后台任务
+CACHE_REQUESTS = registry.counter(
+    "fufu_cache_requests_total", "缓存查询次数", ["cache", "result"])
+FALLBACKS = registry.counter(
+    "fufu_fallback_total", "降级到本地规则的次数", ["kind", "reason"])
+STREAMS_ACTIVE = registry.gauge(
+    "fufu_streams_active", "正在生成的流式输出数（与客户端连接无关）")
+STREAM_RESUMES = registry.counter(
+    "fufu_stream_resumes_total", "流式输出断线重连次数")
+REQUESTS_CANCELLED = registry.counter(
+    "fufu_requests_cancelled_total", "被取消的请求数（disconnect=客户端断开, explicit=取消接口, orphan=流无人接收）",
+    ["mode", "reason"])
+CATALOG_REFRESHES = registry.counter(
+    "fufu_schema_catalog_refreshes_total", "数据库模式目录重新生成次数（initial / ddl / data）", ["reason"])
+HISTORY_COMPACTIONS = registry.counter(
+    "fufu_history_compactions_total", "聊天历史滚动摘要次数", ["outcome"])
+BACKGROUND_EXTRACTION_QUEUE = registry.gauge(
+    "fufu_background_extraction_queue_depth", "排队或正在执行的后台记忆提取任务数")
+LOG_RECORDS_DROPPED = registry.counter(
+    "fufu_log_records_dropped_total", "日志队列已满被丢弃的记录数")
@@ -0,0 +1,238 @@
+# backend/monitoring/tracing.py
+"""
+请求级链路追踪
+
+每个 /api 请求生成一个 trace_id（响应头 X-Trace-Id），路由里的各阶段和每次 LLM 调用
+都包一层 span，记录耗时和属性（模型、提示词长度、行数等）。
+span 结束后交给后台线程导出，不阻塞请求：
+- TRACE_EXPORTER=jsonl  写入本地 JSONL 文件（TRACE_FILE）
+- TRACE_EXPORTER=otlp   以 OTLP/HTTP JSON 格式发送到收集器（TRACE_OTLP_URL）
+- TRACE_EXPORTER=none   只生成 trace_id，不导出（默认）
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from backend.config import TRACE_EXPORTER, TRACE_FILE_PATH, TRACE_OTLP_URL, APP_NAME
+
+SERVICE_NAME = "fufu-backend"
+logger = logging.getLogger(__name__)
+_TRACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """一段计时区间"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _exporter.submit(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+def normalize_trace_id(value: Optional[str]) -> Optional[str]:
+    """校验客户端传入的 trace_id（32 位十六进制），不合法时返回 None"""
+    if value and _TRACE_ID_RE.match(value.lower()):
+        return value.lower()
+    return None
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+def set_attributes(**attributes):
+    """给当前 span 添加属性（没有活动 span 时忽略）"""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+def start_span(name: str, parent: Optional[Span] = None, trace_id: Optional[str] = None, **attributes) -> Span:
+    """
+    创建 span 但不设置为当前 span，需要手动调用 end()
+    适合跨 yield 的异步生成器（流式输出）使用
+    """
+    parent = parent if parent is not None else _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    return Span(name, trace_id or new_trace_id(), None, attributes)
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes):
+    """
+    span 上下文管理器：自动计时、记录异常、设置为当前 span
+    没有活动 trace 时会开启一条新的 trace
+    """
+    current = start_span(name, trace_id=trace_id, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+# ========== 导出 ==========
+class _SpanExporter:
+    """后台线程批量导出 span"""
+    def __init__(self, kind: str, batch_size: int = 128, flush_interval: float = 1.0):
+        self.kind = kind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind in ("jsonl", "otlp")
+
+    def submit(self, item: Span):
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # 导出跟不上时丢弃，保证请求路径不被阻塞
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def flush(self):
+        """导出队列中剩余的 span（进程退出时调用）"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            if self.kind == "jsonl":
+                with open(TRACE_FILE_PATH, "a", encoding="utf-8") as f:
+                    for item in batch:
+                        f.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+            elif self.kind == "otlp":
+                import requests
+                requests.post(TRACE_OTLP_URL, json=to_otlp(batch), timeout=5)
+        except Exception as e:
+            logger.warning("链路追踪导出失败", extra={"error": str(e), "spans": len(batch)})
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(batch: List[Span]) -> Dict[str, Any]:
+    """转换为 OTLP/HTTP JSON 格式"""
+    spans = []
+    for item in batch:
+        entry = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in item.attributes.items()],
+            "status": {"code": 2, "message": item.error or ""} if item.status == "error" else {"code": 1},
+        }
+        if item.parent_id:
+            entry["parentSpanId"] = item.parent_id
+        spans.append(entry)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "service.namespace", "value": {"stringValue": APP_NAME}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "backend.monitoring.tracing"}, "spans": spans}],
+        }]
+    }
+
+_exporter = _SpanExporter(TRACE_EXPORTER)
+atexit.register(_exporter.flush)
@@ -1,4 +1,7 @@
 # backend/utils/__init__.py
 from .helpers import format_time, validate_email, generate_random_id
 from .html_utils import create_sql_html, markdown_to_html, create_error_html
-__all__ = ['format_time', 'validate_email', 'generate_random_id', 'create_sql_html','markdown_to_html', 'create_error_html']
\ No newline at end of file
+from .markdown_renderer import render_markdown, render_cache, IncrementalRenderer
+from .cancellation import Cancelled, CancelToken, cancellations
+__all__ = ['format_time', 'validate_email', 'generate_random_id', 'create_sql_html','markdown_to_html', 'create_error_html',
+           'render_markdown', 'render_cache', 'IncrementalRenderer', 'Cancelled', 'CancelToken', 'cancellations']
\ No newline at end of file
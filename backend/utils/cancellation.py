@@ -0,0 +1,155 @@
+# backend/utils/cancellation.py
+"""
+请求级的协作式取消
+
+每个 /api/chat 请求一个 CancelToken，客户端断开连接（路由里等待 ASGI 的 http.disconnect 消息）
+或调用 POST /api/chat/cancel/{request_id} 时取消。令牌放在 contextvar 中，沿调用链传递：
+- 路由在各阶段之间检查（SQL 生成 → 执行 → 图表分析），取消后跳过后续阶段
+- LLM 调用在发出请求和重试前检查，等待响应时可以被放弃（见 client.chat_completion）
+- SQLite 查询把 connection.interrupt 注册为取消回调，正在执行的语句立即中断
+取消表现为抛出 Cancelled。它继承 BaseException，各调用点的 except Exception 降级逻辑不会吞掉它。
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+class Cancelled(BaseException):
+    """请求已被取消（客户端断开或显式取消）"""
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+class CancelToken:
+    def __init__(self, request_id: str = ""):
+        self.request_id = request_id
+        self.reason: Optional[str] = None
+        self.event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """取消并执行已注册的回调；已经取消过时返回 False"""
+        with self._lock:
+            if self.event.is_set():
+                return False
+            self.reason = reason
+            self.event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消时执行的回调（在调用 cancel 的线程中执行）；已经取消时立即执行"""
+        with self._lock:
+            if not self.event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise Cancelled(self.reason)
+
+    def run(self, func: Callable, *args):
+        """
+        在新线程中执行 func(*args)（沿用当前上下文），等待结果；
+        取消时立即抛出 Cancelled，func 在后台跑完，结果丢弃
+        """
+        self.raise_if_cancelled()
+        future: Future = Future()
+        context = contextvars.copy_context()
+
+        def target():
+            try:
+                future.set_result(context.run(func, *args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        wake = threading.Event()
+        future.add_done_callback(lambda _: wake.set())
+        self.add_callback(wake.set)
+        threading.Thread(target=target, name="cancellable", daemon=True).start()
+        try:
+            wake.wait()
+        finally:
+            self.remove_callback(wake.set)
+        if not future.done():
+            raise Cancelled(self.reason)
+        return future.result()
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+def is_cancelled() -> bool:
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+def raise_if_cancelled():
+    """当前请求已取消时抛出 Cancelled（没有令牌时什么也不做）"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+def sleep(seconds: float):
+    """可以被取消打断的 time.sleep"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    token.event.wait(seconds)
+    token.raise_if_cancelled()
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]):
+    """在 with 块内把 token 设为当前令牌；传入 None 表示块内的工作不受取消影响"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+class CancelRegistry:
+    """进行中请求的令牌（按 request_id），供显式取消接口查找"""
+    def __init__(self):
+        self._tokens: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def create(self, request_id: str) -> CancelToken:
+        token = CancelToken(request_id)
+        with self._lock:
+            self._tokens[request_id] = token
+        return token
+
+    def get(self, request_id: str) -> Optional[CancelToken]:
+        with self._lock:
+            return self._tokens.get(request_id)
+
+    def remove(self, token: CancelToken):
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+cancellations = CancelRegistry()
@@ -1,33 +1,12 @@
 # backend/llm/html_utils.py
-import markdown
+from .markdown_renderer import render_markdown
 
 def markdown_to_html(markdown_text: str) -> str:
     """
     将Markdown转换为HTML，添加自定义样式类
+    （渲染、CSS类注入和缓存见 markdown_renderer）
     """
-    # 扩展Markdown功能
-    extensions = [
-        'fenced_code',      # 代码块
-        'tables',           # 表格
-        'nl2br',            # 换行转换
-        'sane_lists',       # 智能列表
-    ]
-    
-    html = markdown.markdown(markdown_text, extensions=extensions)
-    
-    # 添加自定义CSS类
-    html = html.replace('<table>', '<table class="markdown-table">')
-    html = html.replace('<code>', '<code class="markdown-code">')
-    html = html.replace('<pre>', '<pre class="markdown-pre">')
-    html = html.replace('<ul>', '<ul class="markdown-list">')
-    html = html.replace('<ol>', '<ol class="markdown-list">')
-    html = html.replace('<blockquote>', '<blockquote class="markdown-quote">')
-    
-    # 为h1-h6添加类
-    for i in range(1, 7):
-        html = html.replace(f'<h{i}>', f'<h{i} class="markdown-h{i}">')
-    
-    return f'<div class="markdown-content">{html}</div>'
+    return f'<div class="markdown-content">{render_markdown(markdown_text)}</div>'
 
 def create_sql_html(sql: str, sql_type: str = "查询") -> str:
     """
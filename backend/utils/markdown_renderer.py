@@ -0,0 +1,254 @@
+# backend/utils/markdown_renderer.py
+"""
+Markdown 渲染子系统
+
+- 每个线程每种配置复用一个 Markdown 实例，使用前 reset()，省去每次加载扩展的开销
+  （Markdown 实例不是线程安全的，所以按线程保存）
+- 自定义 CSS 类用一个预编译正则一次性替换，代替逐个标签的 str.replace
+- 相同文本（错误提示、模拟模式回复等）命中 LRU 缓存，键为 (配置, 内容哈希)
+- 流式输出用 IncrementalRenderer：已完成的块只渲染一次，每个增量只重新渲染未完成的尾部块
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from backend.config import RENDER_CACHE_SIZE, RENDER_CACHE_MAX_CHARS
+from backend.monitoring.metrics import MARKDOWN_RENDER_SECONDS, CACHE_REQUESTS
+
+# 各渲染配置：(扩展列表, 是否添加自定义CSS类)
+PROFILES: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+    # 芙芙回复
+    "default": (("fenced_code", "tables", "nl2br", "sane_lists"), True),
+    # 纳西妲的回答和思考过程
+    "nahida_answer": (("fenced_code", "tables", "nl2br"), False),
+    "nahida_reasoning": (("fenced_code", "nl2br"), False),
+}
+
+# 标签 -> 添加的CSS类（只替换没有属性的开标签）
+TAG_CLASSES = {
+    "table": "markdown-table",
+    "code": "markdown-code",
+    "pre": "markdown-pre",
+    "ul": "markdown-list",
+    "ol": "markdown-list",
+    "blockquote": "markdown-quote",
+    **{f"h{i}": f"markdown-h{i}" for i in range(1, 7)},
+}
+_TAG_RE = re.compile(r"<(" + "|".join(TAG_CLASSES) + r")>")
+
+def inject_classes(html: str) -> str:
+    """一次扫描为标签添加自定义CSS类"""
+    return _TAG_RE.sub(lambda m: f'<{m.group(1)} class="{TAG_CLASSES[m.group(1)]}">', html)
+
+_local = threading.local()
+
+def _get_converter(profile: str) -> "markdown.Markdown":
+    converters = getattr(_local, "converters", None)
+    if converters is None:
+        converters = _local.converters = {}
+    converter = converters.get(profile)
+    if converter is None:
+        import markdown  # 第一次渲染时才导入
+        
+        extensions, _ = PROFILES[profile]
+        converter = converters[profile] = markdown.Markdown(extensions=list(extensions))
+    return converter
+
+class RenderCache:
+    """线程安全的 LRU 缓存"""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value: str):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+def _convert(text: str, profile: str) -> str:
+    converter = _get_converter(profile)
+    try:
+        html = converter.convert(text)
+    finally:
+        converter.reset()
+    if PROFILES[profile][1]:
+        html = inject_classes(html)
+    return html
+
+def render_markdown(text: str, profile: str = "default", cache: bool = True) -> str:
+    """
+    渲染 Markdown 片段（不带外层容器）
+    超过 RENDER_CACHE_MAX_CHARS 的长文本不进缓存
+    """
+    with MARKDOWN_RENDER_SECONDS.time():
+        if not cache or RENDER_CACHE_SIZE <= 0 or len(text) > RENDER_CACHE_MAX_CHARS:
+            return _convert(text, profile)
+
+        key = (profile, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        html = render_cache.get(key)
+        if html is not None:
+            CACHE_REQUESTS.inc(cache="markdown", result="hit")
+            return html
+        CACHE_REQUESTS.inc(cache="markdown", result="miss")
+        html = _convert(text, profile)
+        render_cache.put(key, html)
+        return html
+
+# ========== 增量渲染 ==========
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_RE = re.compile(r"^ {0,3}(?:[*+-]|\d{1,9}[.)])\s")
+# 只收到一半的行，还看不出是不是列表项/引用的续行
+_AMBIGUOUS_RE = re.compile(r"^\s*(?:\d{1,9}[.)]?|[*+>-])?$")
+
+def _starts_structure(line: str) -> bool:
+    """line 是否开始一个列表项或引用（可以打断段落的结构）"""
+    return bool(_LIST_RE.match(line)) or line.lstrip().startswith(">")
+
+def _continues(block_first: str, line: str) -> bool:
+    """空行之后的 line 是否仍属于以 block_first 开头的块（缩进续行、松散列表、连续引用）"""
+    if line[:1] in (" ", "\t"):
+        return True
+    if _LIST_RE.match(block_first) and _LIST_RE.match(line):
+        return True
+    return block_first.lstrip().startswith(">") and line.lstrip().startswith(">")
+
+def find_commit_point(text: str) -> int:
+    """
+    返回 text 中已经完整的块的前缀长度（0 表示还没有完整的块）
+    完整的块：后面跟着空行且下一块已经开始的段落/列表/表格，或者已经闭合的代码块
+    空行之后是否接续，按空行前最后一个结构（打断段落的引用或列表，没有时为块的第一行）判断。
+    普通的块分段提交后渲染结果与整体渲染相同；已知的例外：引用定义出现在使用之后的
+    引用式链接（提交时定义还没到达），以及原始 HTML 块之后的空白。
+    """
+    commit = 0
+    offset = 0
+    fence = None            # 当前未闭合代码块的围栏
+    block_first = None      # 当前块的第一行
+    sub_first = None        # 当前块中最后一个结构（引用、列表）的第一行，没有时同 block_first
+    boundary = None         # 候选边界（空行之后的位置）
+    prev_first = None       # 候选边界之前那个结构的第一行
+
+    for line in text.splitlines(keepends=True):
+        complete = line.endswith("\n")
+        stripped = line.strip()
+        end = offset + len(line)
+
+        if fence is not None:
+            if complete and stripped.startswith(fence) and set(stripped) == {fence[0]}:
+                fence = None
+                block_first = sub_first = None
+                commit = end
+            if not complete:
+                break
+            offset = end
+            continue
+
+        if not complete:
+            # 半行：能判断出新块已经开始时，确认前面的边界
+            if boundary is not None and not _AMBIGUOUS_RE.match(line) and not _continues(prev_first, line):
+                commit = boundary
+            break
+
+        if not stripped:
+            if block_first is not None:
+                prev_first, block_first, sub_first = sub_first, None, None
+                boundary = end
+            elif boundary is not None:
+                boundary = end
+            offset = end
+            continue
+
+        if boundary is not None:
+            if _continues(prev_first, line):
+                block_first = sub_first = prev_first
+            else:
+                commit = boundary
+            boundary = None
+        if block_first is None:
+            block_first = sub_first = line
+        elif line[:1] not in (" ", "\t") and _starts_structure(line) and not _continues(sub_first, line):
+            # 打断段落（或切换结构）的引用、列表，空行之后按它判断是否接续
+            sub_first = line
+
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+        offset = end
+
+    return commit
+
+class IncrementalRenderer:
+    """
+    流式 Markdown 增量渲染
+
+    feed() 返回补丁 {"commit": 新完成块的HTML, "tail": 未完成尾部块的HTML}，
+    客户端把 commit 依次用换行拼接，再接上最新的 tail 即为完整 HTML。
+    已提交的块不会再渲染，所以总开销与文本长度线性相关。
+    没有新完成的块时，尾部最多每 min_interval 秒渲染一次。
+    """
+    def __init__(self, profile: str = "default", min_interval: float = 0.05):
+        self.profile = profile
+        self.min_interval = min_interval
+        self.fragments = []
+        self._pending = ""
+        self._last_emit = 0.0
+        self._dirty = False
+
+    @property
+    def html(self) -> str:
+        """已提交部分的HTML"""
+        return "\n".join(self.fragments)
+
+    def _render(self, text: str) -> str:
+        return render_markdown(text, self.profile, cache=False) if text.strip() else ""
+
+    def feed(self, delta: str) -> Optional[Dict[str, str]]:
+        self._pending += delta
+        self._dirty = True
+        commit_html = ""
+        point = find_commit_point(self._pending)
+        if point:
+            commit_html = self._render(self._pending[:point])
+            self._pending = self._pending[point:]
+            if commit_html:
+                self.fragments.append(commit_html)
+
+        now = time.monotonic()
+        if not commit_html and now - self._last_emit < self.min_interval:
+            return None
+        self._last_emit = now
+        self._dirty = False
+        return {"commit": commit_html, "tail": self._render(self._pending)}
+
+    def finish(self) -> Optional[Dict[str, str]]:
+        """提交剩余内容；没有任何变化时返回 None"""
+        if not self._pending and not self._dirty:
+            return None
+        commit_html = self._render(self._pending)
+        self._pending = ""
+        self._dirty = False
+        if commit_html:
+            self.fragments.append(commit_html)
+        return {"commit": commit_html, "tail": ""}
@@ -0,0 +1,75 @@
+# backend/warmup.py
+"""
+启动预热与就绪状态
+
+重量级依赖（pandas、markdown、requests、httpx）都在第一次使用时才导入，服务可以尽快开始
+监听端口。lifespan 启动后在后台线程里执行 warm_up()：加载记忆文件、恢复上次的对话上下文、
+生成数据库模式目录、提前导入这些依赖并初始化 Markdown 渲染器，完成后 /api/ready 才返回 200，
+启动脚本和负载均衡据此判断何时可以转发流量。
+"""
+import importlib
+import threading
+import time
+from typing import Dict, Optional
+
+from backend.monitoring.log import get_logger
+
+logger = get_logger(__name__)
+
+# 预热时提前导入的模块（第一次请求就不用再付导入的开销）
+WARM_MODULES = ("pandas", "requests", "httpx", "backend.llm.chart_analyzer", "backend.llm.focus_mode")
+
+class Readiness:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}  # 阶段 -> 耗时（毫秒）
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {"ready": self.ready, "stages": dict(self.stages), "error": self.error}
+
+    def _stage(self, name: str, func):
+        start = time.perf_counter()
+        func()
+        self.stages[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def warm_up(self):
+        """执行全部预热步骤（阻塞），单个步骤失败不影响就绪"""
+        from backend.database import schema_catalog
+        from backend.llm import memory_manager, restore_saved_context
+        from backend.utils.markdown_renderer import PROFILES, render_markdown
+
+        steps = [
+            ("memory", lambda: (memory_manager.load_memory(), restore_saved_context())),
+            ("schema", schema_catalog.get),
+            ("imports", lambda: [importlib.import_module(name) for name in WARM_MODULES]),
+            ("markdown", lambda: [render_markdown("**warm up**", profile, cache=False) for profile in PROFILES]),
+        ]
+        start = time.perf_counter()
+        for name, func in steps:
+            try:
+                self._stage(name, func)
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                logger.exception("启动预热失败", extra={"stage": name})
+        self._ready.set()
+        logger.info("启动预热完成", extra={
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1), **self.stages
+        })
+
+    def start(self):
+        """在后台线程中预热，不阻塞应用启动"""
+        if self._thread is not None or self.ready:
+            return
+        self._thread = threading.Thread(target=self.warm_up, name="warm-up", daemon=True)
+        self._thread.start()
+
+readiness = Readiness()
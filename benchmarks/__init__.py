@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# 性能测试工具包（数据生成、规模测试等），不参与后端运行
@@ -0,0 +1,331 @@
+# benchmarks/e2e_bench.py
+"""
+端到端性能测试：按模式压测后端 API，记录延迟百分位、首 token 时间、吞吐量和内存
+
+默认会自动启动两个子进程：
+1. 模拟 DeepSeek 服务器（benchmarks/mock_deepseek.py）
+2. 后端服务（DEEPSEEK_API_URL 指向模拟服务器，数据库和记忆文件都使用临时文件，不影响真实数据）
+
+用法：
+    python -m benchmarks.e2e_bench --concurrency 8 --requests 200
+    python -m benchmarks.e2e_bench --scenarios chat,text2sql --concurrency 1,4,16
+    # 压测已经在运行的后端（不启动子进程；传入 --pid 才会记录内存）
+    python -m benchmarks.e2e_bench --base-url http://127.0.0.1:8000 --pid 12345
+
+结果写入 JSON（包含 git 提交号），可以用来对比不同提交的性能。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from backend.database.generator import build_database
+from backend.llm.sql_generator import SQL_TEST_CASES
+from benchmarks.stats import summarize, write_results
+
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+DEFAULT_OUT = Path(__file__).parent / "results" / "e2e_bench.json"
+ALL_SCENARIOS = ["chat", "focus", "text2sql", "stream", "execute_sql", "db_info"]
+
+CHAT_MESSAGES = ["你好呀芙芙", "今天下午吃什么甜点好呢？", "推荐一本治愈系的轻小说吧", "我最近在学Python编程"]
+FOCUS_MESSAGES = ["什么是云计算？", "什么是机器学习？", "解释一下数据库索引的原理", "TCP和UDP有什么区别？"]
+EXECUTE_SQL = [
+    "SELECT college, COUNT(*) AS 人数 FROM students GROUP BY college ORDER BY 人数 DESC",
+    "SELECT * FROM students WHERE grade = '2023级' LIMIT 200",
+    "SELECT major, gender, COUNT(*) AS 人数 FROM students GROUP BY major, gender",
+]
+
+# ========== 内存采样 ==========
+def read_rss_mb(pid: int) -> Optional[float]:
+    """读取进程常驻内存（MB），优先用 psutil，Linux 下退化为读 /proc"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+class RssSampler:
+    """后台周期性采样内存，记录峰值"""
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            value = read_rss_mb(self.pid)
+            if value is not None:
+                self.samples.append(value)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if not self.samples:
+            return {}
+        return {
+            "start_mb": round(self.samples[0], 1),
+            "end_mb": round(self.samples[-1], 1),
+            "peak_mb": round(max(self.samples), 1),
+        }
+
+# ========== 单个请求 ==========
+async def _post_chat(client: httpx.AsyncClient, mode: str, message: str) -> Dict[str, Any]:
+    response = await client.post("/api/chat", json={"message": message, "mode": mode})
+    ok = response.status_code == 200 and response.json().get("success", False)
+    return {"ok": ok, "status": response.status_code, "bytes": len(response.content)}
+
+async def _stream_focus(client: httpx.AsyncClient, message: str) -> Dict[str, Any]:
+    """流式请求：记录首 token 时间（第一个 thinking/answer 事件）"""
+    start = time.perf_counter()
+    ttft = None
+    events = 0
+    ok = True
+    size = 0
+    async with client.stream("POST", "/api/chat/stream", json={"message": message, "mode": "focus"}) as response:
+        if response.status_code != 200:
+            return {"ok": False, "status": response.status_code, "bytes": 0}
+        async for line in response.aiter_lines():
+            size += len(line) + 1
+            if not line.startswith("data: "):
+                continue
+            body = line[6:]
+            if body.strip() == "[DONE]":
+                break
+            try:
+                packet = json.loads(body)
+            except json.JSONDecodeError:
+                continue
+            if packet.get("type") == "error":
+                ok = False
+            elif ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+            events += 1
+    return {"ok": ok, "status": 200, "ttft_ms": ttft, "events": events, "bytes": size}
+
+def _request_factory(scenario: str) -> Callable[[httpx.AsyncClient, int], Any]:
+    """根据场景返回发起第 i 个请求的协程函数"""
+    if scenario == "chat":
+        return lambda c, i: _post_chat(c, "chat", CHAT_MESSAGES[i % len(CHAT_MESSAGES)])
+    if scenario == "focus":
+        return lambda c, i: _post_chat(c, "focus", FOCUS_MESSAGES[i % len(FOCUS_MESSAGES)])
+    if scenario == "text2sql":
+        return lambda c, i: _post_chat(c, "text2sql", SQL_TEST_CASES[i % len(SQL_TEST_CASES)])
+    if scenario == "stream":
+        return lambda c, i: _stream_focus(c, FOCUS_MESSAGES[i % len(FOCUS_MESSAGES)])
+    if scenario == "execute_sql":
+        async def _execute(c, i):
+            response = await c.post("/api/execute-sql", json={"sql": EXECUTE_SQL[i % len(EXECUTE_SQL)]})
+            ok = response.status_code == 200 and response.json().get("success", False)
+            return {"ok": ok, "status": response.status_code, "bytes": len(response.content)}
+        return _execute
+    if scenario == "db_info":
+        async def _db_info(c, i):
+            response = await c.get("/api/db-info")
+            ok = response.status_code == 200 and "error" not in response.json()
+            return {"ok": ok, "status": response.status_code, "bytes": len(response.content)}
+        return _db_info
+    raise ValueError(f"未知的测试场景: {scenario}")
+
+# ========== 场景压测 ==========
+async def run_scenario(base_url: str, scenario: str, concurrency: int, total: int,
+                       timeout: float, pid: Optional[int]) -> Dict[str, Any]:
+    """以固定并发数发起 total 个请求"""
+    make_request = _request_factory(scenario)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    total_bytes = 0
+    counter = iter(range(total))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors, total_bytes
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    result = await make_request(client, i)
+                except Exception as e:
+                    result = {"ok": False, "status": type(e).__name__, "bytes": 0}
+                latencies.append((time.perf_counter() - start) * 1000)
+                key = str(result["status"])
+                statuses[key] = statuses.get(key, 0) + 1
+                total_bytes += result.get("bytes", 0)
+                if not result["ok"]:
+                    errors += 1
+                if result.get("ttft_ms") is not None:
+                    ttfts.append(result["ttft_ms"])
+
+        sampler = RssSampler(pid)
+        sampler.start()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - wall_start
+        rss = await sampler.stop()
+
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "status_codes": statuses,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 3) if wall > 0 else 0.0,
+        "avg_response_bytes": round(total_bytes / total, 1) if total else 0,
+        "latency": summarize(latencies),
+        "rss": rss,
+    }
+    if ttfts:
+        result["ttft"] = summarize(ttfts)
+    return result
+
+# ========== 子进程管理 ==========
+def _wait_until_ready(url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+def start_stack(args, workdir: Path) -> Dict[str, subprocess.Popen]:
+    """启动模拟 LLM 和后端服务"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(PROJECT_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    processes = {}
+    try:
+        _start_processes(args, workdir, env, processes)
+    except BaseException:
+        # 启动到一半失败时结束已经启动的子进程
+        stop_stack(processes)
+        raise
+    return processes
+
+def _start_processes(args, workdir: Path, env: Dict[str, str], processes: Dict[str, subprocess.Popen]):
+    mock_cmd = [sys.executable, "-m", "benchmarks.mock_deepseek",
+                "--port", str(args.mock_port), "--latency", args.mock_latency,
+                "--token-rate", str(args.mock_token_rate), "--error-rate", str(args.mock_error_rate)]
+    # 子进程输出写入日志文件，避免刷屏干扰测试结果（子进程继承了文件描述符，父进程这边启动后即可关闭）
+    with open(workdir / "mock.log", "w", encoding="utf-8") as mock_log:
+        processes["mock"] = subprocess.Popen(mock_cmd, cwd=PROJECT_ROOT, env=env,
+                                             stdout=mock_log, stderr=subprocess.STDOUT)
+    _wait_until_ready(f"http://127.0.0.1:{args.mock_port}/models")
+
+    db_path = build_database(workdir / "bench_students.db", args.db_rows, seed=42)
+    backend_env = dict(env)
+    backend_env.update({
+        "DEEPSEEK_API_KEY": "mock-key",
+        "DEEPSEEK_API_URL": f"http://127.0.0.1:{args.mock_port}/chat/completions",
+        "DB_NAME": str(db_path),
+        "MEMORY_FILE": str(workdir / "bench_memory.json"),
+        "BACKEND_PORT": str(args.backend_port),
+        "WORKERS": str(args.workers),
+        "STATE_BACKEND": "sqlite" if args.workers > 1 else "local",
+        "STATE_DB": str(workdir / "bench_state.db"),
+    })
+    with open(workdir / "backend.log", "w", encoding="utf-8") as backend_log:
+        processes["backend"] = subprocess.Popen(
+            [sys.executable, "-m", "backend.main"], cwd=workdir, env=backend_env,
+            stdout=backend_log, stderr=subprocess.STDOUT
+        )
+    # 等到启动预热完成，避免把依赖导入的耗时算进第一批请求
+    _wait_until_ready(f"http://127.0.0.1:{args.backend_port}/api/ready")
+
+def stop_stack(processes: Dict[str, subprocess.Popen]):
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def run_all(args, base_url: str, pid: Optional[int]) -> List[Dict[str, Any]]:
+    results = []
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    levels = [int(c) for c in str(args.concurrency).split(",") if c.strip()]
+    for scenario in scenarios:
+        for concurrency in levels:
+            print(f"\n▶ 场景 {scenario}，并发 {concurrency}，请求数 {args.requests}")
+            result = await run_scenario(base_url, scenario, concurrency, args.requests, args.timeout, pid)
+            lat = result["latency"]
+            line = (f"  吞吐 {result['throughput_rps']} req/s, 错误 {result['errors']}, "
+                    f"p50={lat.get('p50_ms')}ms p95={lat.get('p95_ms')}ms p99={lat.get('p99_ms')}ms")
+            if "ttft" in result:
+                line += f", TTFT p50={result['ttft']['p50_ms']}ms"
+            if result["rss"]:
+                line += f", RSS 峰值 {result['rss']['peak_mb']}MB"
+            print(line)
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="后端端到端性能测试")
+    parser.add_argument("--scenarios", default=",".join(ALL_SCENARIOS),
+                        help=f"逗号分隔的场景: {','.join(ALL_SCENARIOS)}")
+    parser.add_argument("--concurrency", default="4", help="并发数，可以逗号分隔多个，如 1,4,16")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景每个并发级别的请求数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+    parser.add_argument("--base-url", default=None, help="压测已运行的后端，不启动子进程")
+    parser.add_argument("--pid", type=int, default=None, help="配合 --base-url 使用，记录该进程内存")
+    parser.add_argument("--backend-port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="后端 worker 进程数（大于 1 时使用 sqlite 状态存储，内存只记录主进程）")
+    parser.add_argument("--mock-port", type=int, default=9765)
+    parser.add_argument("--mock-latency", default="lognormal:-1.2,0.6", help="模拟 LLM 的延迟分布")
+    parser.add_argument("--mock-token-rate", type=float, default=200.0, help="模拟 LLM 的输出速度（token/s）")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟 LLM 的错误率")
+    parser.add_argument("--db-rows", type=int, default=10000, help="测试数据库的学生数量")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    params = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+
+    if args.base_url:
+        results = asyncio.run(run_all(args, args.base_url, args.pid))
+    else:
+        with tempfile.TemporaryDirectory(prefix="fufu_bench_") as tmp:
+            processes = start_stack(args, Path(tmp))
+            try:
+                base_url = f"http://127.0.0.1:{args.backend_port}"
+                results = asyncio.run(run_all(args, base_url, processes["backend"].pid))
+            finally:
+                stop_stack(processes)
+
+    out = write_results(args.out, "e2e_bench", params, results)
+    print(f"\n结果已保存到: {out}")
+
+if __name__ == "__main__":
+    main()
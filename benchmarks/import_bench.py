@@ -0,0 +1,131 @@
+# benchmarks/import_bench.py
+"""
+后端冷启动导入耗时测试（基于 python -X importtime）
+
+每轮在全新的子进程中导入 backend.main，解析 importtime 输出：
+- backend.main 的累计导入耗时（取多轮中位数），超过阈值视为回退
+- 启动时不应被导入的重量级依赖（LAZY_MODULES），出现即视为回退
+- 累计耗时最高的模块，方便定位新的慢导入
+
+用法：
+    python -m benchmarks.import_bench                 # 运行并打印结果
+    python -m benchmarks.import_bench --check         # 超过阈值或提前导入了重量级依赖时返回非 0（用于 CI）
+    python -m benchmarks.import_bench --out benchmarks/results/import_bench_baseline.json   # 保存基线
+    python -m benchmarks.import_bench --baseline benchmarks/results/import_bench_baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.stats import summarize, write_results
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_OUT = Path(__file__).parent / "results" / "import_bench.json"
+
+TARGET = "backend.main"
+# backend.main 累计导入耗时上限（毫秒）
+THRESHOLD_MS = 900.0
+# 只允许在第一次使用或启动预热时导入的模块
+LAZY_MODULES = ("pandas", "numpy", "markdown", "requests", "httpx")
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """解析 importtime 输出，返回 模块名 -> (自身耗时, 累计耗时)，单位微秒"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+def measure_once() -> Dict[str, Tuple[int, int]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {TARGET} 失败:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+def run(rounds: int = 5, top: int = 15) -> Dict:
+    totals: List[float] = []
+    last: Dict[str, Tuple[int, int]] = {}
+    for _ in range(rounds):
+        last = measure_once()
+        totals.append(last[TARGET][1] / 1000)
+
+    stats = summarize(totals)
+    eager = [name for name in LAZY_MODULES if name in last]
+    slowest = sorted(last.items(), key=lambda item: item[1][1], reverse=True)
+    backend_modules = [(name, times) for name, times in slowest if name.startswith("backend")]
+
+    print(f"{TARGET} 累计导入耗时: p50={stats['p50_ms']:.1f}ms  min={stats['min_ms']:.1f}ms  "
+          f"(阈值 {THRESHOLD_MS}ms, {rounds} 轮)")
+    print(f"启动时导入的重量级依赖: {', '.join(eager) if eager else '无'}")
+    print(f"\n累计耗时最高的 backend 模块:")
+    for name, (self_us, cumulative_us) in backend_modules[:top]:
+        print(f"  {cumulative_us / 1000:>8.1f}ms  (自身 {self_us / 1000:>6.1f}ms)  {name}")
+    print(f"\n累计耗时最高的第三方模块:")
+    for name, (self_us, cumulative_us) in [item for item in slowest if not item[0].startswith("backend")][:top]:
+        print(f"  {cumulative_us / 1000:>8.1f}ms  (自身 {self_us / 1000:>6.1f}ms)  {name}")
+
+    return {
+        TARGET: {**stats, "threshold_ms": THRESHOLD_MS},
+        "eager_heavy_modules": eager,
+        "module_count": len(last),
+        "backend_modules_ms": {name: round(times[1] / 1000, 1) for name, times in backend_modules[:top]},
+    }
+
+def check(results: Dict, baseline: Optional[Dict], tolerance: float) -> List[str]:
+    """返回所有回退的描述"""
+    failures = []
+    p50 = results[TARGET]["p50_ms"]
+    if p50 > THRESHOLD_MS:
+        failures.append(f"{TARGET}: 导入耗时 {p50}ms 超过阈值 {THRESHOLD_MS}ms")
+    for name in results["eager_heavy_modules"]:
+        failures.append(f"{name} 在启动时被导入（应在第一次使用时导入）")
+    if baseline and TARGET in baseline:
+        previous = baseline[TARGET]["p50_ms"]
+        if previous > 0 and p50 > previous * (1 + tolerance):
+            failures.append(f"{TARGET}: 导入耗时 {p50}ms 比基线 {previous}ms 慢了超过 {tolerance:.0%}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="后端冷启动导入耗时测试")
+    parser.add_argument("--rounds", type=int, default=5, help="测量轮数（每轮一个新进程）")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最高的模块数")
+    parser.add_argument("--check", action="store_true", help="超过阈值或提前导入重量级依赖时以非 0 状态退出")
+    parser.add_argument("--baseline", type=Path, default=None, help="基线结果 JSON，用于相对回退检查")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许变慢的比例")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="结果 JSON 文件路径")
+    args = parser.parse_args()
+    # 结果文件和基线是同一个文件时，每次运行都会覆盖基线
+    if args.baseline and args.baseline.resolve() == args.out.resolve():
+        parser.error("--out 不能和 --baseline 是同一个文件，请用 --out 指定其他路径")
+
+    baseline = None
+    if args.baseline and args.baseline.exists():
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results")
+
+    results = run(args.rounds, args.top)
+    out = write_results(args.out, "import_bench", {"rounds": args.rounds, "target": TARGET}, results)
+    print(f"\n结果已保存到: {out}")
+
+    if args.check or baseline:
+        failures = check(results, baseline, args.tolerance)
+        if failures:
+            print("\n❌ 检测到启动回退：")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        print("\n✅ 启动导入耗时在阈值范围内")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# benchmarks/micro_bench.py
+"""
+CPU 热点函数的微基准测试
+
+覆盖每次请求都会执行的纯 Python 阶段：
+- html_utils.markdown_to_html          （长篇中文 Markdown 回复，分别测未命中和命中渲染缓存）
+- focus_mode._format_nahida_html       （思考过程 + 回答两次渲染）
+- markdown_renderer.IncrementalRenderer （流式输出的增量渲染，每 8 个字符一个增量、不节流）
+- sql_generator._clean_sql_response    （带解释和代码块的混乱 SQL）
+- chart_analyzer._extract_chart_instruction （正则循环）
+- chart_analyzer._infer_column_types   （宽结果集的列类型推断）
+- responses.FastJSONResponse           （宽结果集 JSON 序列化，execute-sql 列式返回）
+
+用法：
+    python -m benchmarks.micro_bench                  # 运行并打印结果
+    python -m benchmarks.micro_bench --check          # 中位数超过阈值时返回非 0（用于 CI）
+    python -m benchmarks.micro_bench --out benchmarks/results/micro_bench_baseline.json
+                                                      # 保存一份基线（与默认结果文件分开）
+    python -m benchmarks.micro_bench --baseline benchmarks/results/micro_bench_baseline.json --tolerance 0.2
+                                                      # 与基线对比，变慢超过 20% 视为回退
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.html_utils import markdown_to_html
+from backend.utils.markdown_renderer import render_cache, IncrementalRenderer
+from backend.llm.focus_mode import _format_nahida_html
+from backend.llm.sql_generator import _clean_sql_response
+from backend.llm.chart_analyzer import _extract_chart_instruction, _infer_column_types
+from backend.api.responses import FastJSONResponse
+from benchmarks.stats import summarize, write_results
+
+DEFAULT_OUT = Path(__file__).parent / "results" / "micro_bench.json"
+
+# 各用例中位数的上限（毫秒），超过即视为性能回退
+THRESHOLDS_MS = {
+    "markdown_to_html/long_reply": 60.0,
+    "markdown_to_html/short_reply": 2.0,
+    "markdown_to_html/cached_repeat": 0.2,
+    "format_nahida_html/long_answer": 90.0,
+    "incremental_render/long_answer_stream": 600.0,
+    "clean_sql_response/messy_fenced": 0.5,
+    "clean_sql_response/long_select": 1.0,
+    "extract_chart_instruction/mixed_inputs": 0.5,
+    "infer_column_types/wide_5000x24": 400.0,
+    "infer_column_types/group_by_result": 5.0,
+    "serialize_result/wide_5000x24": 15.0,
+}
+
+# ========== 测试语料 ==========
+_MD_SECTION = """### 第{i}节：关于舒芙蕾的小小研究 ✨
+
+哼哼，这个问题就交给**本芙芙**吧~ 今天的阳光像刚出炉的舒芙蕾一样松软呢！
+其实呢，做出完美的舒芙蕾需要注意 *温度*、`蛋白打发程度` 和烤箱的预热时间。
+
+1. 先把蛋白打发到**硬性发泡**
+2. 轻轻翻拌，不要消泡哦 🌸
+3. 放入预热好的烤箱
+
+- 甜度是心情的调和剂
+- 配红茶的蛋糕要选口感轻盈的
+  - 比如戚风蛋糕
+  - 或者慕斯
+
+> 这一章的氛围，像泡在温水里一样舒服呢…✨
+
+| 甜点 | 甜度 | 推荐指数 |
+| --- | --- | --- |
+| 舒芙蕾 | 中 | ⭐⭐⭐⭐⭐ |
+| 草莓蛋糕 | 高 | ⭐⭐⭐⭐ |
+| 抹茶慕斯 | 低 | ⭐⭐⭐ |
+
+```python
+def bake(souffle, minutes={i}):
+    oven.preheat(180)
+    return oven.bake(souffle, minutes)
+```
+
+"""
+
+LONG_MARKDOWN = "".join(_MD_SECTION.format(i=i) for i in range(1, 21))
+SHORT_MARKDOWN = "诶？(・_・) 刚才不是才做过自我介绍了吗？你的记性怎么比派蒙还差呀～ **哼！**"
+REASONING_TEXT = ("用户想了解云计算的本质。我需要先用一个璃月的比喻建立直观印象，"
+                  "再给出严谨的技术定义，最后归纳核心步骤。\n\n") * 30
+
+MESSY_SQL = """好的，根据您的需求，我生成了以下SQL查询：
+
+```sql
+-- 统计各学院的人数
+SELECT college AS 学院, COUNT(*) AS 人数
+FROM students
+WHERE grade IN ('2023级', '2024级')
+GROUP BY college
+ORDER BY 人数 DESC
+LIMIT 10;
+```
+
+这条语句会按学院分组统计人数，并按人数降序排列。"""
+
+LONG_SELECT = "```sql\n" + "\n".join(
+    [f"SELECT name, student_id, college, major FROM students WHERE major = '专业{i}'"
+     f" UNION ALL" for i in range(40)]
+) + "\nSELECT name, student_id, college, major FROM students\n```"
+
+CHART_INPUTS = [
+    "统计各学院人数，用柱状图展示，以学院为X轴，人数为Y轴，按降序排序",
+    "查看各专业人数的前5名，画一个饼图，标题是专业分布",
+    "用折线图展示各年级的招生人数变化，横轴是年级",
+    "查询所有男生信息",
+    "散点图，X轴用年级，纵轴是人数，颜色区分学院",
+]
+
+def _stream_render(text: str, step: int = 8):
+    """模拟流式输出：逐个增量喂给增量渲染器"""
+    renderer = IncrementalRenderer("nahida_answer", min_interval=0)
+    for i in range(0, len(text), step):
+        renderer.feed(text[i:i + step])
+    renderer.finish()
+
+def _wide_dataframe(rows: int = 5000, seed: int = 7) -> pd.DataFrame:
+    """模拟宽结果集：数值列、数字字符串、日期字符串、分类列混合，共 24 列"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(6):
+        data[f"num_{i}"] = rng.integers(0, 1000, rows)
+    for i in range(6):
+        data[f"numstr_{i}"] = rng.integers(0, 1000, rows).astype(str)
+    dates = pd.date_range("2022-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M:%S")
+    for i in range(4):
+        data[f"date_{i}"] = dates
+    categories = np.array(["计算机学院", "经管学院", "文学院", "理学院", "医学院"])
+    for i in range(8):
+        data[f"cat_{i}"] = categories[rng.integers(0, len(categories), rows)]
+    return pd.DataFrame(data)
+
+def _sql_result(df: pd.DataFrame) -> Dict:
+    """模拟 execute_safe_sql(rows_format="columns") 的结果：行为 fetchall() 返回的元组"""
+    rows = list(df.itertuples(index=False, name=None))
+    return {"success": True, "columns": list(df.columns), "rows": rows, "error": None,
+            "sql_type": "SELECT", "record_count": len(rows)}
+
+GROUP_BY_RESULT = pd.DataFrame({
+    "college": ["计算机学院", "经管学院", "文学院", "理学院", "医学院", "法学院", "艺术学院"],
+    "人数": [3421, 2312, 1502, 1210, 980, 420, 310],
+})
+
+# ========== 计时工具 ==========
+def bench(func: Callable[[], None], repeat: int, warmup: int = 2,
+          setup: Optional[Callable[[], object]] = None) -> List[float]:
+    """
+    运行 func 多次，返回每次耗时（毫秒）
+    setup 的返回值会作为参数传给 func，且不计入耗时
+    """
+    timings = []
+    for i in range(warmup + repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            timings.append(elapsed)
+    return timings
+
+def _quiet(func: Callable, *args):
+    """屏蔽被测函数中的 print 输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+def _no_date_warnings(func: Callable, *args):
+    """屏蔽日期推断对每一列发出的 "Could not infer format" 警告，刷屏会干扰计时"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return func(*args)
+
+def build_cases() -> Dict[str, Dict]:
+    wide = _wide_dataframe()
+    wide_result = _sql_result(wide)
+    return {
+        # 每次先清空渲染缓存，测的是真实渲染耗时
+        "markdown_to_html/long_reply": {
+            "func": lambda _: markdown_to_html(LONG_MARKDOWN), "setup": render_cache.clear, "repeat": 30,
+        },
+        "markdown_to_html/short_reply": {
+            "func": lambda _: markdown_to_html(SHORT_MARKDOWN), "setup": render_cache.clear, "repeat": 200,
+        },
+        "markdown_to_html/cached_repeat": {
+            "func": lambda: markdown_to_html(SHORT_MARKDOWN), "repeat": 500,
+        },
+        "format_nahida_html/long_answer": {
+            "func": lambda _: _format_nahida_html(REASONING_TEXT, LONG_MARKDOWN), "setup": render_cache.clear,
+            "repeat": 30,
+        },
+        "incremental_render/long_answer_stream": {
+            "func": lambda: _stream_render(LONG_MARKDOWN), "repeat": 5,
+        },
+        "clean_sql_response/messy_fenced": {
+            "func": lambda: _quiet(_clean_sql_response, MESSY_SQL), "repeat": 500,
+        },
+        "clean_sql_response/long_select": {
+            "func": lambda: _quiet(_clean_sql_response, LONG_SELECT), "repeat": 300,
+        },
+        "extract_chart_instruction/mixed_inputs": {
+            "func": lambda: [_extract_chart_instruction(text) for text in CHART_INPUTS], "repeat": 500,
+        },
+        "infer_column_types/wide_5000x24": {
+            "func": lambda df: _no_date_warnings(_infer_column_types, df), "setup": wide.copy, "repeat": 10,
+        },
+        "infer_column_types/group_by_result": {
+            "func": lambda df: _no_date_warnings(_infer_column_types, df), "setup": GROUP_BY_RESULT.copy, "repeat": 200,
+        },
+        "serialize_result/wide_5000x24": {
+            "func": lambda: FastJSONResponse(wide_result), "repeat": 20,
+        },
+    }
+
+def run(selected: Optional[str] = None, scale: float = 1.0) -> Dict[str, Dict]:
+    results = {}
+    for name, case in build_cases().items():
+        if selected and selected not in name:
+            continue
+        repeat = max(3, int(case["repeat"] * scale))
+        timings = bench(case["func"], repeat, setup=case.get("setup"))
+        stats = summarize(timings)
+        stats["threshold_ms"] = THRESHOLDS_MS.get(name)
+        results[name] = stats
+        print(f"{name:<42} p50={stats['p50_ms']:>9.3f}ms  p95={stats['p95_ms']:>9.3f}ms  "
+              f"(阈值 {stats['threshold_ms']}ms)")
+    return results
+
+def check(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]], tolerance: float) -> List[str]:
+    """返回所有性能回退的描述"""
+    failures = []
+    for name, stats in results.items():
+        limit = THRESHOLDS_MS.get(name)
+        if limit is not None and stats["p50_ms"] > limit:
+            failures.append(f"{name}: p50 {stats['p50_ms']}ms 超过阈值 {limit}ms")
+        if baseline and name in baseline:
+            previous = baseline[name]["p50_ms"]
+            if previous > 0 and stats["p50_ms"] > previous * (1 + tolerance):
+                failures.append(f"{name}: p50 {stats['p50_ms']}ms 比基线 {previous}ms 慢了超过 {tolerance:.0%}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU 热点函数微基准测试")
+    parser.add_argument("-k", dest="selected", default=None, help="只运行名称包含该字符串的用例")
+    parser.add_argument("--scale", type=float, default=1.0, help="重复次数缩放系数")
+    parser.add_argument("--check", action="store_true", help="超过阈值时以非 0 状态退出")
+    parser.add_argument("--baseline", type=Path, default=None, help="基线结果 JSON，用于相对回退检查")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许变慢的比例")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="结果 JSON 文件路径")
+    args = parser.parse_args()
+    # 结果文件和基线是同一个文件时，每次运行（包括回退的运行）都会覆盖基线，下一次就和回退后的数据比较了
+    if args.baseline and args.baseline.resolve() == args.out.resolve():
+        parser.error("--out 不能和 --baseline 是同一个文件，请用 --out 指定其他路径")
+
+    baseline = None
+    if args.baseline and args.baseline.exists():
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results")
+
+    results = run(args.selected, args.scale)
+    out = write_results(args.out, "micro_bench", {"scale": args.scale}, results)
+    print(f"\n结果已保存到: {out}")
+
+    if args.check or baseline:
+        failures = check(results, baseline, args.tolerance)
+        if failures:
+            print("\n❌ 检测到性能回退：")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        print("\n✅ 所有用例均在阈值范围内")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+# benchmarks/mock_deepseek.py
+"""
+离线模拟 DeepSeek 服务器（用于压测和无网络环境）
+
+实现 /chat/completions 协议：
+- 普通请求和 stream: true 的 SSE 流式输出（推理模型带 reasoning_content 增量）
+- response_format: json_object
+- 可配置的延迟分布、输出速度（token/s）、错误注入
+- 按提示词类型返回预设的 SQL / 图表配置 / 记忆提取 / 对话摘要 / 聊天 / 深度思考回答
+- usage 中带 prompt_cache_hit_tokens / prompt_cache_miss_tokens（按请求前缀模拟缓存命中）
+
+用法：
+    python -m benchmarks.mock_deepseek --port 9000 --latency lognormal:-1.2,0.6 --token-rate 80
+    # 后端指向模拟服务器
+    DEEPSEEK_API_URL=http://127.0.0.1:9000/chat/completions DEEPSEEK_API_KEY=mock python main.py
+
+所有参数也可以用环境变量设置（MOCK_PORT、MOCK_LATENCY、MOCK_TOKEN_RATE ...）。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ========== 预设回复 ==========
+CHAT_REPLY = """哼哼，这个问题就交给本芙芙吧~ ✨
+
+今天的阳光像刚出炉的舒芙蕾一样松软呢！我们可以：
+
+1. **先喝一杯红茶**，让心情慢慢沉静下来 🌸
+2. 再翻开一本治愈系的轻小说
+3. 最后去甜品店挑一块草莓蛋糕
+
+> 甜度是心情的调和剂哦~ (｡･ω･｡)ﾉ♡
+
+| 时间 | 安排 |
+| --- | --- |
+| 下午三点 | 下午茶 |
+| 傍晚 | 散步 |
+"""
+
+FOCUS_REASONING = """用户想了解这个概念的本质。我需要先用一个须弥或提瓦特的比喻建立直观印象，
+再给出严谨的技术定义，最后归纳核心步骤。比喻要贴切，术语要准确，结构要清晰。"""
+
+FOCUS_ANSWER = """你呀，其实可以把它想象成须弥的**虚空终端**。
+
+### 直观理解
+每个人都能通过终端获取知识，而不必自己建造一座教令院。
+
+### 技术本质
+其原理是把分散的资源**池化**，再按需分配给使用者：
+
+- 资源集中管理
+- 弹性伸缩
+- 高可用性
+
+```python
+def answer(question):
+    return wisdom.lookup(question)
+```
+
+就像叶脉一样，每一条分支都通向同一棵世界树哦。"""
+
+EXTRACTION_REPLY = {
+    "profile": {"name": "旅行者"},
+    "facts": ["用户正在进行性能压测"],
+    "lately_things": ["用户最近在优化后端性能"],
+    "ai_state": ["ai刚刚陪用户做了压力测试"],
+}
+
+SUMMARY_REPLY = "用户和芙芙聊了最近的压力测试和后端性能优化，芙芙陪用户一起喝了红茶、吃了草莓蛋糕，约好测试结束后一起去看歌剧。"
+
+SQL_FALLBACK = "SELECT college, COUNT(*) as 人数 FROM students GROUP BY college ORDER BY 人数 DESC"
+
+PROMPT_MARKERS = [
+    ("sql", "SQL生成助手"),
+    ("chart", "数据可视化助手"),
+    ("extraction", "记忆侧写师"),
+    ("summary", "对话摘要员"),
+]
+
+@dataclass
+class MockConfig:
+    """模拟服务器配置"""
+    latency: str = "lognormal:-1.2,0.6"   # 首 token 延迟分布（秒）
+    token_rate: float = 80.0              # 输出速度（token/s），0 表示不限速
+    chunk_tokens: int = 2                 # 流式输出每个增量包含的 token 数
+    error_rate: float = 0.0               # 错误注入概率
+    error_codes: List[int] = field(default_factory=lambda: [500, 502, 503, 429])
+    timeout_rate: float = 0.0             # 模拟挂起（不返回）的概率
+    hang_seconds: float = 120.0           # 挂起时长
+    retry_after: float = 1.0              # 429/503 返回的 Retry-After
+    cache_block: int = 64                 # 前缀缓存粒度（token）
+    seed: Optional[int] = None
+
+def _env(name: str, default: Any) -> Any:
+    return os.getenv(f"MOCK_{name}", default)
+
+class LatencyModel:
+    """
+    延迟分布，格式为 "类型:参数"：
+    - fixed:0.2           固定 0.2 秒
+    - uniform:0.1,0.5     均匀分布
+    - lognormal:mu,sigma  对数正态分布（长尾，接近真实 LLM 延迟）
+    - exp:0.3             指数分布（均值 0.3 秒）
+    """
+    def __init__(self, spec: str, rng: random.Random):
+        self.rng = rng
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            low, high = (self.params + [0.0, 0.0])[:2]
+            return self.rng.uniform(low, high)
+        if self.kind == "lognormal":
+            mu, sigma = (self.params + [0.0, 0.5])[:2]
+            return self.rng.lognormvariate(mu, sigma)
+        if self.kind == "exp":
+            mean = self.params[0] if self.params else 0.2
+            return self.rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        raise ValueError(f"未知的延迟分布: {self.kind}")
+
+class PrefixCache:
+    """按请求内容前缀模拟 DeepSeek 的上下文硬盘缓存（只统计命中 token 数）"""
+    def __init__(self, block: int, capacity: int = 20000):
+        self.block = max(1, block)
+        self.capacity = capacity
+        self._blocks: "OrderedDict[str, None]" = OrderedDict()
+
+    def lookup(self, text: str) -> int:
+        """返回命中的前缀 token 数，并把本次请求的前缀写入缓存"""
+        hit = 0
+        digest = hashlib.sha1()
+        missed = False
+        for start in range(0, len(text) - len(text) % self.block, self.block):
+            digest.update(text[start:start + self.block].encode("utf-8"))
+            key = digest.hexdigest()
+            if not missed and key in self._blocks:
+                self._blocks.move_to_end(key)
+                hit += self.block
+                continue
+            missed = True
+            self._blocks[key] = None
+            if len(self._blocks) > self.capacity:
+                self._blocks.popitem(last=False)
+        return hit
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文约 1 字 1 token，英文约 4 字符 1 token"""
+    cjk = len(re.findall(r'[一-鿿]', text))
+    return max(1, cjk + (len(text) - cjk) // 4)
+
+def _split_tokens(text: str, chunk_tokens: int) -> List[str]:
+    """把文本切成流式增量（按字符近似 token）"""
+    size = max(1, chunk_tokens)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def classify_prompt(payload: Dict[str, Any]) -> str:
+    """根据系统提示词判断请求来自哪个调用点"""
+    messages = payload.get("messages", [])
+    text = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    for kind, marker in PROMPT_MARKERS:
+        if marker in text:
+            return kind
+    if "reasoner" in str(payload.get("model", "")) or "纳西妲" in text:
+        return "focus"
+    return "chat"
+
+def _last_user_message(payload: Dict[str, Any]) -> str:
+    for message in reversed(payload.get("messages", [])):
+        if message.get("role") == "user":
+            return str(message.get("content", ""))
+    return ""
+
+def _canned_sql(payload: Dict[str, Any]) -> str:
+    """用规则引擎为问题生成一条真实可执行的 SQL"""
+    question = _last_user_message(payload).replace("请为以下问题生成SQL查询：", "")
+    try:
+        from backend.llm.sql_generator import _generate_sql_by_rules
+        sql = _generate_sql_by_rules(question)
+        if sql and not sql.startswith("--"):
+            return sql
+    except Exception:
+        pass
+    return SQL_FALLBACK
+
+def _canned_chart(payload: Dict[str, Any]) -> str:
+    """从提示词里的数据信息中挑选列，返回柱状图配置"""
+    text = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+
+    def _cols(label: str) -> List[str]:
+        match = re.search(label + r"[:：]\s*(\[[^\]]*\])", text)
+        if not match:
+            return []
+        try:
+            return json.loads(match.group(1).replace("'", '"'))
+        except json.JSONDecodeError:
+            return []
+
+    columns = _cols("数据列")
+    numeric = _cols("数值列")
+    categorical = _cols("分类列")
+    x_axis = categorical[0] if categorical else (columns[0] if columns else "college")
+    y_axis = numeric[0] if numeric else (columns[-1] if columns else "人数")
+    return json.dumps({
+        "chart_type": "bar_chart",
+        "x_axis": x_axis,
+        "y_axis": y_axis,
+        "title": f"{y_axis} 按 {x_axis} 统计",
+        "orientation": "vertical",
+    }, ensure_ascii=False)
+
+def _ensure_json(content: str) -> str:
+    """response_format 为 json_object 时，保证返回内容是合法 JSON"""
+    try:
+        json.loads(content)
+        return content
+    except json.JSONDecodeError:
+        return json.dumps({"content": content}, ensure_ascii=False)
+
+def build_reply(kind: str, payload: Dict[str, Any]) -> Tuple[str, str]:
+    """返回 (reasoning_content, content)"""
+    if kind == "sql":
+        return "", _canned_sql(payload)
+    if kind == "chart":
+        return "", _canned_chart(payload)
+    if kind == "extraction":
+        return "", json.dumps(EXTRACTION_REPLY, ensure_ascii=False)
+    if kind == "summary":
+        return "", SUMMARY_REPLY
+    if kind == "focus":
+        return FOCUS_REASONING, FOCUS_ANSWER
+    return "", CHAT_REPLY
+
+class MockDeepSeek:
+    """模拟服务器的状态（随机数、缓存、统计）"""
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.latency = LatencyModel(config.latency, self.rng)
+        self.cache = PrefixCache(config.cache_block)
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "hangs": 0, "by_kind": {}}
+
+    def _usage(self, payload: Dict[str, Any], reasoning: str, content: str) -> Dict[str, int]:
+        prompt_text = json.dumps(payload.get("messages", []), ensure_ascii=False)
+        prompt_tokens = _estimate_tokens(prompt_text)
+        hit = min(self.cache.lookup(prompt_text), prompt_tokens)
+        completion = _estimate_tokens(reasoning + content) if (reasoning or content) else 0
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion,
+            "total_tokens": prompt_tokens + completion,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": prompt_tokens - hit,
+        }
+        if reasoning:
+            usage["completion_tokens_details"] = {"reasoning_tokens": _estimate_tokens(reasoning)}
+        return usage
+
+    def _generation_seconds(self, text: str) -> float:
+        if self.config.token_rate <= 0:
+            return 0.0
+        return _estimate_tokens(text) / self.config.token_rate
+
+    async def _maybe_fail(self) -> Optional[JSONResponse]:
+        """按配置注入错误或挂起"""
+        roll = self.rng.random()
+        if roll < self.config.timeout_rate:
+            self.stats["hangs"] += 1
+            await asyncio.sleep(self.config.hang_seconds)
+        if self.rng.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            code = self.rng.choice(self.config.error_codes)
+            headers = {}
+            if code in (429, 503):
+                headers["Retry-After"] = str(self.config.retry_after)
+            return JSONResponse(
+                status_code=code,
+                content={"error": {"message": f"mock injected error {code}", "type": "mock_error"}},
+                headers=headers,
+            )
+        return None
+
+    async def completions(self, payload: Dict[str, Any]):
+        self.stats["requests"] += 1
+        kind = classify_prompt(payload)
+        self.stats["by_kind"][kind] = self.stats["by_kind"].get(kind, 0) + 1
+
+        failure = await self._maybe_fail()
+        if failure is not None:
+            return failure
+
+        reasoning, content = build_reply(kind, payload)
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            content = _ensure_json(content)
+        model = payload.get("model", "deepseek-chat")
+        if "reasoner" not in model:
+            reasoning = ""
+
+        if payload.get("stream"):
+            self.stats["streams"] += 1
+            return StreamingResponse(
+                self._stream(payload, model, reasoning, content),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(self.latency.sample() + self._generation_seconds(reasoning + content))
+        message = {"role": "assistant", "content": content}
+        if reasoning:
+            message["reasoning_content"] = reasoning
+        return JSONResponse({
+            "id": f"mock-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": self._usage(payload, reasoning, content),
+        })
+
+    async def _stream(self, payload: Dict[str, Any], model: str, reasoning: str, content: str):
+        completion_id = f"mock-{uuid.uuid4().hex}"
+        created = int(time.time())
+        per_chunk = self.config.chunk_tokens / self.config.token_rate if self.config.token_rate > 0 else 0.0
+
+        def _chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(self.latency.sample())
+        yield _chunk({"role": "assistant", "content": ""})
+        for piece in _split_tokens(reasoning, self.config.chunk_tokens):
+            if per_chunk:
+                await asyncio.sleep(per_chunk)
+            yield _chunk({"reasoning_content": piece, "content": None})
+        for piece in _split_tokens(content, self.config.chunk_tokens):
+            if per_chunk:
+                await asyncio.sleep(per_chunk)
+            yield _chunk({"content": piece})
+        yield _chunk({}, finish="stop")
+
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": self._usage(payload, reasoning, content),
+            }
+            yield f"data: {json.dumps(usage_chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+def create_app(config: MockConfig) -> FastAPI:
+    """创建模拟服务器应用"""
+    app = FastAPI(title="Mock DeepSeek", version="1.0.0")
+    mock = MockDeepSeek(config)
+    app.state.mock = mock
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        return await mock.completions(payload)
+
+    @app.get("/models")
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [
+            {"id": "deepseek-chat", "object": "model", "owned_by": "mock"},
+            {"id": "deepseek-reasoner", "object": "model", "owned_by": "mock"},
+        ]}
+
+    @app.get("/mock/stats")
+    async def stats():
+        return mock.stats
+
+    return app
+
+def parse_args(argv=None) -> Tuple[argparse.Namespace, MockConfig]:
+    parser = argparse.ArgumentParser(description="离线模拟 DeepSeek 服务器")
+    parser.add_argument("--host", default=_env("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(_env("PORT", "9000")))
+    parser.add_argument("--latency", default=_env("LATENCY", MockConfig.latency),
+                        help="首 token 延迟分布，如 fixed:0.2 / uniform:0.1,0.5 / lognormal:-1.2,0.6 / exp:0.3")
+    parser.add_argument("--token-rate", type=float, default=float(_env("TOKEN_RATE", MockConfig.token_rate)))
+    parser.add_argument("--chunk-tokens", type=int, default=int(_env("CHUNK_TOKENS", MockConfig.chunk_tokens)))
+    parser.add_argument("--error-rate", type=float, default=float(_env("ERROR_RATE", MockConfig.error_rate)))
+    parser.add_argument("--error-codes", default=_env("ERROR_CODES", "500,502,503,429"))
+    parser.add_argument("--timeout-rate", type=float, default=float(_env("TIMEOUT_RATE", MockConfig.timeout_rate)))
+    parser.add_argument("--hang-seconds", type=float, default=float(_env("HANG_SECONDS", MockConfig.hang_seconds)))
+    parser.add_argument("--retry-after", type=float, default=float(_env("RETRY_AFTER", MockConfig.retry_after)))
+    # 字符串默认值会经过 type=int 转换；只有没设置 MOCK_SEED 时才是 None（不固定种子），MOCK_SEED=0 也是合法种子
+    parser.add_argument("--seed", type=int, default=_env("SEED", None))
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        chunk_tokens=args.chunk_tokens,
+        error_rate=args.error_rate,
+        error_codes=[int(c) for c in str(args.error_codes).split(",") if c.strip()],
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    return args, config
+
+def main(argv=None):
+    args, config = parse_args(argv)
+    print("=" * 50)
+    print(f"模拟 DeepSeek 服务器: http://{args.host}:{args.port}/chat/completions")
+    print(f"延迟分布: {config.latency}, 输出速度: {config.token_rate} token/s, 错误率: {config.error_rate}")
+    print("=" * 50)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/scale_harness.py
+"""
+规模测试：在不同数据量的学生库上运行 test_sql_generation 的问题集，记录延迟百分位
+
+用法：
+    python -m benchmarks.scale_harness --scales 1000,10000,100000 --repeat 20
+    python -m benchmarks.scale_harness --scales 10000000 --repeat 3 --out benchmarks/results/scale_10m.json
+
+每个规模的数据库按 (规模, 种子) 缓存到 --data-dir 下，重复运行不会重新生成。
+INSERT/UPDATE/DELETE 在事务中执行后回滚，不会改变测试数据。
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from backend.database.generator import build_database
+from backend.llm.sql_generator import SQL_TEST_CASES, generate_sql_with_ai
+from benchmarks.stats import summarize, write_results
+
+DEFAULT_SCALES = "1000,10000,100000,1000000"
+DEFAULT_DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_OUT = Path(__file__).parent / "results" / "scale_harness.json"
+
+def _prepare_database(data_dir: Path, scale: int, seed: int, rebuild: bool) -> Dict:
+    """生成（或复用）指定规模的数据库"""
+    db_path = data_dir / f"students_{scale}_{seed}.db"
+    start = time.perf_counter()
+    build_database(db_path, scale, seed=seed, overwrite=rebuild)
+    elapsed = time.perf_counter() - start
+    return {"path": db_path, "build_seconds": round(elapsed, 3)}
+
+def _run_query(conn: sqlite3.Connection, sql: str) -> Dict:
+    """执行一次SQL，返回各阶段耗时（毫秒）"""
+    is_select = sql.strip().upper().startswith(("SELECT", "WITH"))
+
+    start = time.perf_counter()
+    cursor = conn.execute(sql)
+    rows = cursor.fetchall() if is_select else []
+    execute_ms = (time.perf_counter() - start) * 1000
+
+    dataframe_ms = 0.0
+    if is_select:
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        start = time.perf_counter()
+        pd.DataFrame(rows, columns=columns)
+        dataframe_ms = (time.perf_counter() - start) * 1000
+    else:
+        conn.rollback()
+
+    return {"execute_ms": execute_ms, "dataframe_ms": dataframe_ms, "rows": len(rows)}
+
+def run_scale(db_path: Path, repeat: int) -> List[Dict]:
+    """在一个数据库上跑完整个问题集"""
+    results = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for question in SQL_TEST_CASES:
+            generate_ms: List[float] = []
+            execute_ms: List[float] = []
+            dataframe_ms: List[float] = []
+            row_count = 0
+            sql = ""
+            error = None
+
+            for _ in range(repeat):
+                start = time.perf_counter()
+                sql = generate_sql_with_ai(question)
+                generate_ms.append((time.perf_counter() - start) * 1000)
+
+                try:
+                    timing = _run_query(conn, sql)
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    error = str(e)
+                    break
+                execute_ms.append(timing["execute_ms"])
+                dataframe_ms.append(timing["dataframe_ms"])
+                row_count = timing["rows"]
+
+            results.append({
+                "question": question,
+                "sql": sql,
+                "rows": row_count,
+                "error": error,
+                "generate": summarize(generate_ms),
+                "execute": summarize(execute_ms),
+                "dataframe": summarize(dataframe_ms),
+            })
+    finally:
+        conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="学生库规模测试")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="逗号分隔的数据规模，例如 1000,10000,100000")
+    parser.add_argument("--seed", type=int, default=42, help="数据生成随机种子")
+    parser.add_argument("--repeat", type=int, default=10, help="每个问题的重复次数")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="测试数据库存放目录")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="结果 JSON 文件路径")
+    parser.add_argument("--rebuild", action="store_true", help="强制重新生成测试数据库")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    all_results = []
+
+    for scale in scales:
+        print(f"\n===== 规模: {scale} 条学生记录 =====")
+        db_info = _prepare_database(args.data_dir, scale, args.seed, args.rebuild)
+        print(f"数据库: {db_info['path']} (生成耗时 {db_info['build_seconds']}s)")
+
+        query_results = run_scale(db_info["path"], args.repeat)
+        for item in query_results:
+            if item["error"]:
+                print(f"  ❌ {item['question']}: {item['error']}")
+                continue
+            ex = item["execute"]
+            print(f"  {item['question']}: rows={item['rows']} "
+                  f"p50={ex['p50_ms']}ms p95={ex['p95_ms']}ms p99={ex['p99_ms']}ms")
+
+        all_results.append({
+            "scale": scale,
+            "build_seconds": db_info["build_seconds"],
+            "queries": query_results,
+        })
+
+    out = write_results(args.out, "scale_harness", {
+        "scales": scales, "seed": args.seed, "repeat": args.repeat,
+    }, all_results)
+    print(f"\n结果已保存到: {out}")
+
+if __name__ == "__main__":
+    main()
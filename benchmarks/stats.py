@@ -0,0 +1,66 @@
+# benchmarks/stats.py
+"""
+性能测试通用的统计和结果输出工具
+"""
+import json
+import math
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """计算百分位数（线性插值，p 取 0~100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * p / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    """汇总一组延迟数据（单位：毫秒）"""
+    if not values_ms:
+        return {"count": 0}
+    return {
+        "count": len(values_ms),
+        "mean_ms": round(sum(values_ms) / len(values_ms), 3),
+        "min_ms": round(min(values_ms), 3),
+        "p50_ms": round(percentile(values_ms, 50), 3),
+        "p95_ms": round(percentile(values_ms, 95), 3),
+        "p99_ms": round(percentile(values_ms, 99), 3),
+        "max_ms": round(max(values_ms), 3),
+    }
+
+def git_revision() -> str:
+    """获取当前 git 提交号，方便对比不同提交的测试结果"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+def write_results(path: Path, benchmark: str, params: Dict[str, Any], results: Any) -> Path:
+    """把测试结果写成 JSON 文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": benchmark,
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,151 @@
+# benchmarks/trace_collector.py
+"""
+OTLP 收集器替身 + 链路时间线查看
+
+后端设置 TRACE_EXPORTER=otlp 后会把 span 以 OTLP/HTTP JSON 格式发到 /v1/traces，
+这里接收后转换成和 TRACE_EXPORTER=jsonl 相同的 JSONL 格式落盘。
+
+用法：
+    python -m benchmarks.trace_collector serve --port 4318 --out traces.jsonl
+    python -m benchmarks.trace_collector show traces.jsonl                 # 最近 5 条 trace
+    python -m benchmarks.trace_collector show traces.jsonl --trace <trace_id>
+"""
+import argparse
+import json
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+import uvicorn
+
+def _attribute_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return value["doubleValue"]
+    if "boolValue" in value:
+        return value["boolValue"]
+    return value.get("stringValue")
+
+def otlp_to_records(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """OTLP/HTTP JSON 转换为 JSONL 记录"""
+    records = []
+    for resource_spans in body.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for item in scope_spans.get("spans", []):
+                start_ns = int(item["startTimeUnixNano"])
+                end_ns = int(item["endTimeUnixNano"])
+                status = item.get("status", {})
+                records.append({
+                    "trace_id": item["traceId"],
+                    "span_id": item["spanId"],
+                    "parent_id": item.get("parentSpanId"),
+                    "name": item["name"],
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    "attributes": {a["key"]: _attribute_value(a["value"]) for a in item.get("attributes", [])},
+                    "status": "error" if status.get("code") == 2 else "ok",
+                    "error": status.get("message") or None,
+                })
+    return records
+
+def create_app(out: Path) -> FastAPI:
+    app = FastAPI(title="Trace Collector")
+    lock = threading.Lock()
+    stats = {"spans": 0}
+
+    @app.post("/v1/traces")
+    async def receive(request: Request):
+        records = otlp_to_records(await request.json())
+        with lock, open(out, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stats["spans"] += len(records)
+        return {"partialSuccess": {}}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+# ========== 时间线 ==========
+def load_traces(path: Path) -> Dict[str, List[Dict[str, Any]]]:
+    traces = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                traces[record["trace_id"]].append(record)
+    return traces
+
+def format_timeline(spans: List[Dict[str, Any]], width: int = 40) -> str:
+    """把一条 trace 渲染成带缩进和时间条的文本时间线"""
+    spans = sorted(spans, key=lambda s: s["start_ns"])
+    ids = {s["span_id"] for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for s in spans:
+        if s["parent_id"] and s["parent_id"] in ids:
+            children[s["parent_id"]].append(s)
+        else:
+            roots.append(s)
+
+    begin = spans[0]["start_ns"]
+    total = max(max(s["end_ns"] for s in spans) - begin, 1)
+    lines = [f"trace {spans[0]['trace_id']}  共 {total / 1e6:.1f}ms  {len(spans)} 个 span"]
+
+    def walk(node, depth):
+        offset = int((node["start_ns"] - begin) / total * width)
+        length = max(1, int((node["end_ns"] - node["start_ns"]) / total * width))
+        bar = " " * offset + "█" * min(length, width - offset)
+        mark = " ❌" if node["status"] == "error" else ""
+        attrs = " ".join(f"{k}={v}" for k, v in node["attributes"].items()
+                         if not k.startswith("http."))
+        label = ("  " * depth + node["name"])[:44]
+        lines.append(f"{label:<44} |{bar:<{width}}| {node['duration_ms']:>9.1f}ms{mark}  {attrs}")
+        for child in children[node["span_id"]]:
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="OTLP 收集器替身与时间线查看")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="启动收集器")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=4318)
+    serve.add_argument("--out", type=Path, default=Path("traces.jsonl"))
+
+    show = sub.add_parser("show", help="打印时间线")
+    show.add_argument("path", type=Path)
+    show.add_argument("--trace", default=None, help="只显示指定 trace_id")
+    show.add_argument("--last", type=int, default=5, help="显示最近 N 条 trace")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        print(f"收集器已启动: http://{args.host}:{args.port}/v1/traces -> {args.out}")
+        uvicorn.run(create_app(args.out), host=args.host, port=args.port, log_level="warning")
+        return
+
+    traces = load_traces(args.path)
+    if args.trace:
+        selected = [traces[args.trace]] if args.trace in traces else []
+    else:
+        ordered = sorted(traces.values(), key=lambda spans: min(s["start_ns"] for s in spans))
+        selected = ordered[-args.last:]
+    if not selected:
+        print("没有找到 trace")
+    for spans in selected:
+        print(format_timeline(spans))
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/write_bench.py
+"""
+并发写入测试：同时向 /api/execute-sql 发送 INSERT，检查组提交是否生效
+
+在临时生成的学生库上运行（不会改动 students.db），通过 ASGI 直接调用应用，
+统计写线程的提交次数和平均每次提交包含的语句数。并发写入应该合并进同一次提交；
+如果每次提交只有一条语句，说明写入路径阻塞了事件循环或绕开了写队列。
+
+用法：
+    python -m benchmarks.write_bench                        # 运行并打印结果
+    python -m benchmarks.write_bench --check                # 平均每次提交不足 --min-batch 条语句时返回非 0（用于 CI）
+    python -m benchmarks.write_bench --concurrency 64 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.stats import summarize, write_results
+
+DEFAULT_OUT = Path(__file__).parent / "results" / "write_bench.json"
+
+async def _run_round(client, concurrency: int, offset: int) -> List[float]:
+    """同时发出 concurrency 条 INSERT，返回每个请求的延迟（毫秒）"""
+    async def insert(i: int) -> float:
+        sql = (f"INSERT INTO students (name, student_id, gender) "
+               f"VALUES ('压测{i}', 'WB{offset + i:08d}', '男')")
+        start = time.perf_counter()
+        response = await client.post("/api/execute-sql", json={"sql": sql})
+        elapsed = (time.perf_counter() - start) * 1000
+        body = response.json()
+        if response.status_code != 200 or not body.get("success"):
+            raise RuntimeError(f"写入失败: {response.status_code} {body}")
+        return elapsed
+
+    return list(await asyncio.gather(*(insert(i) for i in range(concurrency))))
+
+async def _run(concurrency: int, rounds: int) -> Dict:
+    import httpx
+    from backend.main import app
+    from backend.database.writer import db_writer
+    from backend.monitoring.metrics import DB_WRITE_BATCH_SIZE
+
+    commits_before = DB_WRITE_BATCH_SIZE.count()
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for r in range(rounds):
+            latencies.extend(await _run_round(client, concurrency, r * concurrency))
+    db_writer.close()
+
+    statements = concurrency * rounds
+    commits = DB_WRITE_BATCH_SIZE.count() - commits_before
+    return {
+        "statements": statements,
+        "commits": commits,
+        "mean_batch_size": round(statements / commits, 2) if commits else 0.0,
+        "latency": summarize(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="并发写入与组提交测试")
+    parser.add_argument("--concurrency", type=int, default=40, help="每轮同时发出的 INSERT 数")
+    parser.add_argument("--rounds", type=int, default=3, help="轮数")
+    parser.add_argument("--rows", type=int, default=1000, help="临时学生库的初始行数")
+    parser.add_argument("--check", action="store_true", help="平均每次提交的语句数不足 --min-batch 时以非 0 状态退出")
+    parser.add_argument("--min-batch", type=float, default=2.0, help="平均每次提交至少包含的语句数")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "students.db"
+        # 必须在导入 backend 之前指定数据库，读写连接都从 backend.config 取路径
+        os.environ["DB_NAME"] = str(db_path)
+        from backend.database.generator import build_database
+        build_database(db_path, args.rows, seed=42)
+        result = asyncio.run(_run(args.concurrency, args.rounds))
+
+    print(f"语句数 {result['statements']}，提交次数 {result['commits']}，"
+          f"平均每次提交 {result['mean_batch_size']} 条")
+    latency = result["latency"]
+    print(f"请求延迟 p50={latency['p50_ms']}ms  p95={latency['p95_ms']}ms  max={latency['max_ms']}ms")
+
+    params = {"concurrency": args.concurrency, "rounds": args.rounds, "rows": args.rows}
+    out = write_results(args.out, "write_bench", params, result)
+    print(f"\n结果已保存到: {out}")
+
+    if args.check:
+        if result["mean_batch_size"] < args.min_batch:
+            print(f"\n❌ 并发写入没有合并提交：平均每次提交 {result['mean_batch_size']} 条，"
+                  f"要求至少 {args.min_batch} 条")
+            sys.exit(1)
+        print("\n✅ 并发写入共享提交")
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,6 @@ import uvicorn
 import os
 import sys
 
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # 修复 Windows 控制台编码问题
 import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
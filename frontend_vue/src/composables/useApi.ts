@@ -3,21 +3,39 @@ import type { ApiResponse, StreamData } from '@/types'
 
 const API_BASE_URL = 'http://127.0.0.1:8000/api'
 
+// 列式结果（columns + rows）还原为图表和表格使用的字典列表
+const toRecords = (columns: string[], rows: any[][]) =>
+  rows.map((row) => Object.fromEntries(columns.map((column, i) => [column, row[i]])))
+
+// 服务端准入控制返回 429/503 时，按 Retry-After 提示用户稍后重试
+const busyMessage = (response: Response | null | undefined) => {
+  if (!response || (response.status !== 429 && response.status !== 503)) return null
+  const retryAfter = response.headers.get('Retry-After') || '几'
+  return `服务繁忙，请 ${retryAfter} 秒后重试`
+}
+
 export function useChatApi() {
   // 发送普通聊天消息
+  // 只请求界面实际渲染的 HTML，查询结果用列式格式传输，减少响应体积
   const sendChatMessage = async (message: string, mode: string) => {
-    const { data, error } = await useFetch(`${API_BASE_URL}/chat`)
+    const { data, error, response: rawResponse } = await useFetch(`${API_BASE_URL}/chat`)
       .post({
         message,
         mode,
+        format: 'html',
+        rows_format: 'columns',
       })
       .json()
 
     if (error.value) {
-      throw new Error(error.value)
+      throw new Error(busyMessage(rawResponse.value) ?? error.value)
     }
 
-    return data.value as ApiResponse
+    const response = data.value as ApiResponse
+    if (response.columns && response.rows) {
+      response.data = toRecords(response.columns, response.rows)
+    }
+    return response
   }
 
   const sendChatStream = async (
@@ -30,26 +48,13 @@ export function useChatApi() {
   ) => {
     console.log('开始发送流式请求:', { message, mode, sessionId }) // 添加调试信息
 
-    try {
-      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          Accept: 'text/event-stream',
-        },
-        body: JSON.stringify({
-          message,
-          mode,
-          session_id: sessionId,
-        }),
-      })
-
-      console.log('收到响应:', response.status, response.statusText) // 添加调试信息
-
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`)
-      }
+    // 服务端在 X-Stream-Id 中返回流 id，每个事件带 id；连接中断时用 Last-Event-ID 续传，不会重新生成
+    let streamId: string | null = null
+    let lastEventId = ''
+    let retries = 0
 
+    // 读取一段响应，收到 [DONE] 返回 true，连接提前结束返回 false
+    const readStream = async (response: Response) => {
       const reader = response.body?.getReader()
       const decoder = new TextDecoder('utf-8')
       let buffer = ''
@@ -60,7 +65,7 @@ export function useChatApi() {
 
       while (true) {
         const { done, value } = await reader.read()
-        if (done) break
+        if (done) return false
 
         buffer += decoder.decode(value, { stream: true })
 
@@ -68,13 +73,15 @@ export function useChatApi() {
         buffer = lines.pop() || ''
 
         for (const line of lines) {
-          if (line.startsWith('data: ')) {
+          if (line.startsWith('id: ')) {
+            lastEventId = line.slice(4).trim()
+            retries = 0
+          } else if (line.startsWith('data: ')) {
             const jsonStr = line.slice(6)
 
             if (jsonStr.trim() === '[DONE]') {
               console.log('流式响应结束') // 添加调试信息
-              onDone()
-              return
+              return true
             }
 
             try {
@@ -86,6 +93,52 @@ export function useChatApi() {
           }
         }
       }
+    }
+
+    try {
+      let response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Accept: 'text/event-stream',
+        },
+        body: JSON.stringify({
+          message,
+          mode,
+          session_id: sessionId,
+          format: 'html', // 只接收服务端增量渲染的 html_patch 事件
+        }),
+      })
+
+      console.log('收到响应:', response.status, response.statusText) // 添加调试信息
+
+      if (!response.ok) {
+        throw new Error(busyMessage(response) ?? `HTTP error! status: ${response.status}`)
+      }
+      streamId = response.headers.get('X-Stream-Id')
+
+      while (true) {
+        try {
+          if (await readStream(response)) break
+          if (!streamId) break // 旧版后端不支持续传
+        } catch (error) {
+          if (!streamId) throw error
+        }
+        if (retries >= 3) {
+          throw new Error('流式连接多次中断，已停止续传')
+        }
+
+        // 连接中断：等一会儿后从最后收到的事件继续
+        retries += 1
+        console.warn(`流式连接中断，第 ${retries} 次续传`, { streamId, lastEventId })
+        await new Promise((resolve) => setTimeout(resolve, 500 * retries))
+        response = await fetch(`${API_BASE_URL}/chat/stream/${streamId}`, {
+          headers: { Accept: 'text/event-stream', 'Last-Event-ID': lastEventId },
+        })
+        if (!response.ok) {
+          throw new Error(`续传失败，status: ${response.status}`)
+        }
+      }
 
       console.log('流式读取完成') // 添加调试信息
       onDone()
@@ -53,6 +53,20 @@ export function useChat() {
 
     let fullThinking = ''
     let fullAnswer = ''
+    // 服务端增量渲染：已完成块的 HTML 只追加一次，尾部每次整体替换
+    const committed: Record<'thinking' | 'answer', string[]> = { thinking: [], answer: [] }
+    const tails: Record<'thinking' | 'answer', string> = { thinking: '', answer: '' }
+    const patchedHtml = (target: 'thinking' | 'answer') =>
+      [...committed[target], tails[target]].filter(Boolean).join('\n')
+    // 在已有回答后面追加错误信息（有服务端 HTML 时追加到 HTML，否则回退到原始文本渲染）
+    const showError = (errorHtml: string) => {
+      const partial = patchedHtml('answer')
+      updateMessage(messageId, {
+        content: (fullAnswer || '') + errorHtml,
+        type: 'answer',
+        answer_html: partial ? partial + errorHtml : '',
+      })
+    }
 
     await sendChatStream(
       text,
@@ -72,31 +86,37 @@ export function useChat() {
             content: fullAnswer,
             type: 'answer',
           })
-        } else if (data.type === 'error') {
+        } else if (data.type === 'html_patch' && data.target) {
+          if (data.commit) committed[data.target].push(data.commit)
+          tails[data.target] = data.tail || ''
           updateMessage(messageId, {
-            content:
-              (fullAnswer || '') + `<br><span style="color:red">[错误: ${data.content}]</span>`,
+            [data.target === 'thinking' ? 'thinking_html' : 'answer_html']: patchedHtml(data.target),
             type: 'answer',
           })
+        } else if (data.type === 'error') {
+          showError(`<br><span style="color:red">[错误: ${data.content}]</span>`)
         }
 
         scrollToBottom()
       },
       () => {
-        if (!fullAnswer) {
+        const answerHtml = patchedHtml('answer')
+        if (fullAnswer || answerHtml) {
+          // 只收到 html_patch（format=html）时没有原始文本，用渲染好的 HTML 作为消息内容，保存和复制时不会为空
+          updateMessage(messageId, {
+            content: fullAnswer || answerHtml,
+            type: 'answer',
+          })
+        } else {
           updateMessage(messageId, {
-            content: fullThinking,
+            content: fullThinking || patchedHtml('thinking'),
             type: 'thinking',
             html: `<div class="thinking-summary">🍃 思考结束 (无回答)</div>`,
           })
         }
       },
       (error) => {
-        updateMessage(messageId, {
-          content:
-            (fullAnswer || '') + `<br><span style="color:red">[网络错误: ${error.message}]</span>`,
-          type: 'answer',
-        })
+        showError(`<br><span style="color:red">[网络错误: ${error.message}]</span>`)
       },
     )
   }
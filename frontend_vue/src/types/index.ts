@@ -4,6 +4,8 @@ export interface Message {
   id?: string
   content: string
   thinking_content?: string
+  thinking_html?: string // 服务端增量渲染的思考过程 HTML
+  answer_html?: string // 服务端增量渲染的回答 HTML
   role: 'user' | 'ai'
   timestamp: Date
   type?: 'text' | 'chart' | 'table' | 'thinking' | 'answer'
@@ -26,6 +28,9 @@ export interface ApiResponse {
   text?: string
   html?: string
   data?: any[]
+  // rows_format=columns 时返回列名 + 行数组
+  columns?: string[]
+  rows?: any[][]
   chart_type?: string
   chart_config?: any
   sql?: string
@@ -33,8 +38,12 @@ export interface ApiResponse {
 }
 
 export interface StreamData {
-  type: 'thinking' | 'answer' | 'error'
-  content: string
+  type: 'thinking' | 'answer' | 'error' | 'html_patch'
+  content?: string
+  // html_patch：commit 为新完成块的 HTML（追加保存），tail 为未完成尾部的 HTML（整体替换）
+  target?: 'thinking' | 'answer'
+  commit?: string
+  tail?: string
 }
 
 export interface ChartOption {
@@ -58,7 +58,19 @@ echo.
 echo 🚀 启动后端API服务 (端口 8000)...
 start "AI学生管理系统 - 后端API" cmd /k "chcp 65001 > nul && echo [后端API] 正在启动... && cd /d "%BASE_DIR%" && python main.py"
 
-timeout /t 6 /nobreak > nul
+REM 轮询就绪检查，后端预热完成后立即启动前端（最多等待 30 秒）
+set WAITED=0
+:wait_backend
+curl -s -f -o nul http://127.0.0.1:8000/api/ready >nul 2>&1 && goto backend_ready
+set /a WAITED+=1
+if %WAITED% geq 30 (
+    echo ⚠️ 后端 30 秒内未就绪，继续启动前端...
+    goto backend_ready
+)
+timeout /t 1 /nobreak > nul
+goto wait_backend
+:backend_ready
+echo ✅ 后端已就绪
 
 echo 🚀 启动前端API服务 (端口 8080)...
 start "AI学生管理系统 - 前端API" cmd /k "chcp 65001 > nul && echo [前端API] 正在启动... && cd /d "%BASE_DIR%" && python frontend_server.py"